@@ -1,8 +1,20 @@
 """
 LUMINA_SORT Admin Configuration
 """
-from django.contrib import admin
-from .models import AestheticRecipe, ArtPiece
+from django.contrib import admin, messages
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+
+from .models import AestheticRecipe, ArtPiece, RenderJob
+from .services.rerender import cancel_job, is_stalled, resume_job, start_job
+
+
+def _started(modeladmin, request, job):
+    url = reverse('admin:editor_renderjob_change', args=[job.pk])
+    modeladmin.message_user(request, format_html(
+        'Re-rendering {} art piece(s) in <a href="{}">render job #{}</a>.', job.total, url, job.pk
+    ), messages.SUCCESS)
 
 
 @admin.register(AestheticRecipe)
@@ -11,19 +23,27 @@ class AestheticRecipeAdmin(admin.ModelAdmin):
     list_filter = ['sort_direction', 'sort_by', 'is_public']
     search_fields = ['name', 'description']
     readonly_fields = ['times_used', 'created_at', 'updated_at']
+    actions = ['rerender_art']
     
     fieldsets = (
         ('Basic Info', {
             'fields': ('name', 'description', 'creator', 'is_public')
         }),
         ('Sorting Parameters', {
-            'fields': ('threshold_low', 'threshold_high', 'sort_direction', 'sort_by', 'reverse_sort')
+            'fields': ('threshold_low', 'threshold_high', 'sort_direction', 'sort_by', 'then_by', 'reverse_sort',
+                       'interval_mode', 'edge_threshold')
         }),
         ('Statistics', {
             'fields': ('times_used', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
+    
+    @admin.action(description='Re-render all art made with the selected recipes')
+    def rerender_art(self, request, queryset):
+        names = ', '.join(recipe.name for recipe in queryset[:3]) + (', …' if queryset.count() > 3 else '')
+        job = start_job(ArtPiece.objects.filter(recipe_used__in=queryset), request.user, f'Recipes: {names}')
+        _started(self, request, job)
 
 
 @admin.register(ArtPiece)
@@ -33,3 +53,71 @@ class ArtPieceAdmin(admin.ModelAdmin):
     search_fields = ['title', 'user__username']
     readonly_fields = ['created_at']
     raw_id_fields = ['user', 'recipe_used']
+    actions = ['rerender']
+    
+    @admin.action(description='Re-render the selected art pieces')
+    def rerender(self, request, queryset):
+        job = start_job(queryset, request.user, f'{queryset.count()} selected art piece(s)')
+        _started(self, request, job)
+
+
+@admin.register(RenderJob)
+class RenderJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'description', 'state', 'progress', 'failed', 'throughput', 'created_by', 'created_at']
+    list_filter = ['status']
+    readonly_fields = [
+        'description', 'created_by', 'state', 'progress', 'throughput', 'rendered', 'failed',
+        'megapixels', 'render_seconds', 'created_at', 'started_at', 'finished_at', 'updated_at',
+        'failures'
+    ]
+    fields = readonly_fields
+    actions = ['resume', 'cancel']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    @admin.display(description='Status')
+    def state(self, job):
+        if is_stalled(job):
+            return 'Interrupted (resume it)'
+        return job.get_status_display()
+    
+    @admin.display(description='Progress')
+    def progress(self, job):
+        finished = job.rendered + job.failed
+        percent = 100 * finished / job.total if job.total else 100
+        return f'{finished} / {job.total} ({percent:.0f}%)'
+    
+    @admin.display(description='Throughput')
+    def throughput(self, job):
+        if not job.started_at or not job.rendered:
+            return '—'
+        elapsed = ((job.finished_at or job.updated_at or timezone.now()) - job.started_at).total_seconds()
+        if elapsed <= 0:
+            return '—'
+        return f'{job.rendered * 60 / elapsed:.1f} renders/min, {job.megapixels / elapsed:.2f} MP/s'
+    
+    @admin.display(description='Failures')
+    def failures(self, job):
+        failed = job.items.filter(status='failed').select_related('art_piece')[:50]
+        if not failed:
+            return '—'
+        return format_html('<ul>{}</ul>', format_html_join(
+            '', '<li><a href="{}">{}</a>: {}</li>',
+            ((reverse('admin:editor_artpiece_change', args=[item.art_piece_id]), item.art_piece, item.error)
+             for item in failed)
+        ))
+    
+    @admin.action(description='Resume the selected jobs')
+    def resume(self, request, queryset):
+        resumed = sum(resume_job(job) for job in queryset)
+        self.message_user(request, f'Resumed {resumed} job(s).', messages.SUCCESS)
+    
+    @admin.action(description='Cancel the selected jobs')
+    def cancel(self, request, queryset):
+        for job in queryset:
+            cancel_job(job)
+        self.message_user(request, f'Cancelled {queryset.count()} job(s).', messages.SUCCESS)
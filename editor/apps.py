@@ -1,7 +1,16 @@
+from importlib import import_module
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class EditorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'editor'
     verbose_name = 'LUMINA_SORT Editor'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
+        # Sort key plugins register themselves on import
+        for module in getattr(settings, 'LUMINA_SORT_KEY_PLUGINS', []):
+            import_module(module)
@@ -1,15 +1,68 @@
 """
 LUMINA_SORT Engine - Component exports
+
+Exports are imported from their submodule on first access, so importing
+the package does not load NumPy, Pillow or a JIT backend until something
+needs them.
 """
-from .sorter import PixelSorter
-from .color_utils import calculate_luminosity, calculate_hue, calculate_saturation
-from .export import crop_for_instagram, process_image
-
-__all__ = [
-    'PixelSorter',
-    'calculate_luminosity',
-    'calculate_hue', 
-    'calculate_saturation',
-    'crop_for_instagram',
-    'process_image',
-]
+from importlib import import_module
+
+_EXPORTS = {
+    'PixelSorter': 'sorter',
+    'calculate_luminosity': 'color_utils',
+    'calculate_hue': 'color_utils',
+    'calculate_saturation': 'color_utils',
+    'crop_for_instagram': 'export',
+    'process_image': 'export',
+    'save_processed': 'export',
+    'is_high_bit': 'highbit',
+    'read_high_bit': 'highbit',
+    'save_high_bit': 'highbit',
+    'build_sweep': 'animation',
+    'render_animation': 'animation',
+    'frame_workers': 'animation',
+    'estimate_animation_peak': 'animation',
+    'ANIMATION_FORMATS': 'animation',
+    'render_file': 'batch',
+    'build_region': 'regions',
+    'bounding_box': 'regions',
+    'luminosity_profile': 'histogram',
+    'estimate_selection': 'histogram',
+    'CostModel': 'costmodel',
+    'Prediction': 'costmodel',
+    'region_share': 'costmodel',
+    'calibrate': 'costmodel',
+    'Band': 'progressive',
+    'sort_progressive': 'progressive',
+    'preview_size': 'progressive',
+    'RenderPlan': 'planner',
+    'plan_render': 'planner',
+    'estimate_peak': 'planner',
+    'render_planned': 'planner',
+    'PeakMeter': 'planner',
+    'SORT_KEYS': 'keys',
+    'SortKey': 'keys',
+    'register_key': 'keys',
+    'sort_key_choices': 'keys',
+    'table_keys': 'keys',
+    'warm_tables': 'keys',
+    'EXPORT_PRESETS': 'presets',
+    'register_preset': 'presets',
+    'render_preset': 'presets',
+    'encode_presets': 'presets',
+    'write_bundle': 'presets',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,328 @@
+"""
+Animated exports - threshold and direction sweeps ("melt" loops).
+
+The source image is decoded as compact pixels and its key planes computed
+once; every frame is a fresh sort of the original using those shared
+planes. With a backend that releases the GIL, a few frames are sorted
+side by side on a small thread pool; frames are handed to the output
+container in order and written one at a time, so at most `workers`
+frames are held in memory.
+"""
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import BinaryIO, Iterable, Iterator
+
+import numpy as np
+from PIL import Image
+
+from .backends import get_backend
+from .planner import IMAGE_BYTES_PER_PIXEL, MASK_BYTES, PIXEL_BYTES, estimate_peak
+from .sorter import PixelSorter
+
+
+ANIMATION_FORMATS = {
+    'webp': ('image/webp', 'webp'),
+    'apng': ('image/apng', 'png'),
+    'gif': ('image/gif', 'gif'),
+}
+
+SWEEP_CHOICES = ('threshold_low', 'threshold_high', 'window')
+
+
+def build_sweep(
+    base_params: dict,
+    sweep: str = 'threshold_high',
+    start: float = 0.0,
+    end: float = 1.0,
+    frames: int = 24,
+    alternate_direction: bool = False
+) -> list:
+    """
+    Build per-frame processing parameters for a sweep.
+
+    Args:
+        base_params: Parameters shared by every frame (see process_image)
+        sweep: 'threshold_low', 'threshold_high', or 'window' to slide
+            both thresholds together keeping their distance
+        start: Swept value on the first frame (0-1)
+        end: Swept value on the last frame (0-1)
+        frames: Number of frames
+        alternate_direction: Flip the sort direction on every frame
+    Returns:
+        List of parameter dicts, one per frame
+    """
+    if sweep not in SWEEP_CHOICES:
+        raise ValueError(f"Unknown sweep '{sweep}'")
+
+    width = base_params['threshold_high'] - base_params['threshold_low']
+    direction = base_params['sort_direction']
+    flipped = 'H' if direction == 'V' else 'V'
+
+    params = []
+    for i, value in enumerate(np.linspace(start, end, max(frames, 1))):
+        frame = dict(base_params)
+        value = float(value)
+        if sweep == 'window':
+            frame['threshold_low'] = value
+            frame['threshold_high'] = min(value + width, 1.0)
+        else:
+            frame[sweep] = value
+        if alternate_direction and i % 2:
+            frame['sort_direction'] = flipped
+        params.append(frame)
+    return params
+
+
+def frame_workers(workers: int, backend: str = None) -> int:
+    """Frames to sort at once: threads only run side by side on a backend that releases the GIL."""
+    return max(workers, 1) if get_backend(backend).releases_gil else 1
+
+
+def estimate_animation_peak(size: tuple, frame_params: list, bit_depth: int = 8,
+                            workers: int = 1) -> int:
+    """
+    Estimate the peak memory of render_animation().
+    
+    Args:
+        size: Image (width, height)
+        frame_params: List of sort() keyword dicts, one per frame
+        bit_depth: 8 or 16
+        workers: Frames sorted at once (see frame_workers)
+    Returns:
+        Estimated peak bytes
+    """
+    width, height = size
+    # The compact render of the costliest frame, plus the sorted copy, mask
+    # and 8-bit image of every frame in flight
+    frame_bytes = PIXEL_BYTES[bit_depth] / 2 + MASK_BYTES + IMAGE_BYTES_PER_PIXEL / 2
+    base = max(estimate_peak('compact', size, params, bit_depth) for params in frame_params)
+    return round(base + max(workers, 1) * width * height * frame_bytes)
+
+
+def _share_planes(sorter: PixelSorter, frame_params: list) -> None:
+    """Compute every plane and region mask the frames use, so threads only read them."""
+    sorter.key_plane('L')
+    for params in frame_params:
+        sorter.key_plane(params.get('sort_by', 'L'))
+        if params.get('interval_mode') == 'edges':
+            sorter.gradient_plane()
+        if params.get('region') is not None:
+            sorter.region_mask(params['region'])
+
+
+def render_frames(sorter: PixelSorter, frame_params: list, workers: int = 1) -> Iterator[Image.Image]:
+    """
+    Render frames in order, up to `workers` at a time.
+    
+    Frames are rendered where the caller runs (a render pool thread, on
+    the user's scheduler budget) plus a small thread pool of its own, so
+    an animation never forks the serving process. Key planes are computed
+    once before any thread starts and shared read-only by every frame.
+    
+    Args:
+        sorter: PixelSorter holding the decoded source image
+        frame_params: List of sort() keyword dicts, one per frame
+        workers: Frames sorted at once; 1 renders in the calling thread
+    Yields:
+        RGB PIL Images, one per frame
+    """
+    def render(params):
+        return sorter.to_image(sorter.sort(**params))
+    
+    if workers <= 1 or len(frame_params) < 2:
+        for params in frame_params:
+            yield render(params)
+        return
+    
+    _share_planes(sorter, frame_params)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        try:
+            for params in frame_params:
+                if len(pending) == workers:
+                    yield pending.popleft().result()
+                pending.append(pool.submit(render, params))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def render_animation(
+    image: Image.Image,
+    frame_params: list,
+    fp: BinaryIO,
+    format_type: str = 'webp',
+    duration: int = 80,
+    loop: int = 0,
+    workers: int = 1,
+    backend: str = None
+) -> int:
+    """
+    Render a sweep and encode it as an animated image.
+
+    Args:
+        image: Source PIL Image
+        frame_params: List of sort() keyword dicts, one per frame
+        fp: Binary file object receiving the encoded animation
+            (must be seekable for WebP)
+        format_type: 'webp', 'apng', or 'gif'
+        duration: Frame duration in milliseconds
+        loop: Loop count, 0 loops forever
+        workers: Frames sorted at once (see frame_workers)
+        backend: Engine backend name
+    Returns:
+        Number of frames written
+    """
+    if format_type not in ANIMATION_FORMATS:
+        raise ValueError(f"Unknown animation format '{format_type}'")
+
+    sorter = PixelSorter(image, backend=backend, compact=True)
+    frames = render_frames(sorter, frame_params, frame_workers(workers, backend))
+    writer = {
+        'webp': _write_webp,
+        'apng': _write_apng,
+        'gif': _write_gif,
+    }[format_type]
+    return writer(frames, fp, len(frame_params), duration, loop)
+
+
+# --------------------------------------------------------------------
+# Streaming container writers. Pillow compresses each frame on its own;
+# these functions only mux the compressed frames into the container, so
+# a frame can be released as soon as it has been written.
+
+def _png_chunk(fp: BinaryIO, tag: bytes, data: bytes) -> None:
+    fp.write(struct.pack('>I', len(data)) + tag + data)
+    fp.write(struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+
+def _iter_png_chunks(data: bytes) -> Iterator:
+    pos = 8
+    while pos < len(data):
+        length, = struct.unpack('>I', data[pos:pos + 4])
+        yield data[pos + 4:pos + 8], data[pos + 8:pos + 8 + length]
+        pos += length + 12
+
+
+def _write_apng(frames: Iterator, fp: BinaryIO, count: int, duration: int, loop: int) -> int:
+    fp.write(b'\x89PNG\r\n\x1a\n')
+    sequence = 0
+    written = 0
+
+    for frame in frames:
+        buffer = BytesIO()
+        frame.save(buffer, format='PNG', compress_level=6)
+        chunks = list(_iter_png_chunks(buffer.getvalue()))
+        width, height = frame.size
+
+        if written == 0:
+            _png_chunk(fp, b'IHDR', dict(chunks)[b'IHDR'])
+            _png_chunk(fp, b'acTL', struct.pack('>II', count, loop))
+
+        _png_chunk(fp, b'fcTL', struct.pack(
+            '>IIIIIHHBB', sequence, width, height, 0, 0, duration, 1000, 0, 0
+        ))
+        sequence += 1
+
+        for tag, data in chunks:
+            if tag != b'IDAT':
+                continue
+            if written == 0:
+                _png_chunk(fp, b'IDAT', data)
+            else:
+                _png_chunk(fp, b'fdAT', struct.pack('>I', sequence) + data)
+                sequence += 1
+        written += 1
+
+    _png_chunk(fp, b'IEND', b'')
+    return written
+
+
+def _skip_gif_sub_blocks(data: bytes, pos: int) -> int:
+    while data[pos]:
+        pos += data[pos] + 1
+    return pos + 1
+
+
+def _write_gif(frames: Iterator, fp: BinaryIO, count: int, duration: int, loop: int) -> int:
+    written = 0
+
+    for frame in frames:
+        buffer = BytesIO()
+        frame.quantize(colors=256, method=Image.Quantize.MEDIANCUT).save(buffer, format='GIF')
+        data = buffer.getvalue()
+
+        # Single-frame GIF: header, screen descriptor, global color table
+        packed = data[10]
+        table_end = 13 + (3 << ((packed & 0x07) + 1) if packed & 0x80 else 0)
+        color_table = data[13:table_end]
+
+        if written == 0:
+            width, height = frame.size
+            fp.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0x70, 0, 0))
+            fp.write(b'!\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', loop) + b'\x00')
+
+        # Graphic control extension carrying the frame delay
+        fp.write(b'!\xf9\x04\x00' + struct.pack('<H', duration // 10) + b'\x00\x00')
+
+        pos = table_end
+        while data[pos] != 0x3b:
+            if data[pos] == 0x21:
+                pos = _skip_gif_sub_blocks(data, pos + 2)
+                continue
+            # Image descriptor: promote the global table to a local one
+            flags = data[pos + 9] | 0x80 | (packed & 0x07)
+            fp.write(data[pos:pos + 9] + bytes([flags]) + color_table)
+            end = _skip_gif_sub_blocks(data, pos + 11)
+            fp.write(data[pos + 10:end])
+            pos = end
+        written += 1
+
+    fp.write(b';')
+    return written
+
+
+def _riff_chunk(tag: bytes, data: bytes) -> bytes:
+    padding = b'\x00' if len(data) % 2 else b''
+    return tag + struct.pack('<I', len(data)) + data + padding
+
+
+def _write_webp(frames: Iterator, fp: BinaryIO, count: int, duration: int, loop: int) -> int:
+    start = fp.tell()
+    written = 0
+
+    for frame in frames:
+        buffer = BytesIO()
+        frame.save(buffer, format='WEBP', quality=90, method=4)
+        data = buffer.getvalue()
+        width, height = frame.size
+
+        if written == 0:
+            fp.write(b'RIFF\x00\x00\x00\x00WEBP')
+            canvas = struct.pack('<I', width - 1)[:3] + struct.pack('<I', height - 1)[:3]
+            fp.write(_riff_chunk(b'VP8X', bytes([0x02, 0, 0, 0]) + canvas))
+            fp.write(_riff_chunk(b'ANIM', struct.pack('<IH', 0, loop)))
+
+        # Keep the frame bitstream chunks (VP8/VP8L/ALPH), drop the header
+        payload = data[12:]
+        if payload[:4] == b'VP8X':
+            payload = payload[8 + struct.unpack('<I', payload[4:8])[0]:]
+
+        header = (
+            struct.pack('<I', 0)[:3] + struct.pack('<I', 0)[:3]
+            + struct.pack('<I', width - 1)[:3] + struct.pack('<I', height - 1)[:3]
+            + struct.pack('<I', duration)[:3] + b'\x00'
+        )
+        fp.write(_riff_chunk(b'ANMF', header + payload))
+        written += 1
+
+    end = fp.tell()
+    fp.seek(start + 4)
+    fp.write(struct.pack('<I', end - start - 8))
+    fp.seek(end)
+    return written
@@ -0,0 +1,30 @@
+"""
+Engine backend interface.
+"""
+import numpy as np
+
+
+class EngineBackend:
+    """
+    Kernels that detect masked runs along lines and sort them in place.
+    
+    Every backend must produce exactly the output of the NumPy reference
+    backend: runs are sorted with a stable sort, and reversed runs are the
+    stable ascending order read backwards.
+    """
+    name = 'base'
+    # Whether sort_lines() releases the GIL, so threads sort side by side
+    releases_gil = False
+    
+    def sort_lines(self, lines: np.ndarray, mask: np.ndarray, keys: np.ndarray,
+                   reverse: bool = False) -> None:
+        """
+        Sort every run of True mask values in every line, in place.
+        
+        Args:
+            lines: Pixels of shape (N, L, C); may be a strided view
+            mask: Boolean array of shape (N, L)
+            keys: Sort key values of shape (N, L)
+            reverse: Descending order if True
+        """
+        raise NotImplementedError
@@ -0,0 +1,23 @@
+"""
+NumPy reference backend.
+"""
+import numpy as np
+
+from ..color_utils import find_intervals
+from .base import EngineBackend
+
+
+class NumpyBackend(EngineBackend):
+    """Reference implementation: vectorized run detection, argsort per run."""
+    name = 'numpy'
+    
+    def sort_lines(self, lines, mask, keys, reverse=False):
+        # Lines without any run of two or more pixels are skipped outright
+        busy = np.flatnonzero((mask[:, 1:] & mask[:, :-1]).any(axis=1))
+        for i in busy:
+            for start, end in find_intervals(mask[i]):
+                if end - start > 1:
+                    indices = np.argsort(keys[i, start:end], kind='stable')
+                    if reverse:
+                        indices = indices[::-1]
+                    lines[i, start:end] = lines[i, start:end][indices]
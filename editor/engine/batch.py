@@ -0,0 +1,36 @@
+"""
+File-to-file rendering for offline batch jobs.
+Kept free of Django so it can run in any worker process.
+"""
+import os
+import time
+
+from PIL import Image
+
+from .export import save_processed
+
+
+def render_file(source: str, destination: str, params: dict) -> tuple:
+    """
+    Render one image file into another.
+    
+    The result is written to '<destination>.part' and renamed into place,
+    so an interrupted job never leaves a file that looks finished. 16-bit
+    sources stay 16-bit; '.tif'/'.tiff' destinations are written as TIFF.
+    
+    Args:
+        source: Path of the image to sort
+        destination: Path of the PNG (or TIFF) to write
+        params: process_image() keyword arguments
+    Returns:
+        (megapixels, seconds) for the render
+    """
+    started = time.perf_counter()
+    tiff = destination.lower().endswith(('.tif', '.tiff'))
+    os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+    partial = destination + '.part'
+    with Image.open(source) as img:
+        megapixels = img.width * img.height / 1e6
+        save_processed(img, partial, format='TIFF' if tiff else 'PNG', **params)
+    os.replace(partial, destination)
+    return megapixels, time.perf_counter() - started
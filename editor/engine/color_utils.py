@@ -70,25 +70,83 @@ def calculate_saturation(pixels: np.ndarray) -> np.ndarray:
     return saturation
 
 
-def get_sort_key(pixels: np.ndarray, sort_by: str) -> np.ndarray:
+def sort_criteria(sort_by: str) -> tuple:
+    """Split a sort spec into its distinct criteria, most significant first."""
+    return tuple(dict.fromkeys(sort_by)) or ('L',)
+
+
+def pack_keys(keys: list) -> np.ndarray:
     """
-    Get values to sort by based on criterion.
+    Pack several sort keys into one unsigned integer key per pixel.
+    
+    Each key is quantized to an equal share of the bits, the first key in
+    the most significant ones, so one sort of the packed key orders by the
+    first key and breaks ties with the following ones.
+    
+    Args:
+        keys: Arrays of the same shape with values in [0, 1], or uint16
+              keys (see engine/keys.py) with values in [0, 65535]
+    Returns:
+        uint32 array for up to two keys, uint64 otherwise
+    """
+    bits = min(16, 64 // len(keys))
+    dtype = np.uint32 if bits * len(keys) <= 32 else np.uint64
+    levels = (1 << bits) - 1
+    
+    packed = np.zeros(keys[0].shape, dtype=dtype)
+    for key in keys:
+        packed <<= dtype(bits)
+        if key.dtype == np.uint16:
+            packed |= (key.astype(dtype) * dtype(levels) + dtype(32767)) // dtype(65535)
+        else:
+            packed |= np.rint(np.clip(key, 0.0, 1.0) * levels).astype(dtype)
+    return packed
+
+
+def gradient_magnitude(luminosity: np.ndarray) -> np.ndarray:
+    """
+    Sobel gradient magnitude of a luminosity plane.
+    
+    Each 3x3 Sobel kernel is a [1, 2, 1] smoothing along one axis times a
+    [-1, 0, 1] difference along the other, so both gradients are built
+    from shifted slices of one edge-padded float32 copy of the plane.
     
     Args:
-        pixels: Array of shape (N, 3) with RGB values
-        sort_by: 'L', 'H', 'S', 'R', 'G', or 'B'
+        luminosity: (H, W) values in [0, 1]
     Returns:
-        1D array of sort key values
+        uint8 (H, W) magnitudes; 255 is a full black-to-white step
     """
-    sort_map = {
-        'L': lambda p: calculate_luminosity(p),
-        'H': lambda p: calculate_hue(p),
-        'S': lambda p: calculate_saturation(p),
-        'R': lambda p: p[:, 0],
-        'G': lambda p: p[:, 1],
-        'B': lambda p: p[:, 2],
-    }
-    return sort_map.get(sort_by, sort_map['L'])(pixels)
+    padded = np.pad(luminosity.astype(np.float32), 1, mode='edge')
+    
+    # Smooth down the columns, then difference along the rows: d/dx
+    smoothed = padded[:-2] + padded[2:]
+    smoothed += 2 * padded[1:-1]
+    gradient_x = smoothed[:, 2:] - smoothed[:, :-2]
+    
+    # Smooth along the rows, then difference down the columns: d/dy
+    smoothed = padded[:, :-2] + padded[:, 2:]
+    smoothed += 2 * padded[:, 1:-1]
+    gradient_y = smoothed[2:] - smoothed[:-2]
+    del smoothed, padded
+    
+    magnitude = np.hypot(gradient_x, gradient_y, out=gradient_x)
+    magnitude *= 255 / 4
+    magnitude += 0.5
+    np.minimum(magnitude, 255, out=magnitude)
+    return magnitude.astype(np.uint8)
+
+
+def create_edge_mask(gradient: np.ndarray, edge_threshold: float) -> np.ndarray:
+    """
+    Mask of the pixels between edges.
+    
+    Args:
+        gradient: uint8 magnitudes from gradient_magnitude()
+        edge_threshold: Magnitude (0-1) from which a pixel is an edge
+    Returns:
+        Boolean mask; edge pixels are False, so they break intervals
+    """
+    return gradient < round(edge_threshold * 255)
 
 
 def create_mask(line: np.ndarray, threshold_low: float, threshold_high: float) -> np.ndarray:
@@ -114,19 +172,6 @@ def find_intervals(mask: np.ndarray) -> list:
     Returns:
         List of (start, end) tuples
     """
-    intervals = []
-    in_interval = False
-    start = 0
-    
-    for i, val in enumerate(mask):
-        if val and not in_interval:
-            start = i
-            in_interval = True
-        elif not val and in_interval:
-            intervals.append((start, i))
-            in_interval = False
-    
-    if in_interval:
-        intervals.append((start, len(mask)))
-    
-    return intervals
+    padded = np.concatenate(([False], np.asarray(mask, dtype=bool), [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[0::2].tolist(), edges[1::2].tolist()))
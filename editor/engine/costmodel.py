@@ -0,0 +1,347 @@
+"""
+Render cost model - predicted seconds and peak memory of a render.
+Predictions are linear in a few features of a render (image size, key
+planes, selected pixels, sort work, intervals). The coefficients are
+fitted per engine backend from timed renders on the machine that
+serves renders; see the calibrate_engine command.
+"""
+import math
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from io import BytesIO
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image
+
+from .backends import get_backend
+from .color_utils import calculate_luminosity, create_mask, sort_criteria
+from .keys import table_keys
+from .histogram import estimate_selection
+from .planner import IMAGE_BYTES_PER_PIXEL, render_planned
+from .regions import build_region
+
+
+TIME_FEATURES = (
+    'megapixels',       # decode copies, luminosity plane, PNG encode
+    'color_planes',     # megapixels times full-table (hue, saturation, ...) key planes
+    'channel_planes',   # megapixels times separable R/G/B key planes
+    'composite',        # megapixels if keys are packed
+    'selected',         # selected megapixels: gather and scatter
+    'sorting',          # selected megapixels times log2 of the mean interval length
+    'intervals',        # millions of intervals
+)
+MEMORY_FEATURES = (
+    'pixels',           # float pixel arrays, masks and images
+    'planes',           # pixels times key planes (8 bytes each)
+    'selected',         # selected pixels: gathered runs
+)
+
+# Reference coefficients, fitted on one core with the NumPy backend
+DEFAULT_TIME = {
+    'megapixels': 0.212,
+    'color_planes': 0.066,
+    'channel_planes': 0.032,
+    'composite': 0.0,
+    'selected': 0.255,
+    'sorting': 0.0,
+    'intervals': 2.06,
+}
+DEFAULT_MEMORY = {
+    'pixels': 106.0,
+    'planes': 6.0,
+    'selected': 0.0,
+}
+# Models are fitted on 8-bit renders; 16-bit files move twice the bytes
+# through decode, pixel copies and PNG encode
+HIGH_BIT_IO_FACTOR = 2.0
+
+
+class Prediction(NamedTuple):
+    seconds: float
+    peak_bytes: int
+    megapixels: float
+    coverage: float
+    intervals: int
+
+
+def time_features(pixels: int, selected: int, intervals: int, sort_by: str,
+                  bit_depth: int = 8) -> dict:
+    """Features of a render for the time model (see TIME_FEATURES)."""
+    megapixels = pixels / 1e6
+    keys = sort_criteria(sort_by)
+    mean_run = selected / intervals if intervals else 1.0
+    return {
+        'megapixels': megapixels * (HIGH_BIT_IO_FACTOR if bit_depth == 16 else 1.0),
+        'color_planes': megapixels * sum(key in table_keys(False) for key in keys),
+        'channel_planes': megapixels * sum(key in table_keys(True).replace('L', '') for key in keys),
+        'composite': megapixels if len(keys) > 1 else 0.0,
+        'selected': selected / 1e6,
+        'sorting': selected / 1e6 * math.log2(1 + mean_run),
+        'intervals': intervals / 1e6,
+    }
+
+
+def memory_features(pixels: int, selected: int, sort_by: str) -> dict:
+    """Features of a render for the memory model (see MEMORY_FEATURES)."""
+    keys = sort_criteria(sort_by)
+    # Luminosity is always computed for the mask; packed keys add one plane
+    planes = len(set(keys) | {'L'}) + (len(keys) > 1)
+    return {'pixels': pixels, 'planes': pixels * planes, 'selected': selected}
+
+
+class CostModel:
+    """
+    Linear time and memory coefficients for one engine backend.
+    """
+    
+    def __init__(self, backend: str, time: dict = None, memory: dict = None,
+                 samples: int = 0, fitted_at: str = None, error: float = None):
+        self.backend = backend
+        self.time = dict(time or DEFAULT_TIME)
+        self.memory = dict(memory or DEFAULT_MEMORY)
+        self.samples = samples
+        self.fitted_at = fitted_at
+        self.error = error
+    
+    @property
+    def fitted(self) -> bool:
+        return self.samples > 0
+    
+    def seconds(self, features: dict) -> float:
+        """Predicted seconds for time features; missing features count as zero."""
+        return max(sum(coef * features.get(name, 0.0) for name, coef in self.time.items()), 0.0)
+    
+    def peak_bytes(self, features: dict) -> int:
+        """Predicted peak bytes for memory features."""
+        return max(round(sum(coef * features.get(name, 0) for name, coef in self.memory.items())), 0)
+    
+    def predict(self, pixels: int, selected: int, intervals: int, sort_by: str = 'L',
+                bit_depth: int = 8) -> Prediction:
+        """
+        Predict a render from its size and selection.
+        
+        Args:
+            pixels: Image width times height
+            selected: Pixels inside the threshold window (and region)
+            intervals: Number of runs sorted
+            sort_by: Sort spec, e.g. 'L' or 'HL'
+            bit_depth: 8, or 16 for 16-bit sources
+        Returns:
+            Prediction
+        """
+        return Prediction(
+            seconds=self.seconds(time_features(pixels, selected, intervals, sort_by, bit_depth)),
+            peak_bytes=self.peak_bytes(memory_features(pixels, selected, sort_by)),
+            megapixels=pixels / 1e6,
+            coverage=selected / pixels if pixels else 0.0,
+            intervals=intervals,
+        )
+    
+    def predict_profile(self, profile: dict, params: dict, region_share: float = 1.0,
+                        bit_depth: int = 8) -> Prediction:
+        """
+        Predict a render from a luminosity profile and process_image() arguments.
+        
+        Args:
+            profile: Dict from luminosity_profile()
+            params: process_image() keyword arguments
+            region_share: Share of the image inside the region, if any
+            bit_depth: 8, or 16 for 16-bit sources
+        Returns:
+            Prediction
+        """
+        # Edge intervals are not in the profile; the whole window is the worst case
+        edges = params.get('interval_mode') == 'edges'
+        selection = estimate_selection(
+            profile,
+            0.0 if edges else params.get('threshold_low', 0.25),
+            1.0 if edges else params.get('threshold_high', 0.80),
+            params.get('sort_direction', 'V'),
+        )
+        return self.predict(
+            profile['width'] * profile['height'],
+            round(selection['pixels'] * region_share),
+            round(selection['intervals'] * region_share),
+            params.get('sort_by', 'L'),
+            bit_depth,
+        )
+    
+    def to_dict(self) -> dict:
+        return {
+            'time': self.time,
+            'memory': self.memory,
+            'samples': self.samples,
+            'fitted_at': self.fitted_at,
+            'error': self.error,
+        }
+    
+    @classmethod
+    def from_dict(cls, backend: str, data: dict) -> 'CostModel':
+        return cls(backend, data.get('time'), data.get('memory'), data.get('samples', 0),
+                   data.get('fitted_at'), data.get('error'))
+    
+    @classmethod
+    def fit(cls, backend: str, samples: list) -> 'CostModel':
+        """
+        Fit non-negative coefficients to measured renders.
+        
+        Args:
+            backend: Engine backend the samples were measured with
+            samples: Dicts from measure_render()
+        Returns:
+            CostModel; 'error' is the mean relative error of its time predictions
+        """
+        seconds = np.array([sample['seconds'] for sample in samples])
+        peak = np.array([sample['peak_bytes'] for sample in samples], dtype=np.float64)
+        times = np.array([
+            [features[name] for name in TIME_FEATURES]
+            for features in (time_features(s['pixels'], s['selected'], s['intervals'], s['sort_by'])
+                             for s in samples)
+        ])
+        memories = np.array([
+            [features[name] for name in MEMORY_FEATURES]
+            for features in (memory_features(s['pixels'], s['selected'], s['sort_by']) for s in samples)
+        ], dtype=np.float64)
+        
+        # Weight by 1/seconds so small renders are fitted as well as large ones
+        scale = 1.0 / np.maximum(seconds, 1e-3)
+        time_coefs = _fit_nonnegative(times * scale[:, None], seconds * scale)
+        memory_coefs = _fit_nonnegative(memories, peak)
+        error = float(np.mean(np.abs(times @ time_coefs - seconds) * scale))
+        
+        return cls(
+            backend,
+            time={name: round(float(coef), 6) for name, coef in zip(TIME_FEATURES, time_coefs)},
+            memory={name: round(float(coef), 3) for name, coef in zip(MEMORY_FEATURES, memory_coefs)},
+            samples=len(samples),
+            fitted_at=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            error=round(error, 4),
+        )
+
+
+def _fit_nonnegative(features: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """Least squares with coefficients >= 0 (drops the most negative feature until none is)."""
+    active = list(range(features.shape[1]))
+    while True:
+        coefs = np.zeros(features.shape[1])
+        if active:
+            coefs[active] = np.linalg.lstsq(features[:, active], target, rcond=None)[0]
+        negative = [i for i in active if coefs[i] < 0]
+        if not negative:
+            return coefs
+        active.remove(min(negative, key=lambda i: coefs[i]))
+
+
+def region_share(region: dict, size: tuple) -> float:
+    """Share of an image of the given size inside a region spec, from a small raster."""
+    if not region:
+        return 1.0
+    width, height = size
+    scale = min(128 / max(width, height, 1), 1.0)
+    raster = (max(round(width * scale), 1), max(round(height * scale), 1))
+    return float(build_region(region, raster).mean())
+
+
+def measure_render(image: Image.Image, params: dict, backend: str = None) -> dict:
+    """
+    Time one render (sort and PNG encode) and trace its peak memory.
+    
+    Timing and memory are measured in separate runs, as tracing slows
+    allocation down. Warm up the backend first (see calibrate).
+    
+    Args:
+        image: RGB source image
+        params: PixelSorter.sort() keyword arguments (without region)
+        backend: Engine backend name
+    Returns:
+        Dict with 'pixels', 'selected', 'intervals', 'sort_by', 'seconds' and 'peak_bytes'
+    """
+    def render():
+        # The strategy renders use without a memory budget (see plan_render)
+        sorter, pixels, _ = render_planned(image, params, backend=backend)
+        sorter.save(pixels, BytesIO(), format='PNG')
+    
+    started = time.perf_counter()
+    render()
+    seconds = time.perf_counter() - started
+    
+    tracemalloc.start()
+    try:
+        render()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    
+    luminosity = calculate_luminosity(np.asarray(image, dtype=np.float64) / 255.0)
+    mask = create_mask(luminosity, params.get('threshold_low', 0.25), params.get('threshold_high', 0.80))
+    lines = mask.T if params.get('sort_direction', 'V') == 'V' else mask
+    intervals = int(lines[:, 0].sum() + (lines[:, 1:] & ~lines[:, :-1]).sum())
+    
+    return {
+        'pixels': image.width * image.height,
+        'selected': int(mask.sum()),
+        'intervals': intervals,
+        'sort_by': params.get('sort_by', 'L'),
+        'seconds': seconds,
+        'peak_bytes': peak + IMAGE_BYTES_PER_PIXEL * image.width * image.height,
+    }
+
+
+def calibration_image(size: tuple, detail: float, seed: int = 0) -> Image.Image:
+    """
+    Synthetic photo-like test image: smooth color fields plus noise.
+    
+    Args:
+        size: (width, height)
+        detail: Noise amplitude (0-1); more detail means more, shorter intervals
+        seed: Random seed
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    fields = Image.fromarray(rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)).resize(
+        size, Image.Resampling.BICUBIC
+    )
+    pixels = np.asarray(fields, dtype=np.float64)
+    pixels += rng.normal(0.0, 128.0 * detail, (height, width, 1))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def calibration_params() -> list:
+    """Threshold windows, directions and sort keys covering the model's features."""
+    windows = ((0.0, 1.0), (0.25, 0.80), (0.40, 0.60), (0.45, 0.50))
+    keys = ('L', 'H', 'S', 'R', 'HL')
+    return [
+        {'threshold_low': low, 'threshold_high': high, 'sort_direction': direction, 'sort_by': sort_by}
+        for low, high in windows
+        for direction in 'VH'
+        for sort_by in keys
+    ]
+
+
+def calibrate(sizes: list, details: list = (0.05, 0.3), backend: str = None, progress=None) -> CostModel:
+    """
+    Measure renders of synthetic images and fit a cost model.
+    
+    Args:
+        sizes: Image sizes, (width, height) tuples
+        details: Noise amplitudes of the test images (see calibration_image)
+        backend: Engine backend name (defaults to the configured one)
+        progress: Optional callable receiving each sample
+    Returns:
+        Fitted CostModel
+    """
+    backend = get_backend(backend).name
+    # The first render pays for imports and any JIT compilation
+    measure_render(calibration_image((64, 64), 0.1), calibration_params()[0], backend)
+    samples = []
+    for size in sizes:
+        for seed, detail in enumerate(details):
+            image = calibration_image(size, detail, seed)
+            for params in calibration_params():
+                sample = measure_render(image, params, backend)
+                samples.append(sample)
+                if progress:
+                    progress(sample)
+    return CostModel.fit(backend, samples)
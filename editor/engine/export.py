@@ -2,7 +2,8 @@
 Export utilities for social media formats.
 """
 from PIL import Image
-from .sorter import PixelSorter
+from .planner import render_planned
+from .presets import render_preset
 
 
 def crop_for_instagram(image: Image.Image, aspect_ratio: str) -> Image.Image:
@@ -15,27 +16,7 @@ def crop_for_instagram(image: Image.Image, aspect_ratio: str) -> Image.Image:
     Returns:
         Cropped and resized PIL Image
     """
-    width, height = image.size
-    
-    if aspect_ratio == 'story':
-        target_ratio = 9 / 16
-        target_size = (1080, 1920)
-    else:
-        target_ratio = 4 / 5
-        target_size = (1080, 1350)
-    
-    current_ratio = width / height
-    
-    if current_ratio > target_ratio:
-        new_width = int(height * target_ratio)
-        left = (width - new_width) // 2
-        image = image.crop((left, 0, left + new_width, height))
-    elif current_ratio < target_ratio:
-        new_height = int(width / target_ratio)
-        top = (height - new_height) // 2
-        image = image.crop((0, top, width, top + new_height))
-    
-    return image.resize(target_size, Image.Resampling.LANCZOS)
+    return render_preset(image, 'story' if aspect_ratio == 'story' else 'post')
 
 
 def process_image(
@@ -44,7 +25,11 @@ def process_image(
     threshold_high: float = 0.80,
     sort_direction: str = 'V',
     sort_by: str = 'L',
-    reverse_sort: bool = False
+    reverse_sort: bool = False,
+    region: dict = None,
+    interval_mode: str = 'threshold',
+    edge_threshold: float = 0.25,
+    budget: int = None
 ) -> Image.Image:
     """
     Main processing function - applies pixel sorting.
@@ -54,17 +39,46 @@ def process_image(
         threshold_low: Lower brightness threshold (0-1)
         threshold_high: Upper brightness threshold (0-1)
         sort_direction: 'H' or 'V'
-        sort_by: Sorting criterion
+        sort_by: Sorting criterion, or several for a composite sort ('HL')
         reverse_sort: Descending order
+        region: Optional region spec limiting the sort (see build_region)
+        interval_mode: 'threshold' or 'edges' (runs between Sobel edges)
+        edge_threshold: Gradient magnitude (0-1) that breaks an interval
+        budget: Optional memory budget in bytes; the fastest strategy
+                that fits it is used (see plan_render)
     Returns:
         Processed PIL Image
     """
-    sorter = PixelSorter(image)
-    sorted_array = sorter.sort(
-        threshold_low=threshold_low,
-        threshold_high=threshold_high,
-        sort_direction=sort_direction,
-        sort_by=sort_by,
-        reverse_sort=reverse_sort
-    )
+    sorter, sorted_array, _ = render_planned(image, {
+        'threshold_low': threshold_low,
+        'threshold_high': threshold_high,
+        'sort_direction': sort_direction,
+        'sort_by': sort_by,
+        'reverse_sort': reverse_sort,
+        'region': region,
+        'interval_mode': interval_mode,
+        'edge_threshold': edge_threshold,
+    }, budget)
     return sorter.to_image(sorted_array)
+
+
+def save_processed(image: Image.Image, fp, format: str = 'PNG', budget: int = None,
+                   **params) -> int:
+    """
+    Sort an image and encode the result, keeping 16-bit precision.
+    
+    Unlike process_image(), which returns an 8-bit PIL Image, 16-bit
+    sources are written as 16-bit PNG or TIFF.
+    
+    Args:
+        image: PIL Image to process; 16-bit files must not be loaded yet
+        fp: Binary file object or path
+        format: Output format
+        budget: Optional memory budget in bytes (see plan_render)
+        **params: process_image() keyword arguments
+    Returns:
+        Bits per channel written (8 or 16)
+    """
+    sorter, sorted_array, _ = render_planned(image, params, budget)
+    sorter.save(sorted_array, fp, format=format)
+    return sorter.bit_depth
@@ -0,0 +1,191 @@
+"""
+High bit depth images - 16-bit RGB pixels without float64 arrays.
+PIL only holds 8 bits per channel for RGB, so 16-bit PNG and TIFF files
+are decoded twice with PIL's own decoders: once unpacking the high byte
+of every sample and once the low byte. The result is a (H, W, 3) uint16
+array; sorted arrays are written back as 16-bit PNG or TIFF.
+"""
+import struct
+import zlib
+from typing import BinaryIO
+
+import numpy as np
+from PIL import Image
+
+
+# Raw mode suffixes of 16-bit samples (big-endian, little-endian, native)
+# and the suffix that unpacks the other byte of each sample
+_NATIVE_SWAPPED = ';16B' if struct.pack('=H', 1) == b'\x01\x00' else ';16L'
+_SWAPPED = {';16B': ';16L', ';16L': ';16B', ';16N': _NATIVE_SWAPPED}
+HIGH_BIT_MODES = {'I;16', 'I;16B', 'I;16L', 'I;16N', 'I'}
+STRIP_ROWS = 64
+
+
+def _rawmode(tile) -> str:
+    return tile.args if isinstance(tile.args, str) else tile.args[0]
+
+
+def _with_rawmode(tile, rawmode: str):
+    args = rawmode if isinstance(tile.args, str) else (rawmode,) + tuple(tile.args[1:])
+    return tile._replace(args=args)
+
+
+def is_high_bit(image: Image.Image) -> bool:
+    """
+    Whether an opened (not yet loaded) image has 16 bits per sample.
+    
+    Returns:
+        True for 16-bit grayscale, and for RGB/RGBA files PIL would
+        reduce to 8 bits
+    """
+    if image.mode in HIGH_BIT_MODES:
+        return True
+    tiles = getattr(image, 'tile', None)
+    return bool(tiles) and image.mode in ('RGB', 'RGBA') and all(
+        _rawmode(tile)[-4:] in _SWAPPED for tile in tiles
+    )
+
+
+def read_high_bit(image: Image.Image) -> np.ndarray:
+    """
+    Decode a 16-bit image (see is_high_bit) at full precision.
+    
+    Args:
+        image: Opened, not yet loaded, PIL image with a filename or file
+    Returns:
+        uint16 array of shape (H, W, 3); alpha is dropped and gray is
+        repeated into three channels
+    """
+    if image.mode in HIGH_BIT_MODES:
+        gray = np.asarray(image)
+        if gray.dtype != np.uint16:
+            gray = np.clip(gray, 0, 65535).astype(np.uint16)
+        return np.repeat(gray[..., None], 3, axis=-1)
+    
+    tiles = list(image.tile)
+    # Loading releases the image's file, so keep hold of it first
+    source = getattr(image, 'filename', None) or image.fp
+    high = _decode_rgb(image, tiles)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    with Image.open(source) as again:
+        # The same tiles with the other byte order unpack the low bytes
+        low = _decode_rgb(again, [
+            _with_rawmode(tile, _rawmode(tile)[:-4] + _SWAPPED[_rawmode(tile)[-4:]])
+            for tile in tiles
+        ])
+    
+    pixels = high.astype(np.uint16)
+    del high
+    pixels <<= 8
+    pixels |= low
+    return pixels
+
+
+def _decode_rgb(image: Image.Image, tiles: list) -> np.ndarray:
+    image.tile = tiles
+    image.load()
+    pixels = np.asarray(image)
+    return pixels[..., :3] if pixels.shape[-1] > 3 else pixels
+
+
+def to_8bit(pixels: np.ndarray) -> Image.Image:
+    """8-bit RGB preview of a uint16 pixel array (rounded)."""
+    rounded = (pixels.astype(np.uint32) * 255 + 32767) // 65535
+    return Image.fromarray(rounded.astype(np.uint8), mode='RGB')
+
+
+def write_png16(pixels: np.ndarray, fp: BinaryIO, level: int = 6) -> None:
+    """
+    Write a uint16 (H, W, 3) array as a 48-bit RGB PNG.
+    
+    Rows use the Sub filter, computed with NumPy a strip of rows at a
+    time, and are compressed as they go.
+    """
+    height, width, _ = pixels.shape
+    compressor = zlib.compressobj(level)
+    fp.write(b'\x89PNG\r\n\x1a\n')
+    _png_chunk(fp, b'IHDR', struct.pack('>IIBBBBB', width, height, 16, 2, 0, 0, 0))
+    
+    for top in range(0, height, STRIP_ROWS):
+        rows = pixels[top:top + STRIP_ROWS].astype('>u2').view(np.uint8).reshape(-1, width * 6)
+        filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 1
+        filtered[:, 1:7] = rows[:, :6]
+        np.subtract(rows[:, 6:], rows[:, :-6], out=filtered[:, 7:])
+        data = compressor.compress(filtered.tobytes())
+        if data:
+            _png_chunk(fp, b'IDAT', data)
+    _png_chunk(fp, b'IDAT', compressor.flush())
+    _png_chunk(fp, b'IEND', b'')
+
+
+def _png_chunk(fp: BinaryIO, kind: bytes, data: bytes) -> None:
+    fp.write(struct.pack('>I', len(data)) + kind + data)
+    fp.write(struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+
+def write_tiff16(pixels: np.ndarray, fp: BinaryIO, level: int = 6) -> None:
+    """
+    Write a uint16 (H, W, 3) array as a 48-bit RGB TIFF.
+    
+    Strips are Deflate compressed after horizontal differencing
+    (TIFF predictor 2), which most photo tools read.
+    """
+    height, width, _ = pixels.shape
+    strips = []
+    for top in range(0, height, STRIP_ROWS):
+        rows = pixels[top:top + STRIP_ROWS].astype('<u2')
+        rows[:, 1:] -= pixels[top:top + STRIP_ROWS, :-1]
+        strips.append(zlib.compress(rows.tobytes(), level))
+    
+    tags = [
+        (256, 4, [width]),                          # ImageWidth
+        (257, 4, [height]),                         # ImageLength
+        (258, 3, [16, 16, 16]),                     # BitsPerSample
+        (259, 3, [8]),                              # Compression: Deflate
+        (262, 3, [2]),                              # Photometric: RGB
+        (273, 4, [0] * len(strips)),                # StripOffsets (patched below)
+        (277, 3, [3]),                              # SamplesPerPixel
+        (278, 4, [STRIP_ROWS]),                     # RowsPerStrip
+        (279, 4, [len(strip) for strip in strips]), # StripByteCounts
+        (284, 3, [1]),                              # PlanarConfiguration: chunky
+        (317, 3, [2]),                              # Predictor: horizontal
+    ]
+    ifd_size = 2 + 12 * len(tags) + 4
+    extra_offset = 8 + ifd_size
+    values = {}
+    extra = b''
+    for tag, kind, items in tags:
+        size = 2 if kind == 3 else 4
+        if len(items) * size > 4:
+            values[tag] = extra_offset + len(extra)
+            extra += b'\0' * (len(items) * size)
+    data_offset = extra_offset + len(extra)
+    offsets = np.cumsum([data_offset] + [len(strip) for strip in strips[:-1]]).tolist()
+    tags[5] = (273, 4, offsets)
+    
+    fp.write(b'II*\0' + struct.pack('<I', 8) + struct.pack('<H', len(tags)))
+    extra = bytearray(extra)
+    for tag, kind, items in tags:
+        code = 'H' if kind == 3 else 'I'
+        packed = struct.pack(f'<{len(items)}{code}', *items)
+        if tag in values:
+            start = values[tag] - extra_offset
+            extra[start:start + len(packed)] = packed
+            fp.write(struct.pack('<HHII', tag, kind, len(items), values[tag]))
+        else:
+            fp.write(struct.pack('<HHI', tag, kind, len(items)) + packed.ljust(4, b'\0'))
+    fp.write(struct.pack('<I', 0))
+    fp.write(bytes(extra))
+    for strip in strips:
+        fp.write(strip)
+
+
+def save_high_bit(pixels: np.ndarray, fp: BinaryIO, format: str = 'PNG') -> None:
+    """Write a uint16 pixel array as a 16-bit 'PNG' or 'TIFF'."""
+    writers = {'PNG': write_png16, 'TIFF': write_tiff16}
+    if format.upper() not in writers:
+        raise ValueError(f'16-bit output supports PNG and TIFF, not {format}.')
+    writers[format.upper()](pixels, fp)
+
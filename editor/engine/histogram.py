@@ -0,0 +1,120 @@
+"""
+Luminosity profiles - preview a threshold window without rendering.
+A profile is computed once per image (at upload): a luminosity histogram
+with its cumulative distribution, plus, per sort direction, how often each
+luminosity band is followed by each other band. From those the share of
+pixels and the number of intervals a threshold window selects can be
+estimated in constant time, on the server or in the browser.
+"""
+import numpy as np
+from PIL import Image
+
+
+HISTOGRAM_BINS = 64
+TRANSITION_BINS = 32
+STRIP_ROWS = 256
+
+
+def _bands(rgb: np.ndarray, bins: int) -> np.ndarray:
+    """Luminosity band (0 to bins - 1) of each pixel of a uint8 RGB array."""
+    weighted = (
+        rgb[..., 0] * np.uint32(299) + rgb[..., 1] * np.uint32(587) + rgb[..., 2] * np.uint32(114)
+    )
+    return np.minimum(weighted * np.uint32(bins) // np.uint32(255000), bins - 1)
+
+
+def luminosity_profile(image: Image.Image) -> dict:
+    """
+    Summarize an image's luminosity for threshold previews.
+    
+    The image is decoded whole (Pillow decodes most formats in one go),
+    but converted to RGB and summarized in strips of STRIP_ROWS rows, so
+    the working arrays, several times larger per pixel than the decoded
+    image, stay small whatever its size.
+    
+    Args:
+        image: PIL Image (any mode)
+    Returns:
+        JSON-serializable dict with 'width', 'height', 'histogram' (pixel
+        counts per band), 'cdf' (cumulative share per band), and per
+        direction 'V'/'H': 'starts' (bands of each line's first pixel) and
+        'transitions' (flattened TRANSITION_BINS^2 counts of band pairs of
+        neighbouring pixels along the line)
+    """
+    width, height = image.size
+    step = HISTOGRAM_BINS // TRANSITION_BINS
+    pairs = TRANSITION_BINS * TRANSITION_BINS
+    
+    histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+    starts = {'V': None, 'H': np.zeros(TRANSITION_BINS, dtype=np.int64)}
+    transitions = {direction: np.zeros(pairs, dtype=np.int64) for direction in 'VH'}
+    previous = None
+    
+    for top in range(0, height, STRIP_ROWS):
+        strip = image.crop((0, top, width, min(top + STRIP_ROWS, height)))
+        strip = np.asarray(strip if strip.mode == 'RGB' else strip.convert('RGB'))
+        fine = _bands(strip, HISTOGRAM_BINS)
+        histogram += np.bincount(fine.ravel(), minlength=HISTOGRAM_BINS)
+        
+        coarse = fine // step
+        starts['H'] += np.bincount(coarse[:, 0], minlength=TRANSITION_BINS)
+        transitions['H'] += np.bincount(
+            (coarse[:, :-1] * TRANSITION_BINS + coarse[:, 1:]).ravel(), minlength=pairs
+        )
+        if previous is None:
+            starts['V'] = np.bincount(coarse[0], minlength=TRANSITION_BINS)
+        else:
+            coarse = np.concatenate([previous, coarse])
+        transitions['V'] += np.bincount(
+            (coarse[:-1] * TRANSITION_BINS + coarse[1:]).ravel(), minlength=pairs
+        )
+        previous = coarse[-1:]
+    
+    cdf = np.cumsum(histogram) / max(width * height, 1)
+    return {
+        'width': width,
+        'height': height,
+        'histogram': histogram.tolist(),
+        'cdf': [round(float(value), 6) for value in cdf],
+        'V': {'starts': starts['V'].tolist(), 'transitions': transitions['V'].tolist()},
+        'H': {'starts': starts['H'].tolist(), 'transitions': transitions['H'].tolist()},
+    }
+
+
+def _band_weights(bins: int, low: float, high: float) -> np.ndarray:
+    """Share of each band inside [low, high], assuming values spread evenly in a band."""
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    overlap = np.minimum(edges[1:], high) - np.maximum(edges[:-1], low)
+    return np.clip(overlap * bins, 0.0, 1.0)
+
+
+def estimate_selection(profile: dict, threshold_low: float, threshold_high: float,
+                       sort_direction: str = 'V') -> dict:
+    """
+    Estimate what a threshold window selects, from a luminosity profile.
+    
+    Args:
+        profile: Dict from luminosity_profile()
+        threshold_low, threshold_high: Luminosity window (0-1)
+        sort_direction: 'V' or 'H'
+    Returns:
+        Dict with 'coverage' (share of pixels), 'pixels' and 'intervals'
+    """
+    pixels = profile['width'] * profile['height']
+    histogram = np.asarray(profile['histogram'], dtype=np.float64)
+    selected = float(histogram @ _band_weights(HISTOGRAM_BINS, threshold_low, threshold_high))
+    
+    # An interval starts at a selected pixel that begins a line or follows
+    # an unselected one
+    line = profile[sort_direction]
+    weights = _band_weights(TRANSITION_BINS, threshold_low, threshold_high)
+    transitions = np.asarray(line['transitions'], dtype=np.float64).reshape(
+        TRANSITION_BINS, TRANSITION_BINS
+    )
+    intervals = float(np.asarray(line['starts']) @ weights + (1.0 - weights) @ transitions @ weights)
+    
+    return {
+        'coverage': selected / pixels if pixels else 0.0,
+        'pixels': round(selected),
+        'intervals': round(intervals),
+    }
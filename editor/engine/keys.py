@@ -0,0 +1,226 @@
+"""
+Sort key engine - the registry of sort keys and their lookup tables.
+
+8-bit pixels have only 2**24 colors, so every key is tabulated once per
+process and then costs one gather per pixel:
+
+    separable  key = table_r[R] + table_g[G] + table_b[B] with three
+               256-entry float64 tables (luminosity, single channels);
+               exactly the arithmetic result
+    full       one 2**24-entry uint16 table indexed by the packed color
+               (32 MB, built in chunks on first use) for keys that mix
+               the channels non-linearly: hue, saturation, perceptual keys
+
+Full-table keys are quantized to uint16 whether they come from the table
+or, for 16-bit pixels and small windows before the table exists, from
+the key's function, so every path gives the same values. New keys are
+added with register_key(), e.g. from a module listed in
+LUMINA_SORT_KEY_PLUGINS.
+"""
+import threading
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from .color_utils import calculate_luminosity, calculate_hue, calculate_saturation, pack_keys, sort_criteria
+
+
+# Full tables are built once this many pixels are keyed in one call
+TABLE_MIN_PIXELS = 1 << 20
+TABLE_CHUNK = 1 << 20
+KEY_LEVELS = 65535
+
+
+class SortKey(NamedTuple):
+    label: str
+    compute: Callable       # (N, 3) float RGB in [0, 1] -> (N,) values in [0, 1]
+    separable: bool         # compute(rgb) == compute(r, 0, 0) + compute(0, g, 0) + compute(0, 0, b)
+
+
+SORT_KEYS = {}
+_tables = {}
+_table_locks = {}
+_registry_lock = threading.Lock()
+
+
+def register_key(code: str, label: str, compute: Callable, separable: bool = False) -> SortKey:
+    """
+    Add (or replace) a sort key.
+    
+    Args:
+        code: Single character used in sort specs, e.g. 'C' in 'CL'
+        label: Human readable name
+        compute: Function of (N, 3) float RGB in [0, 1] returning (N,) values in [0, 1]
+        separable: True if the key is a sum of per-channel terms (and 0 for black)
+    Returns:
+        The registered SortKey
+    """
+    if len(code) != 1:
+        raise ValueError(f"Sort key codes are single characters, not '{code}'")
+    key = SortKey(label, compute, separable)
+    with _registry_lock:
+        SORT_KEYS[code] = key
+        _tables.pop(code, None)
+        _table_locks.setdefault(code, threading.Lock())
+    return key
+
+
+def sort_key_choices() -> list:
+    """(code, label) pairs of the registered keys, for form and model choices."""
+    return [(code, key.label) for code, key in SORT_KEYS.items()]
+
+
+def table_keys(separable: bool) -> str:
+    """Codes of the registered keys with (or without) separable tables."""
+    return ''.join(code for code, key in SORT_KEYS.items() if key.separable == separable)
+
+
+def _srgb_to_linear(values: np.ndarray) -> np.ndarray:
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def _oklab(pixels: np.ndarray) -> tuple:
+    """OKLab (L, a, b) of float sRGB pixels."""
+    linear = _srgb_to_linear(pixels)
+    r, g, b = linear[:, 0], linear[:, 1], linear[:, 2]
+    l_ = np.cbrt(0.4122214708 * r + 0.5363325363 * g + 0.0514459929 * b)
+    m_ = np.cbrt(0.2119034982 * r + 0.6806995451 * g + 0.1073969566 * b)
+    s_ = np.cbrt(0.0883024619 * r + 0.2817188376 * g + 0.6299787005 * b)
+    return (
+        0.2104542553 * l_ + 0.7936177850 * m_ - 0.0040720468 * s_,
+        1.9779984951 * l_ - 2.4285922050 * m_ + 0.4505937099 * s_,
+        0.0259040371 * l_ + 0.7827717662 * m_ - 0.8086757660 * s_,
+    )
+
+
+def cie_lightness(pixels: np.ndarray) -> np.ndarray:
+    """CIE L* of float sRGB pixels, scaled to [0, 1]."""
+    linear = _srgb_to_linear(pixels)
+    y = 0.2126729 * linear[:, 0] + 0.7151522 * linear[:, 1] + 0.0721750 * linear[:, 2]
+    f = np.where(y > (6 / 29) ** 3, np.cbrt(y), y / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.clip(1.16 * f - 0.16, 0.0, 1.0)
+
+
+def oklab_chroma(pixels: np.ndarray) -> np.ndarray:
+    """OKLab chroma, scaled so the most saturated sRGB colors reach 1."""
+    _, a, b = _oklab(pixels)
+    return np.clip(np.hypot(a, b) / 0.33, 0.0, 1.0)
+
+
+def oklab_hue(pixels: np.ndarray) -> np.ndarray:
+    """OKLab hue angle as a fraction of a turn; grays are 0."""
+    _, a, b = _oklab(pixels)
+    hue = np.arctan2(b, a) / (2 * np.pi) % 1.0
+    hue[np.hypot(a, b) < 1e-6] = 0.0
+    return hue
+
+
+register_key('L', 'Luminosity', calculate_luminosity, separable=True)
+register_key('H', 'Hue', calculate_hue)
+register_key('S', 'Saturation', calculate_saturation)
+register_key('R', 'Red Channel', lambda p: p[:, 0], separable=True)
+register_key('G', 'Green Channel', lambda p: p[:, 1], separable=True)
+register_key('B', 'Blue Channel', lambda p: p[:, 2], separable=True)
+register_key('P', 'Perceived Lightness (CIE L*)', cie_lightness)
+register_key('C', 'Chroma (OKLab)', oklab_chroma)
+register_key('A', 'Hue Angle (OKLab)', oklab_hue)
+
+
+def _key(code: str) -> SortKey:
+    # Unknown criteria sort by luminosity, as they always have
+    return SORT_KEYS.get(code) or SORT_KEYS['L']
+
+
+def _quantize(values: np.ndarray) -> np.ndarray:
+    return np.rint(np.clip(values, 0.0, 1.0) * KEY_LEVELS).astype(np.uint16)
+
+
+def get_sort_key(pixels: np.ndarray, sort_by: str) -> np.ndarray:
+    """
+    Sort key values of float pixels by arithmetic.
+    
+    Args:
+        pixels: Array of shape (N, 3) with RGB values in [0, 1]
+        sort_by: One criterion code, or several for a composite sort
+                 (e.g. 'HL': hue, then luminosity)
+    Returns:
+        1D array: float64 for separable keys, uint16 for the others,
+        packed unsigned integers for composites
+    """
+    criteria = sort_criteria(sort_by)
+    if len(criteria) > 1:
+        return pack_keys([get_sort_key(pixels, code) for code in criteria])
+    key = _key(criteria[0])
+    values = key.compute(pixels)
+    return values if key.separable else _quantize(values)
+
+
+def table(code: str):
+    """
+    Lookup table of a key, built on first use.
+    
+    Returns:
+        (3, 256) float64 channel tables for separable keys, otherwise
+        a (2**24,) uint16 table indexed by (R << 16) | (G << 8) | B
+    """
+    code = code if code in SORT_KEYS else 'L'
+    cached = _tables.get(code)
+    if cached is not None:
+        return cached
+    
+    with _table_locks[code]:
+        if code in _tables:
+            return _tables[code]
+        key = SORT_KEYS[code]
+        ramp = np.arange(256, dtype=np.float64) / 255.0
+        if key.separable:
+            channels = np.zeros((3, 256, 3))
+            for channel in range(3):
+                channels[channel, :, channel] = ramp
+            built = np.stack([key.compute(channels[channel]) for channel in range(3)])
+        else:
+            built = np.empty(1 << 24, dtype=np.uint16)
+            for start in range(0, 1 << 24, TABLE_CHUNK):
+                index = np.arange(start, start + TABLE_CHUNK, dtype=np.uint32)
+                colors = np.stack([ramp[index >> 16], ramp[(index >> 8) & 255], ramp[index & 255]], axis=1)
+                built[start:start + TABLE_CHUNK] = _quantize(key.compute(colors))
+        _tables[code] = built
+        return built
+
+
+def lookup_keys(pixels: np.ndarray, sort_by: str) -> np.ndarray:
+    """
+    Sort key values of 8-bit pixels, the same as get_sort_key() of pixels / 255.
+    
+    Args:
+        pixels: uint8 array of shape (N, 3)
+        sort_by: One criterion code, or several for a composite sort
+    Returns:
+        1D array as for get_sort_key()
+    """
+    criteria = sort_criteria(sort_by)
+    if len(criteria) > 1:
+        return pack_keys([lookup_keys(pixels, code) for code in criteria])
+    
+    code = criteria[0]
+    key = _key(code)
+    if key.separable:
+        channels = table(code)
+        values = channels[0][pixels[:, 0]]
+        values += channels[1][pixels[:, 1]]
+        values += channels[2][pixels[:, 2]]
+        return values
+    
+    if code not in _tables and len(pixels) < TABLE_MIN_PIXELS:
+        # Not worth building the table for a few pixels; the values are identical
+        return get_sort_key(pixels / 255.0, code)
+    index = pixels[:, 0].astype(np.uint32) << 16
+    index |= pixels[:, 1].astype(np.uint32) << 8
+    index |= pixels[:, 2]
+    return table(code)[index]
+
+
+def warm_tables(codes: str = None) -> None:
+    """Build the lookup tables of the given key codes (default: all registered keys)."""
+    for code in codes or list(SORT_KEYS):
+        table(code)
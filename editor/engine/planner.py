@@ -0,0 +1,264 @@
+"""
+Render strategy planner - pick how an image is held in memory for a sort.
+
+The same sort can be run four ways, with identical output:
+
+    float    float64 pixels and cached key planes (the original path)
+    compact  uint8 (or uint16) pixels, key planes built in row chunks
+    bands    compact pixels, key planes only for one band at a time
+    strips   compact pixels, strips of lines sorted in parallel threads
+
+Peak memory of each is estimated from the image size and sort keys
+(coefficients measured with tracemalloc, plus the PIL buffers it cannot
+see); the planner picks the fastest strategy whose estimate fits the
+memory budget. PeakMeter measures the real peak so estimates can be
+checked against it.
+"""
+import ctypes
+import ctypes.util
+import os
+import threading
+import tracemalloc
+from typing import NamedTuple
+
+from PIL import Image
+
+from .backends import get_backend
+from .color_utils import sort_criteria
+from .highbit import is_high_bit
+from .progressive import BAND_PIXELS, sort_progressive, sort_strips
+from .sorter import KEY_CHUNK_ROWS, PixelSorter
+
+
+# PIL buffers are invisible to tracemalloc: the source and the result image
+IMAGE_BYTES_PER_PIXEL = 8
+
+# Render time relative to 'compact' on one core; strips divide by their
+# threads, which only run side by side on a backend that releases the GIL
+RELATIVE_TIME = {
+    'compact': 1.0,
+    'bands': 1.05,
+    'strips': 1.05,
+    'float': 1.3,
+}
+STRATEGIES = tuple(RELATIVE_TIME)
+
+# Bytes per pixel of the pixel array and its sorted copy, by strategy and bit depth
+PIXEL_BYTES = {'float': 96, 8: 6, 16: 12}
+# Per key-plane pixel: 8 bytes per plane, 8 for packing keys, 1 for the mask
+PLANE_BYTES = 8
+PACKED_BYTES = 8
+MASK_BYTES = 1
+# Float temporaries per pixel of a key chunk, per plane
+CHUNK_BYTES = 40
+# Edge mode: the uint8 gradient plane (its float32 temporaries are freed before the peak)
+EDGE_BYTES = 2
+
+
+try:
+    # glibc keeps freed arenas resident; trimming them lets RSS track a render
+    _malloc_trim = ctypes.CDLL(ctypes.util.find_library('c')).malloc_trim
+except (OSError, AttributeError, TypeError):
+    _malloc_trim = None
+
+# tracemalloc is process-wide, so overlapping PeakMeters share one trace
+_tracing = 0
+_tracing_lock = threading.Lock()
+
+
+class RenderPlan(NamedTuple):
+    strategy: str
+    peak_bytes: int
+    fits: bool
+    workers: int
+    estimates: dict     # strategy -> estimated peak bytes
+
+
+def estimate_peak(strategy: str, size: tuple, params: dict, bit_depth: int = 8,
+                  workers: int = 1) -> int:
+    """
+    Estimate the peak memory of a render, including decode and output images.
+    
+    Args:
+        strategy: One of STRATEGIES
+        size: Image (width, height)
+        params: PixelSorter.sort() keyword arguments
+        bit_depth: 8, or 16 for 16-bit sources (never sorted as floats)
+        workers: Threads of the 'strips' strategy
+    Returns:
+        Estimated peak bytes
+    """
+    width, height = size
+    pixels = width * height
+    keys = sort_criteria(params.get('sort_by', 'L'))
+    planes = len(set(keys) | {'L'})
+    plane_bytes = PLANE_BYTES * planes + PACKED_BYTES * (len(keys) > 1) + MASK_BYTES
+    # The gradient always covers the whole image; bands then keep a whole luminosity plane too
+    edges = params.get('interval_mode') == 'edges'
+    edge_bytes = (EDGE_BYTES + PLANE_BYTES * (strategy == 'bands')) if edges else 0
+    
+    if strategy == 'float' and bit_depth == 8:
+        return round(pixels * (PIXEL_BYTES['float'] + plane_bytes + edge_bytes + IMAGE_BYTES_PER_PIXEL))
+    
+    peak = pixels * (PIXEL_BYTES[bit_depth] + edge_bytes + IMAGE_BYTES_PER_PIXEL)
+    vertical = params.get('sort_direction', 'V') == 'V'
+    if strategy == 'bands':
+        band = min(BAND_PIXELS, pixels)
+        window = (height, max(band // height, 1)) if vertical else (max(band // width, 1), width)
+        peak += band * plane_bytes + _chunk_pixels(*window) * CHUNK_BYTES * planes
+    elif strategy == 'strips':
+        window = (height, -(-width // workers)) if vertical else (-(-height // workers), width)
+        peak += pixels * plane_bytes + workers * _chunk_pixels(*window) * CHUNK_BYTES * planes
+    else:
+        peak += pixels * plane_bytes + _chunk_pixels(height, width) * CHUNK_BYTES * planes
+    return round(peak)
+
+
+def _chunk_pixels(rows: int, columns: int) -> int:
+    """Pixels of one key chunk of a (rows, columns) window."""
+    return min(rows, KEY_CHUNK_ROWS) * columns
+
+
+def plan_render(size: tuple, params: dict, budget: int = None, bit_depth: int = 8,
+                workers: int = 1, backend: str = None) -> RenderPlan:
+    """
+    Pick the fastest strategy whose estimated peak fits a memory budget.
+    
+    Args:
+        size: Image (width, height)
+        params: PixelSorter.sort() keyword arguments
+        budget: Bytes available to the render; None for no limit
+        bit_depth: 8 or 16
+        workers: Threads available for 'strips' (1 leaves it out)
+        backend: Engine backend name; strips are left out unless it
+                 releases the GIL
+    Returns:
+        RenderPlan; if nothing fits, the smallest strategy with fits=False
+    """
+    if not get_backend(backend).releases_gil:
+        workers = 1
+    candidates = [
+        strategy for strategy in STRATEGIES
+        if not (strategy == 'strips' and workers < 2) and not (strategy == 'float' and bit_depth != 8)
+    ]
+    estimates = {
+        strategy: estimate_peak(strategy, size, params, bit_depth, workers) for strategy in candidates
+    }
+    
+    def seconds(strategy):
+        return RELATIVE_TIME[strategy] / (workers if strategy == 'strips' else 1)
+    
+    fitting = [s for s in candidates if budget is None or estimates[s] <= budget]
+    if fitting:
+        strategy = min(fitting, key=seconds)
+    else:
+        strategy = min(candidates, key=estimates.get)
+    return RenderPlan(strategy, estimates[strategy], bool(fitting), workers, estimates)
+
+
+def render_planned(image: Image.Image, params: dict, budget: int = None, workers: int = 1,
+                   backend: str = None) -> tuple:
+    """
+    Plan a render for an image and sort it with the chosen strategy.
+    
+    Args:
+        image: PIL Image; 16-bit files must not be loaded yet
+        params: PixelSorter.sort() keyword arguments
+        budget: Bytes available to the render; None for no limit
+        workers: Threads available for parallel strips
+        backend: Engine backend name
+    Returns:
+        (sorter, sorted pixel array, RenderPlan)
+    """
+    plan = plan_render(image.size, params, budget, 16 if is_high_bit(image) else 8, workers, backend)
+    return run_plan(image, plan, params, backend) + (plan,)
+
+
+def run_plan(image: Image.Image, plan: RenderPlan, params: dict, backend: str = None,
+             planes: dict = None, checkpoint=None) -> tuple:
+    """
+    Sort an image with a planned strategy.
+    
+    Args:
+        planes: Optional key planes already computed for the image, e.g.
+                a cached 'gradient' plane
+        checkpoint: Optional callable run between bands of the 'bands'
+                    strategy (see sort_progressive)
+    Returns:
+        (sorter, sorted pixel array)
+    """
+    sorter = PixelSorter(image, backend=backend, compact=plan.strategy != 'float')
+    sorter.planes.update(planes or {})
+    if plan.strategy == 'bands':
+        return sorter, sort_progressive(sorter, params, checkpoint=checkpoint)
+    if plan.strategy == 'strips':
+        return sorter, sort_strips(sorter, params, plan.workers)
+    return sorter, sorter.sort(**params)
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class PeakMeter:
+    """
+    Context manager measuring peak memory growth while its block runs.
+    
+    'rss' samples the process's resident size from a thread, after
+    returning freed heap memory to the OS where glibc allows; it sees
+    every allocation (PIL buffers included) but also other threads'.
+    'tracemalloc' traces NumPy and Python allocations exactly, but
+    roughly doubles render time, and overlapping meters share one peak.
+    'peak_bytes' is None where the method does not work.
+    """
+    
+    def __init__(self, method: str = 'rss', interval: float = 0.005):
+        if method not in ('rss', 'tracemalloc'):
+            raise ValueError(f"Unknown memory meter '{method}'")
+        self.method = method
+        self.interval = interval
+        self.peak_bytes = None
+        self._done = threading.Event()
+        self._sampler = None
+    
+    def __enter__(self) -> 'PeakMeter':
+        global _tracing
+        if self.method == 'tracemalloc':
+            with _tracing_lock:
+                if not _tracing:
+                    tracemalloc.start()
+                    tracemalloc.reset_peak()
+                _tracing += 1
+            self._baseline = tracemalloc.get_traced_memory()[0]
+            return self
+        
+        if _malloc_trim is not None:
+            _malloc_trim(0)
+        self._baseline = current_rss()
+        if self._baseline is not None:
+            self._peak = self._baseline
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        return self
+    
+    def _sample(self) -> None:
+        while not self._done.wait(self.interval):
+            self._peak = max(self._peak, current_rss() or 0)
+    
+    def __exit__(self, *exc) -> None:
+        global _tracing
+        if self.method == 'tracemalloc':
+            with _tracing_lock:
+                self.peak_bytes = max(tracemalloc.get_traced_memory()[1] - self._baseline, 0)
+                _tracing -= 1
+                if not _tracing:
+                    tracemalloc.stop()
+        elif self._sampler is not None:
+            self._done.set()
+            self._sampler.join()
+            self.peak_bytes = max(self._peak, current_rss() or 0) - self._baseline
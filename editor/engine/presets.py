@@ -0,0 +1,123 @@
+"""
+Export presets - named output sizes for social media and print.
+
+Any set of presets is produced from one decoded source: each preset
+crops the source to its aspect ratio first and only resamples that
+window, reducing by an integer factor before the final LANCZOS pass.
+Presets encode in parallel threads (PNG encoding releases the GIL).
+"""
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import BinaryIO, NamedTuple
+
+from PIL import Image
+
+
+class ExportPreset(NamedTuple):
+    label: str
+    width: int
+    height: int
+
+
+EXPORT_PRESETS = {}
+
+
+def register_preset(name: str, label: str, width: int, height: int) -> ExportPreset:
+    """
+    Add (or replace) an export preset.
+    
+    Args:
+        name: Key used in URLs and bundle file names
+        label: Human readable name
+        width, height: Output size in pixels
+    Returns:
+        The registered ExportPreset
+    """
+    preset = ExportPreset(label, width, height)
+    EXPORT_PRESETS[name] = preset
+    return preset
+
+
+register_preset('story', 'Instagram Story (9:16)', 1080, 1920)
+register_preset('post', 'Instagram Post (4:5)', 1080, 1350)
+register_preset('square', 'Square (1:1)', 1080, 1080)
+register_preset('landscape', 'Landscape (1.91:1)', 1200, 628)
+register_preset('banner', 'Banner (3:1)', 1500, 500)
+register_preset('print_4x6', 'Print 4x6" @ 300 dpi', 1200, 1800)
+register_preset('print_a4', 'Print A4 @ 300 dpi', 2480, 3508)
+
+
+def _crop_box(size: tuple, target: tuple) -> tuple:
+    """Centered box of the target aspect ratio inside an image of size."""
+    width, height = size
+    target_ratio = target[0] / target[1]
+    
+    if width / height > target_ratio:
+        new_width = int(height * target_ratio)
+        left = (width - new_width) // 2
+        return (left, 0, left + new_width, height)
+    new_height = int(width / target_ratio)
+    top = (height - new_height) // 2
+    return (0, top, width, top + new_height)
+
+
+def render_preset(image: Image.Image, name: str) -> Image.Image:
+    """
+    Crop and resize an image for one preset.
+    
+    Args:
+        image: Decoded source image
+        name: Key of EXPORT_PRESETS
+    Returns:
+        New PIL Image of the preset's size
+    """
+    preset = EXPORT_PRESETS[name]
+    target = (preset.width, preset.height)
+    # Only the cropped window is resampled; reducing_gap reduces it by an
+    # integer factor first, so LANCZOS only runs over the last <2x step
+    return image.resize(
+        target, Image.Resampling.LANCZOS,
+        box=_crop_box(image.size, target), reducing_gap=2.0
+    )
+
+
+def _encode_preset(image: Image.Image, name: str) -> bytes:
+    buffer = BytesIO()
+    render_preset(image, name).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def encode_presets(image: Image.Image, names: list, workers: int = None) -> dict:
+    """
+    Render and PNG-encode several presets from one decoded source.
+    
+    Args:
+        image: Source image (decoded once, shared by every preset)
+        names: Keys of EXPORT_PRESETS
+        workers: Encoder threads (defaults to the number of CPUs)
+    Returns:
+        Dict of preset name to PNG bytes, in the order of names
+    """
+    unknown = [name for name in names if name not in EXPORT_PRESETS]
+    if unknown:
+        raise ValueError(f"Unknown export preset(s): {', '.join(unknown)}")
+    
+    image.load()
+    workers = min(workers or os.cpu_count() or 1, len(names)) or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_encode_preset, image, name) for name in names]
+        return {name: future.result() for name, future in zip(names, futures)}
+
+
+def write_bundle(encoded: dict, fp: BinaryIO) -> None:
+    """
+    Write encoded presets to one ZIP archive.
+    
+    PNGs are already deflated, so members are stored uncompressed.
+    """
+    with zipfile.ZipFile(fp, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, data in encoded.items():
+            preset = EXPORT_PRESETS[name]
+            archive.writestr(f'{name}_{preset.width}x{preset.height}.png', data)
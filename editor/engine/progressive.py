@@ -0,0 +1,185 @@
+"""
+Progressive rendering - sort an image band by band and preview each band.
+
+Sorted lines never cross a band of whole columns (vertical sorts) or
+whole rows (horizontal sorts), so bands can be sorted one after another
+into the same result array with the output of a single sort() call.
+Each finished band is scaled to a preview size and encoded as a small
+JPEG fragment, so a client can paint the render while it is running.
+The first band is small, to get something on screen quickly. The same
+split lets strips of one image sort in parallel threads.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image
+
+from .regions import bounding_box
+from .sorter import PixelSorter
+
+
+FIRST_BAND_PIXELS = 131_072
+BAND_PIXELS = 1_048_576
+PREVIEW_SIZE = 1600
+FRAGMENT_QUALITY = 80
+
+
+class Band(NamedTuple):
+    index: int
+    count: int
+    box: tuple          # (left, top, right, bottom) in image pixels
+    preview_box: tuple  # the same box in preview pixels
+    fragment: bytes     # JPEG of the sorted band at preview scale
+
+
+def preview_size(size: tuple, limit: int = PREVIEW_SIZE) -> tuple:
+    """Size of the preview an image of the given size is painted at (never enlarged)."""
+    width, height = size
+    scale = min(limit / max(width, height), 1.0)
+    return max(round(width * scale), 1), max(round(height * scale), 1)
+
+
+def band_boxes(area: tuple, direction: str, first_pixels: int = FIRST_BAND_PIXELS,
+               band_pixels: int = BAND_PIXELS) -> list:
+    """
+    Split the area being sorted into bands of whole lines.
+    
+    Args:
+        area: (left, top, right, bottom) box of the pixels being sorted
+        direction: 'V' bands are column ranges, 'H' bands are row ranges
+        first_pixels: Approximate size of the first band
+        band_pixels: Approximate size of the following bands
+    Returns:
+        (left, top, right, bottom) boxes covering the area in order
+    """
+    left, top, right, bottom = area
+    start, end = (left, right) if direction == 'V' else (top, bottom)
+    line = (bottom - top) if direction == 'V' else (right - left)
+    
+    boxes = []
+    budget = first_pixels
+    while start < end:
+        stop = min(start + max(budget // max(line, 1), 1), end)
+        boxes.append((start, top, stop, bottom) if direction == 'V' else (left, start, right, stop))
+        start = stop
+        budget = band_pixels
+    return boxes
+
+
+def encode_fragment(sorter: PixelSorter, pixels: np.ndarray, box: tuple,
+                    preview: tuple, quality: int = FRAGMENT_QUALITY) -> tuple:
+    """
+    Scale a sorted band to the preview and encode it as JPEG.
+    
+    Args:
+        sorter: Sorter the pixels come from
+        pixels: Full result array
+        box: (left, top, right, bottom) band in image pixels
+        preview: Preview (width, height)
+        quality: JPEG quality
+    Returns:
+        (preview box, JPEG bytes)
+    """
+    left, top, right, bottom = box
+    scale_x = preview[0] / sorter.width
+    scale_y = preview[1] / sorter.height
+    preview_box = (
+        round(left * scale_x), round(top * scale_y),
+        max(round(right * scale_x), round(left * scale_x) + 1),
+        max(round(bottom * scale_y), round(top * scale_y) + 1),
+    )
+    image = sorter.to_image(pixels[top:bottom, left:right])
+    size = (preview_box[2] - preview_box[0], preview_box[3] - preview_box[1])
+    if size != image.size:
+        image = image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return preview_box, buffer.getvalue()
+
+
+def sort_progressive(sorter: PixelSorter, params: dict, on_band=None,
+                     preview_limit: int = PREVIEW_SIZE, checkpoint=None) -> np.ndarray:
+    """
+    Sort an image band by band, handing each finished band to a callback.
+    
+    Args:
+        sorter: PixelSorter of the image
+        params: PixelSorter.sort() keyword arguments
+        on_band: Optional callable receiving a Band as each one finishes
+        preview_limit: Longest side of the preview fragments are scaled to
+        checkpoint: Optional callable run before each band; it may block to
+                    pause the sort, or raise to abandon it
+    Returns:
+        Sorted pixel array, the same as sorter.sort(**params)
+    """
+    params = dict(params)
+    result = sorter.pixel_array.copy()
+    region, area = _sort_area(sorter, params.pop('region', None))
+    if area is None:
+        return result
+    
+    preview = preview_size((sorter.width, sorter.height), preview_limit)
+    boxes = band_boxes(area, params.get('sort_direction', 'V'))
+    for index, (left, top, right, bottom) in enumerate(boxes):
+        if checkpoint:
+            checkpoint()
+        sorter.sort_box(result, (slice(top, bottom), slice(left, right)), region=region, **params)
+        if on_band:
+            preview_box, fragment = encode_fragment(sorter, result, (left, top, right, bottom), preview)
+            on_band(Band(index, len(boxes), (left, top, right, bottom), preview_box, fragment))
+    return result
+
+
+def sort_strips(sorter: PixelSorter, params: dict, workers: int) -> np.ndarray:
+    """
+    Sort an image as parallel strips of whole lines, one thread per strip.
+    
+    Strips only sort side by side with a backend whose kernels release
+    the GIL (numba); plan_render() leaves the strategy out otherwise.
+    Each strip computes only its own key window.
+    
+    Args:
+        sorter: PixelSorter of the image
+        params: PixelSorter.sort() keyword arguments
+        workers: Number of strips sorted at once
+    Returns:
+        Sorted pixel array, the same as sorter.sort(**params)
+    """
+    params = dict(params)
+    result = sorter.pixel_array.copy()
+    region, area = _sort_area(sorter, params.pop('region', None))
+    if area is None:
+        return result
+    
+    if params.get('interval_mode') == 'edges':
+        # Compute the shared gradient once rather than racing in every thread
+        sorter.gradient_plane()
+    
+    left, top, right, bottom = area
+    direction = params.get('sort_direction', 'V')
+    line, lines = (bottom - top, right - left) if direction == 'V' else (right - left, bottom - top)
+    strip = -(-lines // max(workers, 1)) * line
+    boxes = band_boxes(area, direction, strip, strip)
+    
+    def sort(box):
+        left, top, right, bottom = box
+        sorter.sort_box(result, (slice(top, bottom), slice(left, right)), region=region, **params)
+    
+    with ThreadPoolExecutor(max_workers=len(boxes)) as pool:
+        list(pool.map(sort, boxes))
+    return result
+
+
+def _sort_area(sorter: PixelSorter, region) -> tuple:
+    """Region mask and (left, top, right, bottom) box being sorted; the box is None for an empty region."""
+    if region is None:
+        return None, (0, 0, sorter.width, sorter.height)
+    region = sorter.region_mask(region)
+    box = bounding_box(region)
+    if box is None:
+        return region, None
+    rows, cols = box
+    return region, (cols.start, rows.start, cols.stop, rows.stop)
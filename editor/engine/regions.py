@@ -0,0 +1,74 @@
+"""
+Region masks - limit sorting to part of an image.
+A region spec is a plain dict so it can travel with the other sort
+parameters: a rectangle and/or polygon in relative coordinates, and/or
+an alpha mask image. When several are given only their overlap is sorted.
+"""
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+def build_region(spec: dict, size: tuple) -> np.ndarray:
+    """
+    Rasterize a region spec into a boolean mask.
+    
+    Args:
+        spec: Dict with any of
+              'rect': (left, top, right, bottom) in [0, 1],
+              'polygon': [(x, y), ...] in [0, 1],
+              'mask': PIL Image or path; alpha (or gray) above 50% selects
+        size: (width, height) of the image
+    Returns:
+        Boolean array of shape (height, width)
+    """
+    width, height = size
+    region = np.ones((height, width), dtype=bool)
+    
+    rect = spec.get('rect')
+    if rect:
+        left, top, right, bottom = rect
+        x0, x1 = round(left * width), round(right * width)
+        y0, y1 = round(top * height), round(bottom * height)
+        inside = np.zeros_like(region)
+        inside[max(y0, 0):max(y1, 0), max(x0, 0):max(x1, 0)] = True
+        region &= inside
+    
+    polygon = spec.get('polygon')
+    if polygon:
+        canvas = Image.new('1', (width, height), 0)
+        ImageDraw.Draw(canvas).polygon(
+            [(x * (width - 1), y * (height - 1)) for x, y in polygon], fill=1
+        )
+        region &= np.array(canvas, dtype=bool)
+    
+    mask = spec.get('mask')
+    if mask is not None:
+        region &= _mask_plane(mask, size)
+    
+    return region
+
+
+def _mask_plane(mask, size: tuple) -> np.ndarray:
+    """Selected pixels of an uploaded mask, scaled to the image size."""
+    if not isinstance(mask, Image.Image):
+        with Image.open(mask) as img:
+            return _mask_plane(img.copy(), size)
+    
+    channel = mask.getchannel('A') if 'A' in mask.getbands() else mask.convert('L')
+    if channel.size != tuple(size):
+        channel = channel.resize(size, Image.Resampling.NEAREST)
+    return np.array(channel) > 127
+
+
+def bounding_box(region: np.ndarray) -> tuple:
+    """
+    Smallest window containing every selected pixel.
+    
+    Returns:
+        (row slice, column slice), or None for an empty region
+    """
+    rows = np.flatnonzero(region.any(axis=1))
+    if not rows.size:
+        return None
+    cols = np.flatnonzero(region[rows[0]:rows[-1] + 1].any(axis=0))
+    return slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1)
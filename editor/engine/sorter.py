@@ -5,10 +5,15 @@ import numpy as np
 from PIL import Image
 from typing import Literal
 
-from .color_utils import (
-    calculate_luminosity, get_sort_key, 
-    create_mask, find_intervals
-)
+from .backends import EngineBackend, get_backend
+from .color_utils import sort_criteria, pack_keys, create_mask, gradient_magnitude, create_edge_mask
+from .keys import get_sort_key, lookup_keys
+from .regions import build_region, bounding_box
+from .highbit import is_high_bit, read_high_bit, to_8bit, save_high_bit
+
+
+# Pixels are keyed this many rows at a time
+KEY_CHUNK_ROWS = 256
 
 
 class PixelSorter:
@@ -17,56 +22,156 @@ class PixelSorter:
     Converts images to NumPy arrays and applies sorting algorithms.
     """
     
-    def __init__(self, image: Image.Image):
-        """Initialize with a PIL Image."""
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+    def __init__(self, image: Image.Image, backend: str = None, compact: bool = False):
+        """
+        Initialize with a PIL Image and an optional engine backend name.
+        
+        16-bit files, opened but not yet loaded (see is_high_bit), keep
+        their precision as uint16 pixels; everything else is sorted as
+        float pixels in [0, 1], or as uint8 pixels if compact is True
+        (an eighth of the memory, same output).
+        """
+        if is_high_bit(image):
+            self.pixel_array = read_high_bit(image)
+        else:
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            if compact:
+                self.pixel_array = np.array(image, dtype=np.uint8)
+            else:
+                self.pixel_array = np.array(image, dtype=np.float64) / 255.0
         
         self.original_image = image
-        self.pixel_array = np.array(image, dtype=np.float64) / 255.0
         self.height, self.width, self.channels = self.pixel_array.shape
+        self.backend: EngineBackend = get_backend(backend)
+        self._planes = {}
+        self._regions = {}
+    
+    @classmethod
+    def from_array(cls, pixel_array: np.ndarray, planes: dict = None,
+                   backend: str = None) -> 'PixelSorter':
+        """
+        Build a sorter around an already decoded pixel array.
+        
+        Args:
+            pixel_array: Array of shape (H, W, 3), floats of 8-bit values in [0, 1], uint8 or uint16
+            planes: Optional precomputed key planes, keyed by criterion
+            backend: Engine backend name (defaults to the configured one)
+        Returns:
+            PixelSorter sharing the given arrays (no copy is made)
+        """
+        sorter = cls.__new__(cls)
+        sorter.original_image = None
+        sorter.pixel_array = pixel_array
+        sorter.height, sorter.width, sorter.channels = pixel_array.shape
+        sorter.backend = get_backend(backend)
+        sorter._planes = dict(planes or {})
+        sorter._regions = {}
+        return sorter
+    
+    @property
+    def bit_depth(self) -> int:
+        """Bits per channel of the pixels being sorted: 16 or 8."""
+        return 16 if self.pixel_array.dtype == np.uint16 else 8
     
-    def _sort_interval(self, pixels: np.ndarray, sort_by: str, reverse: bool = False) -> np.ndarray:
-        """Sort a slice of pixels by specified key."""
-        if len(pixels) <= 1:
-            return pixels
+    @property
+    def compact(self) -> bool:
+        """Whether the pixels are kept as integers rather than floats."""
+        return self.pixel_array.dtype.kind == 'u'
+    
+    @property
+    def planes(self) -> dict:
+        """Key planes computed so far, keyed by criterion."""
+        return self._planes
+    
+    def key_plane(self, sort_by: str) -> np.ndarray:
+        """
+        Get the (H, W) plane of sort key values for the whole image.
+        
+        Planes only depend on the original pixels, so they are computed
+        once per sorter and reused by every subsequent sort() call. A
+        composite criterion ('HL') packs the single-key planes into one
+        integer plane, so it is sorted in a single pass as well.
+        """
+        if sort_by in self._planes:
+            return self._planes[sort_by]
+        
+        criteria = sort_criteria(sort_by)
+        if len(criteria) > 1:
+            self._planes[sort_by] = pack_keys([self.key_plane(key) for key in criteria])
+        else:
+            self._planes[sort_by] = self._compute_keys(self.pixel_array, criteria[0])
+        return self._planes[sort_by]
+    
+    def key_window(self, sort_by: str, box: tuple = None) -> np.ndarray:
+        """
+        Get sort key values for a (row slice, column slice) window.
         
-        sort_keys = get_sort_key(pixels, sort_by)
-        indices = np.argsort(sort_keys)
+        Cached planes are sliced; otherwise only the window is computed
+        (and not cached), so a small region of a large image stays cheap.
+        """
+        if box is None:
+            return self.key_plane(sort_by)
+        if sort_by in self._planes:
+            return self._planes[sort_by][box]
+        return self._compute_keys(self.pixel_array[box], sort_by)
+    
+    def _compute_keys(self, pixels: np.ndarray, sort_by: str) -> np.ndarray:
+        """
+        Sort key plane of an (H, W, 3) pixel window.
         
-        if reverse:
-            indices = indices[::-1]
+        8-bit pixels (uint8, or floats of 8-bit values) are keyed through
+        the lookup tables of engine/keys.py; uint16 pixels are converted
+        to floats in [0, 1] and keyed arithmetically. Both go a chunk of
+        rows at a time, so no float copy of the whole image is made.
+        """
+        if pixels.dtype == np.uint16:
+            convert = lambda chunk: get_sort_key(chunk.astype(np.float64) / 65535.0, sort_by)
+        elif pixels.dtype == np.uint8:
+            convert = lambda chunk: lookup_keys(chunk, sort_by)
+        else:
+            convert = lambda chunk: lookup_keys(np.rint(chunk * 255).astype(np.uint8), sort_by)
         
-        return pixels[indices]
+        keys = None
+        for top in range(0, pixels.shape[0], KEY_CHUNK_ROWS):
+            chunk = pixels[top:top + KEY_CHUNK_ROWS]
+            values = convert(chunk.reshape(-1, self.channels)).reshape(chunk.shape[:2])
+            if keys is None:
+                keys = np.empty(pixels.shape[:2], dtype=values.dtype)
+            keys[top:top + KEY_CHUNK_ROWS] = values
+        return keys
     
-    def _process_vertical(self, result: np.ndarray, threshold_low: float, 
-                          threshold_high: float, sort_by: str, reverse: bool) -> np.ndarray:
+    def gradient_plane(self) -> np.ndarray:
+        """
+        Sobel gradient magnitude of the luminosity plane (see gradient_magnitude).
+        
+        Computed once per sorter over the whole image. A plane stored for
+        the same original can be put in planes['gradient'] beforehand to
+        skip the convolution.
+        """
+        if 'gradient' not in self._planes:
+            self._planes['gradient'] = gradient_magnitude(self.key_plane('L'))
+        return self._planes['gradient']
+    
+    def region_mask(self, region) -> np.ndarray:
+        """Boolean mask for a region spec (see build_region), cached per spec."""
+        if isinstance(region, np.ndarray):
+            return region
+        key = repr(sorted(region.items()))
+        if key not in self._regions:
+            self._regions[key] = build_region(region, (self.width, self.height))
+        return self._regions[key]
+    
+    def _process_vertical(self, result: np.ndarray, mask: np.ndarray,
+                          keys: np.ndarray, reverse: bool) -> np.ndarray:
         """Process columns for vertical sorting."""
-        for x in range(self.width):
-            column = result[:, x, :]
-            luminosity = calculate_luminosity(column)
-            mask = create_mask(luminosity, threshold_low, threshold_high)
-            
-            for start, end in find_intervals(mask):
-                if end - start > 1:
-                    result[start:end, x, :] = self._sort_interval(
-                        column[start:end], sort_by, reverse
-                    )
+        self.backend.sort_lines(result.transpose(1, 0, 2), mask.T, keys.T, reverse)
         return result
     
-    def _process_horizontal(self, result: np.ndarray, threshold_low: float,
-                            threshold_high: float, sort_by: str, reverse: bool) -> np.ndarray:
+    def _process_horizontal(self, result: np.ndarray, mask: np.ndarray,
+                            keys: np.ndarray, reverse: bool) -> np.ndarray:
         """Process rows for horizontal sorting."""
-        for y in range(self.height):
-            row = result[y, :, :]
-            luminosity = calculate_luminosity(row)
-            mask = create_mask(luminosity, threshold_low, threshold_high)
-            
-            for start, end in find_intervals(mask):
-                if end - start > 1:
-                    result[y, start:end, :] = self._sort_interval(
-                        row[start:end], sort_by, reverse
-                    )
+        self.backend.sort_lines(result, mask, keys, reverse)
         return result
     
     def sort(
@@ -74,8 +179,11 @@ class PixelSorter:
         threshold_low: float = 0.25,
         threshold_high: float = 0.80,
         sort_direction: Literal['H', 'V'] = 'V',
-        sort_by: Literal['L', 'H', 'S', 'R', 'G', 'B'] = 'L',
-        reverse_sort: bool = False
+        sort_by: str = 'L',
+        reverse_sort: bool = False,
+        region=None,
+        interval_mode: Literal['threshold', 'edges'] = 'threshold',
+        edge_threshold: float = 0.25
     ) -> np.ndarray:
         """
         Apply pixel sorting to the image.
@@ -84,18 +192,96 @@ class PixelSorter:
             threshold_low: Lower brightness threshold (0-1)
             threshold_high: Upper brightness threshold (0-1)
             sort_direction: 'H' horizontal, 'V' vertical
-            sort_by: Sorting criterion
+            sort_by: Sorting criterion, or several for a composite sort ('HL')
             reverse_sort: Descending order if True
+            region: Optional region spec dict or boolean (H, W) mask; only
+                    its bounding box is processed
+            interval_mode: 'threshold' sorts runs inside the brightness
+                    window; 'edges' sorts the runs between edges, ignoring
+                    the window
+            edge_threshold: Gradient magnitude (0-1) that counts as an edge
         Returns:
-            Sorted pixel array (H, W, RGB) with values in [0, 1]
+            Sorted pixel array (H, W, RGB) of the sorter's pixel type:
+            floats in [0, 1], uint8 if compact, or uint16 for 16-bit images
         """
         result = self.pixel_array.copy()
         
+        box = None
+        if region is not None:
+            region = self.region_mask(region)
+            box = bounding_box(region)
+            if box is None:
+                return result
+        
+        self.sort_box(result, box, threshold_low, threshold_high, sort_direction,
+                      sort_by, reverse_sort, region, interval_mode, edge_threshold)
+        return result
+    
+    def sort_box(
+        self,
+        result: np.ndarray,
+        box: tuple,
+        threshold_low: float = 0.25,
+        threshold_high: float = 0.80,
+        sort_direction: Literal['H', 'V'] = 'V',
+        sort_by: str = 'L',
+        reverse_sort: bool = False,
+        region: np.ndarray = None,
+        interval_mode: Literal['threshold', 'edges'] = 'threshold',
+        edge_threshold: float = 0.25
+    ) -> None:
+        """
+        Sort one window of a copy of the pixels in place.
+        
+        Lines are sorted independently, so windows spanning whole columns
+        (vertical) or whole rows (horizontal) of the area being sorted can
+        be processed one after another with the same result as sort().
+        
+        Args:
+            result: Copy of pixel_array to sort into
+            box: (row slice, column slice) window, or None for all pixels
+            region: Optional boolean (H, W) mask of the whole image
+            Other arguments as for sort()
+        """
+        if interval_mode == 'edges':
+            # Gradients need neighbouring pixels, so the plane always covers the image
+            gradient = self.gradient_plane()
+            mask = create_edge_mask(gradient[box] if box else gradient, edge_threshold)
+        else:
+            mask = create_mask(self.key_window('L', box), threshold_low, threshold_high)
+        if region is not None:
+            mask &= region[box] if box else region
+        keys = self.key_window(sort_by, box)
+        window = result[box] if box else result
+        
         if sort_direction == 'V':
-            return self._process_vertical(result, threshold_low, threshold_high, sort_by, reverse_sort)
-        return self._process_horizontal(result, threshold_low, threshold_high, sort_by, reverse_sort)
+            self._process_vertical(window, mask, keys, reverse_sort)
+        else:
+            self._process_horizontal(window, mask, keys, reverse_sort)
     
     def to_image(self, pixel_array: np.ndarray) -> Image.Image:
-        """Convert pixel array back to PIL Image."""
+        """Convert pixel array back to an 8-bit PIL Image."""
+        if pixel_array.dtype == np.uint16:
+            return to_8bit(pixel_array)
+        if pixel_array.dtype == np.uint8:
+            return Image.fromarray(pixel_array, mode='RGB')
         clipped = np.clip(pixel_array * 255, 0, 255).astype(np.uint8)
         return Image.fromarray(clipped, mode='RGB')
+    
+    def save(self, pixel_array: np.ndarray, fp, format: str = 'PNG') -> None:
+        """
+        Encode a sorted pixel array, keeping 16 bits per channel if it has them.
+        
+        Args:
+            pixel_array: Array returned by sort()
+            fp: Binary file object or path
+            format: 'PNG' or 'TIFF' (8-bit arrays take any PIL format)
+        """
+        if pixel_array.dtype == np.uint16:
+            if isinstance(fp, str):
+                with open(fp, 'wb') as out:
+                    save_high_bit(pixel_array, out, format)
+            else:
+                save_high_bit(pixel_array, fp, format)
+        else:
+            self.to_image(pixel_array).save(fp, format=format)
@@ -0,0 +1,97 @@
+"""
+Deep-zoom tile pyramids - Deep Zoom (DZI) geometry and level reduction.
+
+Level 0 of a pyramid is 1x1 pixel and the top level is the full image;
+each level is half the size of the one above it, rounded up, so every
+level is built from the one above by one 2x reduce. Levels are cut into
+square tiles that overlap their neighbours by a pixel or two, so viewers
+can scale them without seams.
+"""
+import math
+
+import numpy as np
+
+
+TILE_SIZE = 254
+TILE_OVERLAP = 1
+TILE_FORMAT = 'webp'
+# Source rows reduced per step, so a reduce never holds more than a strip
+REDUCE_CHUNK_ROWS = 512
+
+DZI_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+    'TileSize="{tile_size}" Overlap="{overlap}" Format="{format}">'
+    '<Size Width="{width}" Height="{height}"/></Image>\n'
+)
+
+
+def top_level(size: tuple) -> int:
+    """Level of the full-size image: the number of halvings down to 1x1."""
+    return math.ceil(math.log2(max(max(size), 1)))
+
+
+def level_size(size: tuple, level: int) -> tuple:
+    """(width, height) of a pyramid level."""
+    scale = 2 ** (top_level(size) - level)
+    return (-(-size[0] // scale), -(-size[1] // scale))
+
+
+def tile_box(size: tuple, level: int, col: int, row: int,
+             tile_size: int = TILE_SIZE, overlap: int = TILE_OVERLAP) -> tuple:
+    """
+    Pixel box of a tile within its level, overlap included.
+    
+    Args:
+        size: Full image (width, height)
+        level: Pyramid level, 0 to top_level(size)
+        col, row: Tile position within the level
+    Returns:
+        (left, top, right, bottom)
+    Raises:
+        ValueError: If the level or tile does not exist
+    """
+    if not 0 <= level <= top_level(size):
+        raise ValueError(f'No level {level}')
+    width, height = level_size(size, level)
+    left, top = col * tile_size, row * tile_size
+    if col < 0 or row < 0 or left >= width or top >= height:
+        raise ValueError(f'No tile {col}_{row} on level {level}')
+    return (
+        max(left - overlap, 0), max(top - overlap, 0),
+        min(left + tile_size + overlap, width), min(top + tile_size + overlap, height),
+    )
+
+
+def dzi_descriptor(size: tuple, tile_size: int = TILE_SIZE, overlap: int = TILE_OVERLAP,
+                   format: str = TILE_FORMAT) -> str:
+    """The .dzi XML describing a pyramid of an image."""
+    return DZI_TEMPLATE.format(
+        tile_size=tile_size, overlap=overlap, format=format, width=size[0], height=size[1]
+    )
+
+
+def reduce_half(source: np.ndarray, out: np.ndarray) -> None:
+    """
+    2x box-filter reduce of a uint8 (H, W, C) level into the next one down.
+    
+    Odd edges repeat their last row or column. Works a strip of rows at a
+    time, so source and out can be memory-mapped arrays of any size.
+    
+    Args:
+        source: uint8 (H, W, C) level
+        out: uint8 (ceil(H / 2), ceil(W / 2), C) array to fill
+    """
+    height, width = source.shape[:2]
+    for top in range(0, height, REDUCE_CHUNK_ROWS):
+        strip = source[top:top + REDUCE_CHUNK_ROWS].astype(np.uint16)
+        pad_rows, pad_cols = strip.shape[0] % 2, width % 2
+        if pad_rows or pad_cols:
+            strip = np.pad(strip, ((0, pad_rows), (0, pad_cols), (0, 0)), mode='edge')
+        
+        total = strip[0::2, 0::2] + strip[1::2, 0::2]
+        total += strip[0::2, 1::2]
+        total += strip[1::2, 1::2]
+        total += 2
+        total >>= 2
+        out[top // 2:top // 2 + total.shape[0]] = total
@@ -1,10 +1,13 @@
 """
 LUMINA_SORT Forms
 """
+import zipfile
+
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import AestheticRecipe, ArtPiece
+from .models import AestheticRecipe, ArtPiece, INTERVAL_MODE_CHOICES, sort_key_choices, validate_then_by
+from .services.cache import public_recipes
 
 
 class SignUpForm(UserCreationForm):
@@ -29,6 +32,88 @@ class ImageUploadForm(forms.Form):
     )
 
 
+class CachedRecipeIterator(forms.models.ModelChoiceIterator):
+    """Iterates the cached public recipe list instead of querying."""
+    
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for recipe in public_recipes():
+            yield self.choice(recipe)
+    
+    def __len__(self):
+        return len(public_recipes()) + (self.field.empty_label is not None)
+
+
+class PublicRecipeChoiceField(forms.ModelChoiceField):
+    """Public recipe dropdown served from the listing cache."""
+    iterator = CachedRecipeIterator
+    
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('queryset', AestheticRecipe.objects.filter(is_public=True))
+        super().__init__(*args, **kwargs)
+    
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        for recipe in public_recipes():
+            if str(recipe.pk) == str(value):
+                return recipe
+        return super().to_python(value)
+
+
+class MultipleFileInput(forms.ClearableFileInput):
+    """File input that accepts several files at once."""
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """FileField returning a list of uploaded files."""
+    
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleFileInput())
+        super().__init__(*args, **kwargs)
+    
+    def clean(self, data, initial=None):
+        if isinstance(data, (list, tuple)):
+            return [super(MultipleFileField, self).clean(item, initial) for item in data]
+        return [super().clean(data, initial)] if data else []
+
+
+class BulkUploadForm(forms.Form):
+    """Form for uploading many images, or one ZIP archive of images."""
+    images = MultipleFileField(
+        required=False,
+        label='Select Images'
+    )
+    archive = forms.FileField(
+        required=False,
+        label='Or a ZIP Archive',
+        widget=forms.ClearableFileInput(attrs={'accept': '.zip,application/zip'})
+    )
+    recipe = PublicRecipeChoiceField(
+        required=False,
+        empty_label="-- Don't Render Yet --",
+        label='Render With Recipe'
+    )
+    
+    def clean_archive(self):
+        archive = self.cleaned_data.get('archive')
+        if archive and not zipfile.is_zipfile(archive):
+            raise forms.ValidationError('Upload a valid ZIP archive.')
+        return archive
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('images') and not cleaned_data.get('archive'):
+            raise forms.ValidationError('Select some images or a ZIP archive.')
+        return cleaned_data
+
+
+def then_by_choices():
+    return [('', '-- Nothing --')] + sort_key_choices()
+
+
 class ProcessingForm(forms.Form):
     """Form for setting pixel sorting parameters."""
     DIRECTION_CHOICES = [
@@ -36,15 +121,6 @@ class ProcessingForm(forms.Form):
         ('H', 'Horizontal'),
     ]
     
-    SORT_BY_CHOICES = [
-        ('L', 'Luminosity'),
-        ('H', 'Hue'),
-        ('S', 'Saturation'),
-        ('R', 'Red Channel'),
-        ('G', 'Green Channel'),
-        ('B', 'Blue Channel'),
-    ]
-    
     threshold_low = forms.FloatField(
         min_value=0.0,
         max_value=1.0,
@@ -73,6 +149,29 @@ class ProcessingForm(forms.Form):
         label='Threshold High'
     )
     
+    interval_mode = forms.ChoiceField(
+        choices=INTERVAL_MODE_CHOICES,
+        required=False,
+        initial='threshold',
+        widget=forms.RadioSelect(attrs={'class': 'radio-group'}),
+        label='Intervals'
+    )
+    
+    edge_threshold = forms.FloatField(
+        required=False,
+        min_value=0.0,
+        max_value=1.0,
+        initial=0.25,
+        widget=forms.NumberInput(attrs={
+            'type': 'range',
+            'min': '0',
+            'max': '1',
+            'step': '0.01',
+            'class': 'slider'
+        }),
+        label='Edge Threshold'
+    )
+    
     sort_direction = forms.ChoiceField(
         choices=DIRECTION_CHOICES,
         initial='V',
@@ -80,23 +179,140 @@ class ProcessingForm(forms.Form):
     )
     
     sort_by = forms.ChoiceField(
-        choices=SORT_BY_CHOICES,
+        choices=sort_key_choices,
         initial='L',
         widget=forms.Select(attrs={'class': 'select-input'})
     )
     
+    then_by = forms.CharField(
+        required=False,
+        max_length=5,
+        validators=[validate_then_by],
+        widget=forms.Select(
+            choices=then_by_choices,
+            attrs={'class': 'select-input'}
+        ),
+        label='Then By'
+    )
+    
     reverse_sort = forms.BooleanField(
         required=False,
         initial=False,
         label='Reverse Sort Order'
     )
     
-    recipe = forms.ModelChoiceField(
-        queryset=AestheticRecipe.objects.filter(is_public=True),
+    progressive = forms.BooleanField(
+        required=False,
+        initial=True,
+        label='Show the Render as It Happens'
+    )
+    
+    recipe = PublicRecipeChoiceField(
         required=False,
         empty_label="-- Use Custom Settings --",
         label='Or Use a Recipe'
     )
+    
+    region_rect = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={'placeholder': 'e.g., 10, 20, 60, 80'}),
+        label='Rectangle (left, top, right, bottom in %)'
+    )
+    
+    region_polygon = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={'placeholder': 'e.g., 50,10 90,90 10,90'}),
+        label='Polygon (x,y points in %)'
+    )
+    
+    region_mask = forms.ImageField(
+        required=False,
+        label='Brush Mask (transparent or black areas are left alone)'
+    )
+    
+    def clean_region_rect(self):
+        value = self.cleaned_data.get('region_rect', '').strip()
+        if not value:
+            return None
+        try:
+            left, top, right, bottom = [float(part) / 100 for part in value.split(',')]
+        except ValueError:
+            raise forms.ValidationError('Enter four comma-separated percentages.')
+        if not (0 <= left < right <= 1 and 0 <= top < bottom <= 1):
+            raise forms.ValidationError('The rectangle must lie within 0-100% and not be empty.')
+        return [left, top, right, bottom]
+    
+    def clean_region_polygon(self):
+        value = self.cleaned_data.get('region_polygon', '').strip()
+        if not value:
+            return None
+        try:
+            points = [[float(n) / 100 for n in point.split(',')] for point in value.split()]
+        except ValueError:
+            raise forms.ValidationError('Enter points as x,y percentages separated by spaces.')
+        if len(points) < 3 or any(len(point) != 2 for point in points):
+            raise forms.ValidationError('A polygon needs at least three x,y points.')
+        if any(not 0 <= n <= 1 for point in points for n in point):
+            raise forms.ValidationError('Polygon points must lie within 0-100%.')
+        return points
+
+
+class AnimationForm(forms.Form):
+    """Form for exporting a threshold sweep as an animation."""
+    SWEEP_CHOICES = [
+        ('threshold_high', 'Threshold High'),
+        ('threshold_low', 'Threshold Low'),
+        ('window', 'Whole Window'),
+    ]
+    
+    FORMAT_CHOICES = [
+        ('webp', 'WebP'),
+        ('apng', 'APNG'),
+        ('gif', 'GIF'),
+    ]
+    
+    sweep = forms.ChoiceField(
+        choices=SWEEP_CHOICES,
+        initial='threshold_high',
+        widget=forms.Select(attrs={'class': 'select-input'})
+    )
+    
+    start = forms.FloatField(min_value=0.0, max_value=1.0, initial=0.30)
+    end = forms.FloatField(min_value=0.0, max_value=1.0, initial=1.00)
+    
+    frames = forms.IntegerField(min_value=2, max_value=120, initial=24)
+    duration = forms.IntegerField(
+        min_value=20,
+        max_value=2000,
+        initial=80,
+        help_text='Milliseconds per frame'
+    )
+    
+    alternate_direction = forms.BooleanField(
+        required=False,
+        initial=False,
+        label='Alternate Sort Direction'
+    )
+    
+    format_type = forms.ChoiceField(
+        choices=FORMAT_CHOICES,
+        initial='webp',
+        widget=forms.Select(attrs={'class': 'select-input'})
+    )
+
+
+def preset_choices():
+    from .engine import EXPORT_PRESETS
+    return [(name, preset.label) for name, preset in EXPORT_PRESETS.items()]
+
+
+class ExportPresetsForm(forms.Form):
+    """Form for exporting several presets at once."""
+    presets = forms.MultipleChoiceField(
+        choices=preset_choices,
+        widget=forms.CheckboxSelectMultiple,
+        label='Presets'
+    )
 
 
 class RecipeForm(forms.ModelForm):
@@ -106,7 +322,8 @@ class RecipeForm(forms.ModelForm):
         model = AestheticRecipe
         fields = [
             'name', 'description', 'threshold_low', 'threshold_high',
-            'sort_direction', 'sort_by', 'reverse_sort', 'is_public'
+            'interval_mode', 'edge_threshold', 'sort_direction', 'sort_by', 'then_by',
+            'reverse_sort', 'is_public'
         ]
         widgets = {
             'name': forms.TextInput(attrs={'placeholder': 'e.g., Cyberpunk Melt'}),
@@ -117,6 +334,10 @@ class RecipeForm(forms.ModelForm):
             'threshold_high': forms.NumberInput(attrs={
                 'type': 'range', 'min': '0', 'max': '1', 'step': '0.01', 'class': 'slider'
             }),
+            'interval_mode': forms.RadioSelect(),
+            'edge_threshold': forms.NumberInput(attrs={
+                'type': 'range', 'min': '0', 'max': '1', 'step': '0.01', 'class': 'slider'
+            }),
             'sort_direction': forms.RadioSelect(),
             'sort_by': forms.Select(attrs={'class': 'select-input'}),
         }
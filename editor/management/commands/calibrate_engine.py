@@ -0,0 +1,67 @@
+"""
+Fit the render cost model to this machine.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from ...engine import calibrate
+from ...engine.backends import available_backends, get_backend
+from ...engine.costmodel import calibration_params
+from ...services.costs import model_path, save_model
+
+
+class Command(BaseCommand):
+    help = (
+        'Time PixelSorter renders of synthetic images on this machine, fit '
+        'the render cost model to them and store it in LUMINA_COST_MODEL. '
+        'Run it on the hosts that serve renders; it takes several minutes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=available_backends(),
+                            help='Engine backend to calibrate (defaults to the configured one).')
+        parser.add_argument('--size', action='append', default=[], metavar='WxH',
+                            help='Test image size (repeatable; defaults to 480x360, '
+                                 '960x720 and 1600x1200).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Fit and report, but do not store the model.')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [tuple(int(n) for n in size.lower().split('x')) for size in options['size']]
+        except ValueError:
+            raise CommandError('Sizes look like 1280x960.')
+        sizes = sizes or [(480, 360), (960, 720), (1600, 1200)]
+        backend = get_backend(options['backend']).name
+
+        total = len(sizes) * 2 * len(calibration_params())
+        done = 0
+        started = time.perf_counter()
+
+        def progress(sample):
+            nonlocal done
+            done += 1
+            if done % 10 == 0 or done == total:
+                self.stdout.write(f'[{done}/{total}] {time.perf_counter() - started:.0f}s')
+
+        self.stdout.write(f'Calibrating the {backend} backend with {total} renders...')
+        model = calibrate(sizes, backend=backend, progress=progress)
+
+        self.stdout.write('Seconds per unit:')
+        for name, coef in model.time.items():
+            self.stdout.write(f'  {name:16} {coef:.6f}')
+        self.stdout.write('Bytes per unit:')
+        for name, coef in model.memory.items():
+            self.stdout.write(f'  {name:16} {coef:.1f}')
+        example = model.predict(12_000_000, 6_000_000, 60_000, 'H')
+        self.stdout.write(
+            f'Mean error {model.error:.1%}. A 12 MP hue sort of half the image: '
+            f'{example.seconds:.2f}s, {filesizeformat(example.peak_bytes)} peak.'
+        )
+
+        if options['dry_run']:
+            return
+        save_model(model)
+        self.stdout.write(self.style.SUCCESS(f'Saved the {backend} model to {model_path()}.'))
@@ -0,0 +1,94 @@
+"""
+Garbage-collect media files no ArtPiece references any more.
+"""
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from ...models import ArtPiece
+from ...services.media import MEDIA_FIELDS, referenced_names
+from ...services.rendering import gradient_root
+from ...services.tiles import tile_root
+from ...storage import INCOMING_DIR, source_id
+
+
+class Command(BaseCommand):
+    help = 'Delete media files that are not referenced by any ArtPiece.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report what would be deleted.'
+        )
+        parser.add_argument(
+            '--grace', type=int, default=None,
+            help='Keep files modified within this many seconds '
+                 '(defaults to LUMINA_MEDIA_GRACE_SECONDS).'
+        )
+
+    def handle(self, *args, dry_run=False, grace=None, **options):
+        if grace is None:
+            grace = getattr(settings, 'LUMINA_MEDIA_GRACE_SECONDS', 3600)
+        cutoff = time.time() - grace
+        root = default_storage.location
+        referenced = referenced_names()
+
+        deleted = kept = freed = 0
+        for path in self._media_files(root):
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            stat = os.stat(path)
+
+            # Leftover temp files from interrupted writes are always garbage
+            incoming = name.startswith(INCOMING_DIR + '/')
+            if (name in referenced and not incoming) or stat.st_mtime > cutoff:
+                kept += 1
+                continue
+
+            if not dry_run:
+                os.remove(path)
+            deleted += 1
+            freed += stat.st_size
+
+        # Tile pyramids of renders nothing references any more
+        sources = {source_id(name) for name in referenced}
+        pyramids = 0
+        for entry in os.scandir(tile_root()) if os.path.isdir(tile_root()) else ():
+            if entry.is_dir() and entry.name not in sources and entry.stat().st_mtime <= cutoff:
+                if not dry_run:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                pyramids += 1
+
+        # Gradient planes of originals nothing references any more
+        gradients = 0
+        for entry in os.scandir(gradient_root()) if os.path.isdir(gradient_root()) else ():
+            source = os.path.splitext(entry.name)[0]
+            if entry.is_file() and source not in sources and entry.stat().st_mtime <= cutoff:
+                if not dry_run:
+                    os.remove(entry.path)
+                gradients += 1
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} file(s), {freed / 1e6:.1f} MB, {pyramids} tile pyramid(s) '
+            f'and {gradients} gradient plane(s); kept {kept}.'
+        ))
+
+    def _media_files(self, root):
+        """Yield every file under the directories ArtPiece fields upload into."""
+        prefixes = {INCOMING_DIR}
+        prefixes.update(
+            ArtPiece._meta.get_field(field).upload_to.strip('/') for field in MEDIA_FIELDS
+        )
+
+        seen = set()
+        for prefix in sorted(prefixes):
+            for directory, _, files in os.walk(os.path.join(root, prefix)):
+                for filename in files:
+                    path = os.path.join(directory, filename)
+                    if path not in seen:
+                        seen.add(path)
+                        yield path
@@ -0,0 +1,454 @@
+"""
+Load-test the upload, process and export path with concurrent virtual users.
+"""
+import http.cookiejar
+import io
+import json
+import re
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+from PIL import Image
+
+from ...models import AestheticRecipe
+
+
+USER_PREFIX = 'loadtest-'
+# Steps of one virtual user journey, in report order
+STEPS = ('public_gallery', 'upload', 'process_page', 'process', 'result', 'export', 'gallery')
+# SQLite serializes writers: a write this slow spent most of it waiting for the lock
+LOCK_WAIT_SECONDS = 0.05
+PERCENTILES = (50, 90, 99)
+
+
+class DatabaseMeter:
+    """Times write statements on every database connection of this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.write_seconds = []
+        self.locked_errors = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip()[:6].upper() not in ('INSERT', 'UPDATE', 'DELETE'):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if 'locked' in str(e):
+                with self.lock:
+                    self.locked_errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.write_seconds.append(elapsed)
+
+    def attach(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def install(self):
+        connection_created.connect(self.attach)
+        for connection in connections.all(initialized_only=True):
+            self.attach(connection=connection)
+
+    def uninstall(self):
+        connection_created.disconnect(self.attach)
+        for connection in connections.all(initialized_only=True):
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+    def report(self) -> dict:
+        writes = np.array(self.write_seconds or [0.0])
+        slow = writes[writes > LOCK_WAIT_SECONDS]
+        return {
+            'writes': len(self.write_seconds),
+            'write_ms': {f'p{p}': round(float(np.percentile(writes, p)) * 1000, 1) for p in PERCENTILES},
+            'lock_waits': len(slow),
+            'lock_wait_seconds': round(float(slow.sum()), 2),
+            'locked_errors': self.locked_errors,
+        }
+
+
+class ClientSession:
+    """A virtual user served in this process by the Django test client."""
+
+    def __init__(self, user):
+        host = next((host for host in settings.ALLOWED_HOSTS if '*' not in host), 'localhost')
+        self.client = Client(HTTP_HOST=host.lstrip('.'))
+        self.client.force_login(user)
+
+    def request(self, method: str, path: str, fields: dict = None, files: dict = None) -> tuple:
+        if method == 'GET':
+            response = self.client.get(path)
+        else:
+            data = dict(fields or {})
+            for name, (filename, content) in (files or {}).items():
+                upload = io.BytesIO(content)
+                upload.name = filename
+                data[name] = upload
+            response = self.client.post(path, data)
+        if response.streaming and response.is_async:
+            size = async_to_sync(_consume)(response.streaming_content)
+        elif response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        response.close()
+        return response.status_code, response.get('Location', ''), size
+
+
+async def _consume(chunks) -> int:
+    return sum([len(chunk) async for chunk in chunks])
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """A virtual user talking HTTP to a running server."""
+
+    def __init__(self, base_url: str, username: str, password: str, timeout: float):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect
+        )
+        self.request('GET', reverse('login'))
+        status, location, _ = self.request(
+            'POST', reverse('login'), {'username': username, 'password': password}
+        )
+        if status != 302:
+            raise CommandError(f'Could not log in as {username} at {self.base_url} (HTTP {status}).')
+
+    def _csrf_token(self) -> str:
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def request(self, method: str, path: str, fields: dict = None, files: dict = None) -> tuple:
+        url = self.base_url + path
+        headers = {}
+        body = None
+        if method == 'POST':
+            fields = dict(fields or {}, csrfmiddlewaretoken=self._csrf_token())
+            headers['Referer'] = url
+            if files:
+                boundary = uuid.uuid4().hex
+                body = _multipart(boundary, fields, files)
+                headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+            else:
+                body = urllib.parse.urlencode(fields).encode()
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            with self.opener.open(urllib.request.Request(url, body, headers, method=method),
+                                  timeout=self.timeout) as response:
+                return response.status, response.headers.get('Location', ''), len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('Location', ''), len(e.read())
+
+
+def _multipart(boundary: str, fields: dict, files: dict) -> bytes:
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for name, (filename, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: image/png\r\n\r\n'.encode() + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed load-test users, recipes and images, then drive concurrent virtual users '
+        'through upload, process, result, export and the galleries. Runs the app in this '
+        'process by default (so database write lock waits can be measured), or against '
+        'a running server with --url. Reports latency percentiles, throughput and errors, '
+        'and deletes what it seeded when done. Refuses to run without DEBUG unless '
+        '--allow-non-debug is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=4, help='Concurrent virtual users.')
+        parser.add_argument('--duration', type=float, default=60.0,
+                            help='Seconds to run (ignored with --iterations).')
+        parser.add_argument('--iterations', type=int, default=None,
+                            help='Journeys per virtual user instead of a fixed duration.')
+        parser.add_argument('--ramp-up', type=float, default=0.0,
+                            help='Seconds over which virtual users start.')
+        parser.add_argument('--size', default='1024x768', metavar='WxH',
+                            help='Size of the generated upload images.')
+        parser.add_argument('--recipes', type=int, default=5, help='Private recipes to seed.')
+        parser.add_argument('--recipe-share', type=float, default=0.5,
+                            help="Share of renders that reuse a seeded recipe's settings instead of random ones.")
+        parser.add_argument('--url', metavar='URL',
+                            help='Base URL of a running server sharing this database, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--timeout', type=float, default=300.0, help='HTTP timeout in seconds (--url).')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', metavar='FILE', help='Also write the report as JSON.')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the load-test users, their art and recipes, and exit.')
+        parser.add_argument('--allow-non-debug', action='store_true',
+                            help='Run even though DEBUG is off, e.g. against a staging database.')
+
+    def handle(self, *args, **options):
+        if not (settings.DEBUG or options['allow_non_debug']):
+            raise CommandError(
+                'loadtest creates and deletes users in this database; run it with DEBUG on '
+                'or pass --allow-non-debug.'
+            )
+        if options['cleanup']:
+            self._cleanup()
+            return
+        try:
+            width, height = (int(value) for value in options['size'].lower().split('x'))
+        except ValueError:
+            raise CommandError('--size must look like 1024x768.')
+        if options['users'] < 1:
+            raise CommandError('--users must be at least 1.')
+
+        # A fresh password per run, so the seeded accounts are never left with a known one
+        password = secrets.token_urlsafe(16)
+        try:
+            users = self._seed_users(options['users'], password)
+            recipes = self._seed_recipes(users[0], options['recipes'], options['seed'])
+            self._run(users, password, recipes, width, height, options)
+        finally:
+            self._cleanup()
+
+    def _run(self, users, password, recipes, width, height, options):
+        self.stdout.write(
+            f'{len(users)} virtual user(s), {len(recipes)} recipe(s), {width}x{height} images, '
+            + (f'against {options["url"]}.' if options['url'] else 'in process.')
+        )
+
+        meter = None if options['url'] else DatabaseMeter()
+        if meter:
+            meter.install()
+        samples = defaultdict(list)
+        errors = defaultdict(list)
+        journeys = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['ramp_up'] + options['duration']
+
+        def record(step, seconds, error=None):
+            with lock:
+                samples[step].append(seconds)
+                if error:
+                    errors[step].append(error)
+
+        def virtual_user(index, user):
+            time.sleep(options['ramp_up'] * index / len(users))
+            rng = np.random.default_rng(options['seed'] * 1000 + index)
+            try:
+                session = (HttpSession(options['url'], user.username, password, options['timeout'])
+                           if options['url'] else ClientSession(user))
+                count = 0
+                while (count < options['iterations'] if options['iterations'] is not None
+                       else time.monotonic() < deadline):
+                    image = _noise_png(rng, width, height)
+                    if self._journey(session, rng, image, recipes, options['recipe_share'], record):
+                        with lock:
+                            journeys.append(time.monotonic())
+                    count += 1
+            except Exception as e:
+                record('session', 0.0, f'{type(e).__name__}: {e}')
+            finally:
+                close_old_connections()
+
+        started = time.monotonic()
+        threads = [
+            threading.Thread(target=virtual_user, args=(index, user), name=f'loadtest-{index}')
+            for index, user in enumerate(users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        if meter:
+            meter.uninstall()
+
+        report = self._report(samples, errors, len(journeys), elapsed, meter)
+        self._print(report)
+        if options['json']:
+            with open(options['json'], 'w') as fp:
+                json.dump(report, fp, indent=2)
+
+    # ------------------------------------------------------------------
+    # Seeding
+
+    def _seed_users(self, count, password):
+        users = []
+        for index in range(count):
+            user, _ = User.objects.get_or_create(username=f'{USER_PREFIX}{index}')
+            user.set_password(password)
+            user.save()
+            users.append(user)
+        return users
+
+    def _seed_recipes(self, creator, count, seed):
+        rng = np.random.default_rng(seed)
+        recipes = list(AestheticRecipe.objects.filter(
+            creator=creator, name__startswith='Load test', is_public=False
+        ))
+        for index in range(len(recipes), count):
+            low = float(rng.uniform(0.05, 0.4))
+            recipes.append(AestheticRecipe.objects.create(
+                name=f'Load test {index + 1}',
+                creator=creator,
+                threshold_low=round(low, 2),
+                threshold_high=round(float(rng.uniform(low + 0.2, 1.0)), 2),
+                sort_direction=str(rng.choice(['V', 'H'])),
+                sort_by=str(rng.choice(list('LHS'))),
+                is_public=False,
+            ))
+        return recipes[:count]
+
+    def _cleanup(self):
+        users = User.objects.filter(username__startswith=USER_PREFIX)
+        recipes, _ = AestheticRecipe.objects.filter(creator__in=users).delete()
+        count = users.count()
+        users.delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {count} load-test user(s) with their art, and {recipes} recipe(s).'
+        ))
+
+    # ------------------------------------------------------------------
+    # One journey
+
+    def _journey(self, session, rng, image, recipes, recipe_share, record) -> bool:
+        """Upload, render and export one image; False once a step fails."""
+
+        def step(name, method, path, fields=None, files=None, expect=200):
+            started = time.perf_counter()
+            try:
+                status, location, _ = session.request(method, path, fields, files)
+            except Exception as e:
+                record(name, time.perf_counter() - started, f'{type(e).__name__}: {e}')
+                return None
+            error = None if status == expect else f'HTTP {status}'
+            record(name, time.perf_counter() - started, error)
+            return None if error else (location or path)
+
+        step('public_gallery', 'GET', reverse('public_gallery'))
+        location = step('upload', 'POST', reverse('upload'), {'title': 'Load test'},
+                        {'image': ('loadtest.png', image)}, expect=302)
+        match = re.search(r'/process/(\d+)/', location or '')
+        if not match:
+            return False
+        art_id = int(match.group(1))
+        if not step('process_page', 'GET', reverse('process', args=[art_id])):
+            return False
+
+        low = float(rng.uniform(0.05, 0.4))
+        fields = {
+            'threshold_low': round(low, 2),
+            'threshold_high': round(float(rng.uniform(low + 0.2, 1.0)), 2),
+            'sort_direction': str(rng.choice(['V', 'H'])),
+            'sort_by': str(rng.choice(list('LHS'))),
+        }
+        if recipes and rng.random() < recipe_share:
+            # The seeded recipes are private, so their settings are submitted directly
+            recipe = recipes[int(rng.integers(len(recipes)))]
+            fields.update({name: getattr(recipe, name) for name in fields})
+        if not step('process', 'POST', reverse('process', args=[art_id]), fields, expect=302):
+            return False
+        ok = step('result', 'GET', reverse('result', args=[art_id]))
+        ok = step('export', 'GET', reverse('export', args=[art_id, 'story'])) and ok
+        ok = step('gallery', 'GET', reverse('gallery')) and ok
+        return bool(ok)
+
+    # ------------------------------------------------------------------
+    # Reporting
+
+    def _report(self, samples, errors, journeys, elapsed, meter) -> dict:
+        steps = {}
+        for name in [*STEPS, *sorted(set(samples) - set(STEPS))]:
+            if name not in samples:
+                continue
+            seconds = np.array(samples[name])
+            failed = errors.get(name, [])
+            steps[name] = {
+                'requests': len(seconds),
+                'errors': len(failed),
+                'error_rate': round(len(failed) / len(seconds), 4),
+                **{f'p{p}_ms': round(float(np.percentile(seconds, p)) * 1000, 1) for p in PERCENTILES},
+                'max_ms': round(float(seconds.max()) * 1000, 1),
+                'per_second': round(len(seconds) / elapsed, 2) if elapsed else 0.0,
+                'sample_errors': sorted(set(failed))[:5],
+            }
+        requests = sum(step['requests'] for step in steps.values())
+        return {
+            'elapsed_seconds': round(elapsed, 1),
+            'requests': requests,
+            'requests_per_second': round(requests / elapsed, 2) if elapsed else 0.0,
+            'journeys': journeys,
+            'journeys_per_minute': round(journeys * 60 / elapsed, 2) if elapsed else 0.0,
+            'error_rate': round(sum(step['errors'] for step in steps.values()) / requests, 4) if requests else 0.0,
+            'steps': steps,
+            'database': meter.report() if meter else None,
+        }
+
+    def _print(self, report):
+        header = f'{"step":<16}{"reqs":>7}{"err%":>7}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"max ms":>10}{"req/s":>8}'
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, step in report['steps'].items():
+            self.stdout.write(
+                f'{name:<16}{step["requests"]:>7}{step["error_rate"] * 100:>7.1f}'
+                f'{step["p50_ms"]:>10.1f}{step["p90_ms"]:>10.1f}{step["p99_ms"]:>10.1f}'
+                f'{step["max_ms"]:>10.1f}{step["per_second"]:>8.2f}'
+            )
+            for error in step['sample_errors']:
+                self.stdout.write(self.style.WARNING(f'    {error}'))
+
+        self.stdout.write(
+            f'\n{report["requests"]} requests in {report["elapsed_seconds"]} s: '
+            f'{report["requests_per_second"]} req/s, {report["journeys"]} complete journeys '
+            f'({report["journeys_per_minute"]}/min), {report["error_rate"] * 100:.1f}% errors.'
+        )
+        database = report['database']
+        if database is None:
+            self.stdout.write('Database lock waits are only measured in process (without --url).')
+        else:
+            write_ms = database['write_ms']
+            self.stdout.write(
+                f'Database: {database["writes"]} writes, p50 {write_ms["p50"]} ms, p99 {write_ms["p99"]} ms; '
+                f'{database["lock_waits"]} lock waits (writes over {LOCK_WAIT_SECONDS * 1000:.0f} ms, '
+                f'{database["lock_wait_seconds"]} s in total), '
+                f'{database["locked_errors"]} "database is locked" errors.'
+            )
+
+
+def _noise_png(rng, width: int, height: int) -> bytes:
+    """A distinct PNG per journey, so neither storage nor the render cache dedupes it."""
+    base = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    noise = rng.integers(0, 64, (height, width, 3), dtype=np.uint8)
+    pixels = (base * rng.uniform(0.3, 1.0, 3) + noise).clip(0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
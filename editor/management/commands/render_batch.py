@@ -0,0 +1,223 @@
+"""
+Render many images offline through process_image() in a process pool.
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
+
+from ...engine import render_file
+from ...models import AestheticRecipe, ArtPiece
+from ...services.bulk import IMAGE_EXTENSIONS
+from ...services.media import save_stream
+from ...startup import tiny_render
+
+
+class Command(BaseCommand):
+    help = (
+        'Render input directories or ArtPieces with one or more recipes. '
+        'Finished outputs are skipped, so an interrupted run can simply be '
+        'started again. Offline renders do not count towards recipe usage.'
+    )
+
+    def add_arguments(self, parser):
+        sources = parser.add_argument_group('sources')
+        sources.add_argument('--input', action='append', default=[], metavar='DIR',
+                             help='Directory of images to render (repeatable).')
+        sources.add_argument('--art-piece', action='append', type=int, default=[], metavar='ID',
+                             help='ArtPiece id to render (repeatable).')
+        sources.add_argument('--user', metavar='USERNAME',
+                             help="Render all of this user's ArtPieces.")
+        sources.add_argument('--all', action='store_true',
+                             help='Render every ArtPiece.')
+        sources.add_argument('--missing', action='store_true',
+                             help='Only ArtPieces without a processed image.')
+
+        parser.add_argument('--recipe', action='append', type=int, default=[], metavar='ID',
+                            help='Recipe id to render with (repeatable). ArtPieces default '
+                                 'to their own effective parameters.')
+        parser.add_argument('--output-dir', metavar='DIR',
+                            help='Write PNGs here instead of into ArtPiece storage.')
+        parser.add_argument('--manifest', metavar='FILE',
+                            help='Storage mode: record finished renders here and skip '
+                                 'them on the next run.')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-render outputs that already exist.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        output_dir = options['output_dir']
+        recipes = list(AestheticRecipe.objects.filter(id__in=options['recipe']))
+        if len(recipes) != len(set(options['recipe'])):
+            raise CommandError('Unknown recipe id.')
+        if options['input'] and not output_dir:
+            raise CommandError('--input requires --output-dir.')
+        if not output_dir and len(recipes) > 1:
+            raise CommandError('Rendering into storage takes at most one --recipe.')
+
+        tasks = list(self._file_tasks(options['input'], recipes, output_dir))
+        tasks += list(self._art_piece_tasks(options, recipes, output_dir))
+        if not tasks:
+            raise CommandError('Nothing to render; pass --input, --art-piece, --user or --all.')
+
+        manifest = self._read_manifest(options['manifest'])
+        todo = [task for task in tasks if options['force'] or not self._is_done(task, manifest)]
+        self.stdout.write(f'{len(tasks)} render(s), {len(tasks) - len(todo)} already done.')
+        if not todo:
+            return
+
+        self._run(todo, options['workers'], options['manifest'])
+
+    # ------------------------------------------------------------------
+    # Task building
+
+    def _file_tasks(self, directories, recipes, output_dir):
+        if directories and not recipes:
+            raise CommandError('--input requires at least one --recipe.')
+        for directory in directories:
+            for root, _, files in os.walk(directory):
+                for filename in sorted(files):
+                    if os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+                        continue
+                    source = os.path.join(root, filename)
+                    stem = os.path.splitext(os.path.relpath(source, directory))[0]
+                    for recipe in recipes:
+                        yield {
+                            'label': source,
+                            'source': source,
+                            'destination': os.path.join(output_dir, str(recipe.id), stem + '.png'),
+                            'params': recipe.get_params(),
+                        }
+
+    def _art_piece_tasks(self, options, recipes, output_dir):
+        queryset = ArtPiece.objects.select_related('recipe_used')
+        if options['art_piece']:
+            queryset = queryset.filter(id__in=options['art_piece'])
+        elif options['user']:
+            queryset = queryset.filter(user__username=options['user'])
+        elif not options['all']:
+            return
+        if options['missing']:
+            queryset = queryset.filter(Q(processed_image='') | Q(processed_image__isnull=True))
+
+        for art_piece in queryset.order_by('id').iterator():
+            region = art_piece.get_region()
+            for recipe in recipes or [None]:
+                params = recipe.get_params() if recipe else art_piece.get_effective_params()
+                if region:
+                    params['region'] = region
+                folder = str(recipe.id) if recipe else 'effective'
+                yield {
+                    'label': f'ArtPiece #{art_piece.id}',
+                    'source': art_piece.original_image.path,
+                    'destination': (
+                        os.path.join(output_dir, folder, f'{art_piece.id}.png') if output_dir else None
+                    ),
+                    'params': params,
+                    'art_piece': art_piece.id,
+                    'recipe': recipe.id if recipe else None,
+                }
+
+    # ------------------------------------------------------------------
+    # Resume support
+
+    def _read_manifest(self, path):
+        done = set()
+        if path and os.path.exists(path):
+            with open(path) as fp:
+                for line in fp:
+                    entry = json.loads(line)
+                    done.add((entry['art_piece'], entry['recipe']))
+        return done
+
+    def _is_done(self, task, manifest):
+        if task['destination']:
+            return os.path.exists(task['destination'])
+        return (task['art_piece'], task['recipe']) in manifest
+
+    # ------------------------------------------------------------------
+    # Rendering
+
+    def _run(self, tasks, workers, manifest_path):
+        scratch = tempfile.mkdtemp(prefix='render_batch_')
+        manifest = open(manifest_path, 'a') if manifest_path else None
+        # Forked workers must not inherit open database connections. The
+        # engine loads lazily: run it once here, so every worker starts with
+        # it imported and compiled instead of paying for that itself
+        connections.close_all()
+        tiny_render()
+
+        started = time.perf_counter()
+        megapixels = 0.0
+        failures = 0
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {}
+                for index, task in enumerate(tasks):
+                    destination = task['destination'] or os.path.join(scratch, f'{index}.png')
+                    futures[pool.submit(render_file, task['source'], destination, task['params'])] = (
+                        task, destination
+                    )
+
+                for done, future in enumerate(as_completed(futures), start=1):
+                    task, destination = futures[future]
+                    try:
+                        mp, seconds = future.result()
+                        if not task['destination']:
+                            self._store(task, destination)
+                            if manifest:
+                                manifest.write(json.dumps(
+                                    {'art_piece': task['art_piece'], 'recipe': task['recipe']}
+                                ) + '\n')
+                                manifest.flush()
+                    except Exception as e:
+                        failures += 1
+                        self.stderr.write(f'[{done}/{len(tasks)}] {task["label"]} failed: {e}')
+                        continue
+
+                    megapixels += mp
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'[{done}/{len(tasks)}] {task["label"]} {mp:.1f} MP in {seconds:.2f}s '
+                        f'({megapixels / elapsed:.2f} MP/s overall)'
+                    )
+        finally:
+            if manifest:
+                manifest.close()
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {len(tasks) - failures} of {len(tasks)} in {elapsed:.1f}s, '
+            f'{megapixels:.1f} MP at {megapixels / elapsed:.2f} MP/s.'
+        ))
+        if failures:
+            raise CommandError(f'{failures} render(s) failed.')
+
+    def _store(self, task, rendered_path):
+        """Move a finished render into the ArtPiece's processed_image."""
+        art_piece = ArtPiece.objects.get(id=task['art_piece'])
+        previous = art_piece.processed_image.name
+        with open(rendered_path, 'rb') as rendered:
+            save_stream(
+                art_piece.processed_image,
+                os.path.basename(rendered_path),
+                lambda fp: shutil.copyfileobj(rendered, fp),
+                save=False
+            )
+        os.remove(rendered_path)
+
+        update_fields = ['processed_image']
+        if art_piece.processed_image.name != previous:
+            art_piece.clear_exports()
+            update_fields += ['export_story', 'export_post', 'export_bundle']
+        if task['recipe']:
+            art_piece.recipe_used_id = task['recipe']
+            update_fields.append('recipe_used')
+        art_piece.save(update_fields=update_fields)
@@ -0,0 +1,129 @@
+"""
+Time worker startup with and without the warm-up of the render path.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+MODES = ('lazy', 'warm')
+
+# Runs in a fresh interpreter per sample, so imports are really cold
+CHILD = '''
+import time
+started = time.perf_counter()
+import json, resource, sys
+from django.conf import settings
+from django.utils.module_loading import import_string
+import_string(settings.WSGI_APPLICATION)
+ready = time.perf_counter() - started
+ready_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+from editor.startup import startup_report, tiny_render
+report = startup_report()
+from django.test import Client
+host = next((host for host in settings.ALLOWED_HOSTS if '*' not in host), 'localhost')
+started = time.perf_counter()
+status = Client(HTTP_HOST=host.lstrip('.')).get(sys.argv[1]).status_code
+page = time.perf_counter() - started
+page_modules = startup_report()['modules']
+renders = []
+for _ in range(2):
+    started = time.perf_counter()
+    tiny_render()
+    renders.append(time.perf_counter() - started)
+json.dump({
+    'ready_ms': ready * 1000,
+    'ready_rss_mb': ready_rss,
+    'warm_up': report['warm_up'],
+    'modules_at_ready': report['modules'],
+    'page_status': status,
+    'first_page_ms': page * 1000,
+    'modules_after_page': page_modules,
+    'first_render_ms': renders[0] * 1000,
+    'next_render_ms': renders[1] * 1000,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}, sys.stdout)
+'''
+
+# Metrics reported as the median over runs, in report order
+METRICS = (
+    ('ready_ms', 'application ready (ms)'),
+    ('ready_rss_mb', 'RSS when ready (MB)'),
+    ('first_page_ms', 'first page (ms)'),
+    ('first_render_ms', 'first render (ms)'),
+    ('next_render_ms', 'next render (ms)'),
+    ('max_rss_mb', 'peak RSS (MB)'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Start the WSGI application in fresh interpreters, lazily and with LUMINA_WARM_UP, '
+        'and report how long each takes to become ready, to serve a page (one that needs no '
+        'engine) and to finish its first and next tiny render, plus its peak memory and the '
+        'NumPy/Pillow/Numba modules it holds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Interpreters started per mode (medians are reported).')
+        parser.add_argument('--path', default='/', help='Page requested after startup.')
+        parser.add_argument('--tables', default=None, metavar='CODES',
+                            help='Sort key tables the warm mode builds (defaults to LUMINA_WARM_UP_TABLES).')
+        parser.add_argument('--json', metavar='FILE', help='Also write the report as JSON.')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs must be at least 1.')
+        tables = options['tables']
+        if tables is None:
+            tables = getattr(settings, 'LUMINA_WARM_UP_TABLES', '')
+
+        report = {}
+        for mode in MODES:
+            env = dict(os.environ, LUMINA_WARM_UP='1' if mode == 'warm' else '0', LUMINA_WARM_UP_TABLES=tables)
+            runs = [self._run(env, options['path']) for _ in range(options['runs'])]
+            report[mode] = {
+                **{key: round(statistics.median(run[key] for run in runs), 1) for key, _ in METRICS},
+                'warm_up': runs[-1]['warm_up'],
+                'page_status': runs[-1]['page_status'],
+                'modules_at_ready': runs[-1]['modules_at_ready'],
+                'modules_after_page': runs[-1]['modules_after_page'],
+            }
+
+        self._print(report, options['path'])
+        if options['json']:
+            with open(options['json'], 'w') as fp:
+                json.dump(report, fp, indent=2)
+
+    def _run(self, env, path):
+        result = subprocess.run(
+            [sys.executable, '-c', CHILD, path],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode:
+            raise CommandError(f'Worker failed to start:\n{result.stderr.strip()}')
+        return json.loads(result.stdout)
+
+    def _print(self, report, path):
+        header = f'{"":<26}' + ''.join(f'{mode:>12}' for mode in MODES)
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for key, label in METRICS:
+            self.stdout.write(f'{label:<26}' + ''.join(f'{report[mode][key]:>12.1f}' for mode in MODES))
+
+        for mode in MODES:
+            result = report[mode]
+            self.stdout.write(
+                f'\n{mode}: {", ".join(result["modules_at_ready"]) or "no engine modules"} at ready, '
+                f'{", ".join(result["modules_after_page"]) or "none"} after {path} ({result["page_status"]}).'
+            )
+            if result['warm_up']:
+                self.stdout.write('  warm-up: ' + ', '.join(
+                    f'{phase} {seconds * 1000:.0f} ms' for phase, seconds in result['warm_up'].items()
+                ))
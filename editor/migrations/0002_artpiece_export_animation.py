@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artpiece',
+            name='export_animation',
+            field=models.FileField(blank=True, null=True, upload_to='exports/animation/'),
+        ),
+    ]
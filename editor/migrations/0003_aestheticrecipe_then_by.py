@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:01
+
+import editor.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0002_artpiece_export_animation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aestheticrecipe',
+            name='then_by',
+            field=models.CharField(blank=True, help_text="Tie-break criteria in order, e.g. 'L' or 'SL'", max_length=5, validators=[editor.models.validate_then_by]),
+        ),
+        migrations.AlterField(
+            model_name='artpiece',
+            name='custom_sort_by',
+            field=models.CharField(blank=True, max_length=6),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0003_aestheticrecipe_then_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artpiece',
+            name='custom_region',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='artpiece',
+            name='region_mask',
+            field=models.ImageField(blank=True, null=True, upload_to='masks/'),
+        ),
+    ]
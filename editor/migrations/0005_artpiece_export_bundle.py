@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0004_artpiece_custom_region_artpiece_region_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artpiece',
+            name='export_bundle',
+            field=models.FileField(blank=True, null=True, upload_to='exports/bundle/'),
+        ),
+    ]
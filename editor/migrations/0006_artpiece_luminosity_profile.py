@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0005_artpiece_export_bundle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artpiece',
+            name='luminosity_profile',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
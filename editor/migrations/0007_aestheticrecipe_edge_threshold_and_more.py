@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0006_artpiece_luminosity_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aestheticrecipe',
+            name='edge_threshold',
+            field=models.FloatField(default=0.25, help_text='Gradient strength that breaks an interval (0-1)'),
+        ),
+        migrations.AddField(
+            model_name='aestheticrecipe',
+            name='interval_mode',
+            field=models.CharField(choices=[('threshold', 'Brightness Window'), ('edges', 'Between Edges')], default='threshold', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='artpiece',
+            name='custom_edge_threshold',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='artpiece',
+            name='custom_interval_mode',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:49
+
+import editor.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0008_renderjob_renderjobitem'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aestheticrecipe',
+            name='sort_by',
+            field=models.CharField(choices=editor.models.sort_key_choices, default='L', max_length=1),
+        ),
+    ]
@@ -2,10 +2,32 @@
 LUMINA_SORT Database Models
 Stores Aesthetic Recipes and Art Pieces
 """
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import User
 
 
+INTERVAL_MODE_CHOICES = [
+    ('threshold', 'Brightness Window'),
+    ('edges', 'Between Edges'),
+]
+
+
+def sort_key_choices():
+    """Registered sort keys; the engine is only imported when they are listed."""
+    from .engine.keys import sort_key_choices
+    return sort_key_choices()
+
+
+def validate_then_by(value):
+    """Tie-break criteria: distinct codes of registered sort keys."""
+    invalid = set(value) - {code for code, _ in sort_key_choices()}
+    if invalid:
+        raise ValidationError(f"Unknown sort criteria: {', '.join(sorted(invalid))}")
+    if len(set(value)) != len(value):
+        raise ValidationError("Each tie-break criterion may only be used once.")
+
+
 class AestheticRecipe(models.Model):
     """
     Stores the "recipe" - the specific math settings used to generate glitch art.
@@ -16,15 +38,6 @@ class AestheticRecipe(models.Model):
         ('V', 'Vertical'),
     ]
     
-    SORT_BY_CHOICES = [
-        ('L', 'Luminosity'),
-        ('H', 'Hue'),
-        ('S', 'Saturation'),
-        ('R', 'Red Channel'),
-        ('G', 'Green Channel'),
-        ('B', 'Blue Channel'),
-    ]
-    
     name = models.CharField(max_length=100, help_text="e.g., 'Cyberpunk Melt'")
     description = models.TextField(blank=True, help_text="Describe the visual effect")
     
@@ -32,7 +45,17 @@ class AestheticRecipe(models.Model):
     threshold_low = models.FloatField(default=0.25, help_text="Lower brightness threshold (0-1)")
     threshold_high = models.FloatField(default=0.80, help_text="Upper brightness threshold (0-1)")
     sort_direction = models.CharField(max_length=1, choices=DIRECTION_CHOICES, default='V')
-    sort_by = models.CharField(max_length=1, choices=SORT_BY_CHOICES, default='L')
+    sort_by = models.CharField(max_length=1, choices=sort_key_choices, default='L')
+    then_by = models.CharField(
+        max_length=5,
+        blank=True,
+        validators=[validate_then_by],
+        help_text="Tie-break criteria in order, e.g. 'L' or 'SL'"
+    )
+    
+    # Intervals: inside the brightness window, or between Sobel edges
+    interval_mode = models.CharField(max_length=10, choices=INTERVAL_MODE_CHOICES, default='threshold')
+    edge_threshold = models.FloatField(default=0.25, help_text="Gradient strength that breaks an interval (0-1)")
     
     # Advanced settings
     interval_random = models.BooleanField(default=False, help_text="Randomize sorting intervals")
@@ -51,11 +74,30 @@ class AestheticRecipe(models.Model):
         verbose_name_plural = "Aesthetic Recipes"
     
     def __str__(self):
-        return f"{self.name} ({self.get_sort_direction_display()}, {self.get_sort_by_display()})"
+        return f"{self.name} ({self.get_sort_direction_display()}, {self.get_sort_keys_display()})"
+    
+    def get_sort_keys_display(self):
+        """Human readable sort order, e.g. 'Hue, then Luminosity'."""
+        labels = dict(sort_key_choices())
+        return ', then '.join(labels[key] for key in self.sort_by + self.then_by if key in labels)
     
     def increment_usage(self):
+        # Atomic, so stale (e.g. cached) instances never lose increments
+        AestheticRecipe.objects.filter(pk=self.pk).update(times_used=models.F('times_used') + 1)
         self.times_used += 1
-        self.save(update_fields=['times_used'])
+    
+    def get_params(self):
+        """Returns this recipe's parameters as process_image() arguments."""
+        params = {
+            'threshold_low': self.threshold_low,
+            'threshold_high': self.threshold_high,
+            'sort_direction': self.sort_direction,
+            'sort_by': self.sort_by + self.then_by,
+            'reverse_sort': self.reverse_sort,
+        }
+        if self.interval_mode == 'edges':
+            params.update(interval_mode='edges', edge_threshold=self.edge_threshold)
+        return params
 
 
 class ArtPiece(models.Model):
@@ -72,6 +114,8 @@ class ArtPiece(models.Model):
     # Export versions
     export_story = models.ImageField(upload_to='exports/story/', blank=True, null=True)  # 9:16
     export_post = models.ImageField(upload_to='exports/post/', blank=True, null=True)    # 4:5
+    export_animation = models.FileField(upload_to='exports/animation/', blank=True, null=True)
+    export_bundle = models.FileField(upload_to='exports/bundle/', blank=True, null=True)  # ZIP of presets
     
     # Recipe used
     recipe_used = models.ForeignKey(
@@ -86,7 +130,16 @@ class ArtPiece(models.Model):
     custom_threshold_low = models.FloatField(null=True, blank=True)
     custom_threshold_high = models.FloatField(null=True, blank=True)
     custom_sort_direction = models.CharField(max_length=1, blank=True)
-    custom_sort_by = models.CharField(max_length=1, blank=True)
+    custom_sort_by = models.CharField(max_length=6, blank=True)
+    custom_interval_mode = models.CharField(max_length=10, blank=True)
+    custom_edge_threshold = models.FloatField(null=True, blank=True)
+    
+    # Region to sort (relative 'rect'/'polygon' coordinates) and optional brush mask
+    custom_region = models.JSONField(null=True, blank=True)
+    region_mask = models.ImageField(upload_to='masks/', blank=True, null=True)
+    
+    # Luminosity histogram and transitions of the original (see luminosity_profile)
+    luminosity_profile = models.JSONField(null=True, blank=True, editable=False)
     
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
@@ -100,20 +153,99 @@ class ArtPiece(models.Model):
     def __str__(self):
         return f"{self.title or 'Untitled'} by {self.user.username}"
     
+    def clear_exports(self):
+        """Forget crops of the previous render; they are rebuilt on the next export."""
+        self.export_story = None
+        self.export_post = None
+        self.export_bundle = None
+    
+    def get_region(self):
+        """Returns the region spec for process_image(), or None for the whole image."""
+        region = dict(self.custom_region or {})
+        if self.region_mask:
+            region['mask'] = self.region_mask.path
+        return region or None
+    
     def get_effective_params(self):
         """Returns the actual parameters used, whether from recipe or custom."""
         if self.recipe_used:
-            return {
-                'threshold_low': self.recipe_used.threshold_low,
-                'threshold_high': self.recipe_used.threshold_high,
-                'sort_direction': self.recipe_used.sort_direction,
-                'sort_by': self.recipe_used.sort_by,
-                'reverse_sort': self.recipe_used.reverse_sort,
+            params = self.recipe_used.get_params()
+        else:
+            params = {
+                'threshold_low': self.custom_threshold_low or 0.25,
+                'threshold_high': self.custom_threshold_high or 0.80,
+                'sort_direction': self.custom_sort_direction or 'V',
+                'sort_by': self.custom_sort_by or 'L',
+                'reverse_sort': False,
             }
-        return {
-            'threshold_low': self.custom_threshold_low or 0.25,
-            'threshold_high': self.custom_threshold_high or 0.80,
-            'sort_direction': self.custom_sort_direction or 'V',
-            'sort_by': self.custom_sort_by or 'L',
-            'reverse_sort': False,
-        }
+            if self.custom_interval_mode == 'edges':
+                params['interval_mode'] = 'edges'
+                params['edge_threshold'] = self.custom_edge_threshold or 0.25
+        region = self.get_region()
+        if region:
+            params['region'] = region
+        return params
+
+
+class RenderJob(models.Model):
+    """
+    A bulk re-render of stored art pieces, started from the admin.
+    Progress is kept per item, so an interrupted job can be resumed.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('cancelled', 'Cancelled'),
+    ]
+    
+    description = models.CharField(max_length=200, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    
+    # Progress counters, updated in bulk as renders finish
+    total = models.PositiveIntegerField(default=0)
+    rendered = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    megapixels = models.FloatField(default=0.0)
+    render_seconds = models.FloatField(default=0.0, help_text="Summed render time of finished items")
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(null=True, blank=True, help_text="Last progress update")
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Render Job"
+        verbose_name_plural = "Render Jobs"
+    
+    def __str__(self):
+        return f"Render job #{self.pk}: {self.description or 'art pieces'}"
+    
+    @property
+    def remaining(self):
+        return max(self.total - self.rendered - self.failed, 0)
+
+
+class RenderJobItem(models.Model):
+    """One art piece of a RenderJob."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    job = models.ForeignKey(RenderJob, on_delete=models.CASCADE, related_name='items')
+    art_piece = models.ForeignKey(ArtPiece, on_delete=models.CASCADE, related_name='render_job_items')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    megapixels = models.FloatField(null=True, blank=True)
+    seconds = models.FloatField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['job', 'status'])]
+    
+    def __str__(self):
+        return f"{self.art_piece_id} in job #{self.job_id}"
@@ -0,0 +1,50 @@
+"""
+LUMINA_SORT Services - Component exports
+
+Exports are imported from their submodule on first access, so importing
+one light service (e.g. the cache helpers) does not load the engine.
+"""
+from importlib import import_module
+
+_EXPORTS = {
+    'get_executor': 'executor',
+    'get_task_executor': 'executor',
+    'submit': 'executor',
+    'submit_task': 'executor',
+    'run_in_executor': 'executor',
+    'stream_from_executor': 'executor',
+    'save_stream': 'media',
+    'save_image': 'media',
+    'release_media': 'media',
+    'referenced_names': 'media',
+    'render_art_piece': 'rendering',
+    'profile_image': 'rendering',
+    'adopt_cached_render': 'rendering',
+    'ingest_uploads': 'bulk',
+    'RenderRejected': 'scheduler',
+    'user_weight': 'scheduler',
+    'get_scheduler': 'scheduler',
+    'schedule': 'scheduler',
+    'run_scheduled': 'scheduler',
+    'predict': 'costs',
+    'predict_animation': 'costs',
+    'get_cost_model': 'costs',
+    'save_model': 'costs',
+    'speculate': 'speculative',
+    'cancel_speculation': 'speculative',
+    'preview_key': 'speculative',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,193 @@
+"""
+Read-only JSON feeds of public art pieces and recipes.
+
+Pages are keyset-paginated, newest first: the opaque cursor encodes the
+(created_at, id) of the last item, so pages stay stable while new items
+arrive. Serialized pages are cached under the time of the last change
+to their model (see last_changed), so any write starts a fresh set of
+pages and stale ones simply expire.
+"""
+import base64
+import binascii
+import hashlib
+import json
+from datetime import datetime
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from ..models import AestheticRecipe, ArtPiece
+from .cache import ART_CHANGED_KEY, RECIPES_CHANGED_KEY, cached, last_changed
+
+
+# Stored derivatives of an art piece, by the name they are listed under
+ART_URLS = {
+    'original': 'original_image',
+    'processed': 'processed_image',
+    'story': 'export_story',
+    'post': 'export_post',
+    'animation': 'export_animation',
+}
+
+ART_FIELDS = ('id', 'title', 'author', 'created_at', 'recipe', 'params', 'urls')
+RECIPE_FIELDS = (
+    'id', 'name', 'description', 'creator', 'sort_keys', 'params', 'times_used',
+    'created_at', 'updated_at'
+)
+
+
+class ApiError(ValueError):
+    """A feed request with invalid query parameters."""
+
+
+class Page(NamedTuple):
+    body: bytes             # JSON of {'results': [...], 'next': url or None}
+    etag: str
+    last_modified: float    # when the feed's model last changed
+
+
+def _art_item(art_piece, build_url) -> dict:
+    params = art_piece.get_effective_params()
+    # Regions may name brush-mask files, which are not part of the public feed
+    params.pop('region', None)
+    return {
+        'id': art_piece.id,
+        'title': art_piece.title,
+        'author': art_piece.user.username,
+        'created_at': art_piece.created_at,
+        'recipe': art_piece.recipe_used_id,
+        'params': params,
+        'urls': {
+            name: build_url(getattr(art_piece, field).url)
+            for name, field in ART_URLS.items() if getattr(art_piece, field)
+        },
+    }
+
+
+def _recipe_item(recipe, build_url) -> dict:
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'description': recipe.description,
+        'creator': recipe.creator.username if recipe.creator else None,
+        'sort_keys': recipe.get_sort_keys_display(),
+        'params': recipe.get_params(),
+        'times_used': recipe.times_used,
+        'created_at': recipe.created_at,
+        'updated_at': recipe.updated_at,
+    }
+
+
+FEEDS = {
+    'art': (
+        ART_CHANGED_KEY, ART_FIELDS, _art_item,
+        lambda: ArtPiece.objects.filter(is_public=True, processed_image__isnull=False)
+        .exclude(processed_image='').select_related('user')
+    ),
+    'recipes': (
+        RECIPES_CHANGED_KEY, RECIPE_FIELDS, _recipe_item,
+        lambda: AestheticRecipe.objects.filter(is_public=True).select_related('creator')
+    ),
+}
+
+
+def encode_cursor(item) -> str:
+    """Opaque cursor pointing just past an item."""
+    raw = json.dumps([item.created_at.isoformat(), item.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(created_at, id) of a cursor; raises ApiError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, pk = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, ValueError, TypeError):
+        raise ApiError('Invalid cursor.')
+
+
+def parse_query(feed: str, query) -> dict:
+    """
+    Validate the query string of a feed request.
+
+    Args:
+        feed: 'art' or 'recipes'
+        query: request.GET
+    Returns:
+        Dict with 'cursor', 'limit' and 'fields' (tuple in feed order)
+    Raises:
+        ApiError: On an unknown field, a bad limit or a bad cursor
+    """
+    allowed = FEEDS[feed][1]
+    default = getattr(settings, 'LUMINA_API_PAGE_SIZE', 20)
+    maximum = getattr(settings, 'LUMINA_API_MAX_PAGE_SIZE', 100)
+
+    try:
+        limit = int(query.get('limit', default))
+    except ValueError:
+        raise ApiError('limit must be an integer.')
+    if not 1 <= limit <= maximum:
+        raise ApiError(f'limit must be between 1 and {maximum}.')
+
+    fields = allowed
+    if query.get('fields'):
+        requested = {name.strip() for name in query['fields'].split(',') if name.strip()}
+        unknown = requested - set(allowed)
+        if unknown:
+            raise ApiError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        fields = tuple(name for name in allowed if name in requested)
+
+    cursor = query.get('cursor') or None
+    if cursor:
+        decode_cursor(cursor)
+    return {'cursor': cursor, 'limit': limit, 'fields': fields}
+
+
+def feed_page(feed: str, query: dict, build_url) -> Page:
+    """
+    One serialized page of a feed, from the cache when nothing changed.
+
+    Args:
+        feed: 'art' or 'recipes'
+        query: Dict from parse_query()
+        build_url: Callable turning a path into the URL clients should use
+    Returns:
+        Page
+    """
+    changed_key, _, _, _ = FEEDS[feed]
+    changed = last_changed(changed_key)
+    # The host goes into the key because pages carry absolute URLs
+    signature = json.dumps([query['cursor'], query['limit'], query['fields'], build_url('/')])
+    key = f'lumina:api:{feed}:{changed!r}:{hashlib.sha256(signature.encode()).hexdigest()[:32]}'
+    return cached(key, lambda: _build_page(feed, query, build_url, changed), stat=f'lumina:api:{feed}')
+
+
+def _build_page(feed: str, query: dict, build_url, changed: float) -> Page:
+    _, _, serialize, queryset = FEEDS[feed]
+    items = queryset().order_by('-created_at', '-id')
+    if query['cursor']:
+        created_at, pk = decode_cursor(query['cursor'])
+        items = items.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    items = list(items[:query['limit'] + 1])
+
+    more = len(items) > query['limit']
+    items = items[:query['limit']]
+    results = []
+    for item in items:
+        data = serialize(item, build_url)
+        results.append({name: data[name] for name in query['fields']})
+
+    following = None
+    if more:
+        params = {'cursor': encode_cursor(items[-1]), 'limit': query['limit']}
+        if query['fields'] != FEEDS[feed][1]:
+            params['fields'] = ','.join(query['fields'])
+        following = build_url(f"{reverse(f'api_{feed}')}?{urlencode(params)}")
+
+    body = json.dumps({'results': results, 'next': following}, cls=DjangoJSONEncoder).encode()
+    return Page(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', changed)
@@ -0,0 +1,167 @@
+"""
+Bulk ingestion - many uploaded files or one ZIP archive per request.
+Entries are spooled one at a time (ZIP members are never extracted as a
+whole), then validated, decode-probed and stored on the task pool.
+"""
+import logging
+import os
+import tempfile
+import zipfile
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db.models import F
+from PIL import Image
+
+from ..models import ArtPiece
+from .executor import task_pool_size, submit_task
+from .media import release_media
+from .rendering import render_art_piece, profile_image
+from .costs import predict
+from .scheduler import RenderRejected, schedule, user_weight
+
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff', '.bmp', '.gif'}
+SPOOL_SIZE = 2 * 1024 * 1024
+COPY_CHUNK = 64 * 1024
+
+
+def iter_entries(files=(), archive=None):
+    """
+    Yield (filename, binary file) pairs for uploaded files and ZIP members.
+
+    ZIP members are read lazily; members that are not images, are hidden
+    or exceed LUMINA_BULK_MAX_ENTRY_BYTES are skipped.
+    """
+    for upload in files:
+        yield upload.name, upload
+
+    if archive is None:
+        return
+
+    max_bytes = getattr(settings, 'LUMINA_BULK_MAX_ENTRY_BYTES', 100 * 1024 * 1024)
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            name = info.filename
+            basename = os.path.basename(name)
+            if info.is_dir() or not basename or basename.startswith('.') or '__MACOSX' in name:
+                continue
+            if os.path.splitext(basename)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            if info.file_size > max_bytes:
+                continue
+            with zf.open(info) as member:
+                yield basename, member
+
+
+def _spool(source) -> tempfile.SpooledTemporaryFile:
+    """Copy an entry into a temp file that spills to disk when large."""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    if hasattr(source, 'chunks'):
+        for chunk in source.chunks(COPY_CHUNK):
+            spooled.write(chunk)
+    else:
+        while chunk := source.read(COPY_CHUNK):
+            spooled.write(chunk)
+    spooled.seek(0)
+    return spooled
+
+
+def _ingest_entry(filename: str, spooled) -> dict:
+    """Validate, decode-probe and store one entry (runs on the task pool)."""
+    try:
+        try:
+            with Image.open(spooled) as img:
+                img.verify()
+            spooled.seek(0)
+            # The profile decodes every pixel, which also catches truncated data
+            profile = profile_image(spooled)
+        except Exception:
+            raise ValidationError(f'{filename}: not a valid image.')
+
+        name = default_storage.save(f'originals/{filename}', File(spooled, name=filename))
+        return {
+            'title': os.path.splitext(filename)[0][:200] or 'Untitled',
+            'original_image': name,
+            'luminosity_profile': profile,
+        }
+    finally:
+        spooled.close()
+
+
+def ingest_uploads(user, files=(), archive=None, recipe=None) -> tuple:
+    """
+    Store a batch of uploads and create their ArtPieces in one query.
+
+    Args:
+        user: Owner of the new ArtPieces
+        files: Uploaded image files
+        archive: Optional uploaded ZIP archive of images
+        recipe: Optional AestheticRecipe to render every new piece with
+    Returns:
+        (list of created ArtPieces, list of error messages)
+    """
+    max_files = getattr(settings, 'LUMINA_BULK_MAX_FILES', 500)
+    window = task_pool_size() * 2
+    pending = deque()
+    stored, errors = [], []
+
+    def collect(filename, future):
+        try:
+            stored.append(future.result())
+        except ValidationError as e:
+            errors.extend(e.messages)
+        except Exception:
+            logger.exception('Storing bulk upload entry %s failed', filename)
+            errors.append(f'{filename}: could not be stored.')
+
+    try:
+        for count, (filename, source) in enumerate(iter_entries(files, archive)):
+            if count >= max_files:
+                errors.append(f'Only the first {max_files} images were imported.')
+                break
+            pending.append((filename, submit_task(_ingest_entry, filename, _spool(source))))
+            if len(pending) >= window:
+                collect(*pending.popleft())
+        while pending:
+            collect(*pending.popleft())
+
+        art_pieces = ArtPiece.objects.bulk_create([
+            ArtPiece(
+                user=user, title=entry['title'], original_image=entry['original_image'],
+                luminosity_profile=entry['luminosity_profile'], recipe_used=recipe
+            )
+            for entry in stored
+        ])
+    except BaseException:
+        # No ArtPiece will point at what was stored: let the entries in
+        # flight finish, then release the batch's files. The same content
+        # may have been stored by another request just now, so the grace
+        # period applies and gc_media collects the rest later
+        while pending:
+            collect(*pending.popleft())
+        release_media([entry['original_image'] for entry in stored])
+        raise
+
+    if recipe and art_pieces:
+        type(recipe).objects.filter(pk=recipe.pk).update(times_used=F('times_used') + len(art_pieces))
+        params = recipe.get_params()
+        weight = user_weight(user)
+        for art_piece, entry in zip(art_pieces, stored):
+            # Cheap: predictions only read the profile stored with the entry
+            prediction = predict(art_piece, params)
+            try:
+                schedule(
+                    user.pk, prediction.seconds, render_art_piece, art_piece, params,
+                    weight=weight, peak_bytes=prediction.peak_bytes
+                )
+            except RenderRejected as e:
+                errors.append(str(e))
+                break
+
+    return art_pieces, errors
@@ -0,0 +1,122 @@
+"""
+Cached public listings and home-page fragments.
+Entries are dropped by signal handlers whenever a recipe or art piece
+changes; the timeout only bounds staleness of usage counters, which are
+updated without signals.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from ..models import AestheticRecipe, ArtPiece
+
+
+logger = logging.getLogger(__name__)
+
+PUBLIC_RECIPES_KEY = 'lumina:public-recipes'
+POPULAR_RECIPES_FRAGMENT_KEY = 'lumina:fragment:popular-recipes'
+RECENT_ART_FRAGMENT_KEY = 'lumina:fragment:recent-art'
+
+RECIPE_KEYS = (PUBLIC_RECIPES_KEY, POPULAR_RECIPES_FRAGMENT_KEY)
+ART_KEYS = (RECENT_ART_FRAGMENT_KEY,)
+
+# When recipes / art pieces last changed; versions the API pages built from them
+RECIPES_CHANGED_KEY = 'lumina:changed:recipes'
+ART_CHANGED_KEY = 'lumina:changed:art'
+
+_MISSING = object()
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _record(key: str, outcome: str) -> None:
+    with _stats_lock:
+        _stats[key, outcome] += 1
+        _stats['all', outcome] += 1
+        lookups = _stats['all', 'hits'] + _stats['all', 'misses']
+    if lookups % 1000 == 0:
+        rate = cache_stats()['all']['hit_rate']
+        logger.info('Listing cache hit rate %.1f%% over %d lookups', rate * 100, lookups)
+
+
+def cached(key: str, compute, stat: str = None):
+    """
+    Return the cached value for key, computing and storing it on a miss.
+    Hits and misses are counted under stat (default: the key).
+    """
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _record(stat or key, 'hits')
+        return value
+
+    _record(stat or key, 'misses')
+    value = compute()
+    cache.set(key, value, getattr(settings, 'LUMINA_LISTING_CACHE_TIMEOUT', 300))
+    return value
+
+
+def cache_stats() -> dict:
+    """Hits, misses and hit rate per key (and 'all') for this process."""
+    with _stats_lock:
+        keys = {key for key, _ in _stats}
+        stats = {}
+        for key in keys:
+            hits, misses = _stats[key, 'hits'], _stats[key, 'misses']
+            total = hits + misses
+            stats[key] = {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
+    return stats
+
+
+def public_recipes(limit: int = None) -> list:
+    """Public recipes, most used first."""
+    recipes = cached(PUBLIC_RECIPES_KEY, lambda: list(
+        AestheticRecipe.objects.filter(is_public=True).select_related('creator')
+    ))
+    return recipes[:limit] if limit else recipes
+
+
+def popular_recipes_fragment() -> str:
+    """Rendered 'Popular Recipes' section of the home page."""
+    return cached(POPULAR_RECIPES_FRAGMENT_KEY, lambda: render_to_string(
+        'editor/fragments/popular_recipes.html', {'popular_recipes': public_recipes(5)}
+    ))
+
+
+def recent_art_fragment() -> str:
+    """Rendered 'Recent Works' section of the home page."""
+    return cached(RECENT_ART_FRAGMENT_KEY, lambda: render_to_string(
+        'editor/fragments/recent_art.html', {'recent_art': list(ArtPiece.objects.filter(
+            is_public=True,
+            processed_image__isnull=False
+        )[:6])}
+    ))
+
+
+def last_changed(key: str) -> float:
+    """
+    Timestamp of the last change recorded under RECIPES_CHANGED_KEY or
+    ART_CHANGED_KEY; an unknown time (e.g. after a cache clear) counts as now.
+    """
+    changed = cache.get(key)
+    if changed is None:
+        changed = time.time()
+        if not cache.add(key, changed, None):
+            changed = cache.get(key, changed)
+    return changed
+
+
+def invalidate_recipes() -> None:
+    """Drop every cached entry built from recipes."""
+    cache.delete_many(RECIPE_KEYS)
+    cache.set(RECIPES_CHANGED_KEY, time.time(), None)
+
+
+def invalidate_art() -> None:
+    """Drop every cached entry built from art pieces."""
+    cache.delete_many(ART_KEYS)
+    cache.set(ART_CHANGED_KEY, time.time(), None)
@@ -0,0 +1,104 @@
+"""
+Render cost predictions - expected seconds and peak memory before a render runs.
+Models are fitted per engine backend by `manage.py calibrate_engine` and
+kept in LUMINA_COST_MODEL; backends without a fitted model use the
+reference coefficients.
+"""
+import json
+import os
+import threading
+
+from django.conf import settings
+
+from ..engine import CostModel, Prediction, region_share, plan_render, estimate_animation_peak
+from ..engine.backends import get_backend
+from .rendering import profile_image, memory_headroom, source_bit_depth
+
+
+_models = {}
+_lock = threading.Lock()
+
+
+def model_path() -> str:
+    return str(getattr(settings, 'LUMINA_COST_MODEL', settings.BASE_DIR / 'cost_model.json'))
+
+
+def load_models() -> dict:
+    """Fitted model data by backend name, {} if nothing was calibrated yet."""
+    try:
+        with open(model_path()) as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return {}
+
+
+def save_model(model: CostModel) -> None:
+    """Store a fitted model, keeping the other backends' models."""
+    models = load_models()
+    models[model.backend] = model.to_dict()
+    path = model_path()
+    partial = path + '.part'
+    with open(partial, 'w') as fp:
+        json.dump(models, fp, indent=2, sort_keys=True)
+    os.replace(partial, path)
+    reset_cost_models()
+
+
+def get_cost_model(backend: str = None) -> CostModel:
+    """Cost model of an engine backend (the configured one by default), loaded once."""
+    name = get_backend(backend).name
+    with _lock:
+        if name not in _models:
+            data = load_models().get(name)
+            _models[name] = CostModel.from_dict(name, data) if data else CostModel(name)
+        return _models[name]
+
+
+def reset_cost_models() -> None:
+    """Forget loaded models, e.g. after a calibration."""
+    with _lock:
+        _models.clear()
+
+
+def predict(art_piece, params: dict) -> Prediction:
+    """
+    Predict a render of an ArtPiece.
+    
+    Uses the luminosity profile stored at upload, so nothing is decoded
+    unless the piece predates profiles; only the file header is read for
+    its bit depth. The peak is that of the strategy the render will be
+    planned with (see plan_render).
+    
+    Args:
+        art_piece: ArtPiece to render
+        params: process_image() keyword arguments
+    Returns:
+        Prediction with 'seconds' and 'peak_bytes'
+    """
+    profile = art_piece.luminosity_profile or profile_image(art_piece.original_image.path)
+    size = (profile['width'], profile['height'])
+    bit_depth = source_bit_depth(art_piece.original_image.path)
+    prediction = get_cost_model().predict_profile(
+        profile, params, region_share(params.get('region'), size), bit_depth
+    )
+    plan = plan_render(size, params, memory_headroom(), bit_depth, getattr(settings, 'LUMINA_RENDER_STRIPS', 1))
+    return prediction._replace(peak_bytes=plan.peak_bytes)
+
+
+def predict_animation(art_piece, frame_params: list, workers: int = 1) -> Prediction:
+    """
+    Predict an animation export of an ArtPiece (see render_animation).
+    
+    Args:
+        art_piece: ArtPiece to render
+        frame_params: List of process_image() keyword dicts, one per frame
+        workers: Frames sorted at once (see frame_workers)
+    Returns:
+        Prediction with the frames' summed 'seconds' and the 'peak_bytes'
+        of the shared planes plus every frame in flight
+    """
+    predictions = [predict(art_piece, params) for params in frame_params]
+    profile = art_piece.luminosity_profile or profile_image(art_piece.original_image.path)
+    size = (profile['width'], profile['height'])
+    peak = estimate_animation_peak(size, frame_params, source_bit_depth(art_piece.original_image.path), workers)
+    return predictions[0]._replace(seconds=sum(p.seconds for p in predictions), peak_bytes=peak)
@@ -0,0 +1,129 @@
+"""
+Bounded thread pools for engine work.
+
+The render pool runs the renders the scheduler admits, and nothing else:
+the scheduler counts its threads as its capacity. Everything else the
+views and services hand off (predictions, profiles, export encoding,
+bulk ingestion) runs on a separate task pool, so the event loop keeps
+serving other requests without taking render threads from the scheduler.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+_executor = None
+_task_executor = None
+_executor_lock = threading.Lock()
+
+
+def pool_size() -> int:
+    """Number of threads in the render pool."""
+    return getattr(settings, 'LUMINA_RENDER_WORKERS', None) or os.cpu_count() or 1
+
+
+def task_pool_size() -> int:
+    """Number of threads in the task pool; by default half the render pool."""
+    return getattr(settings, 'LUMINA_TASK_WORKERS', None) or max(pool_size() // 2, 1)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the process-wide render pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=pool_size(), thread_name_prefix='lumina-render')
+        return _executor
+
+
+def get_task_executor() -> ThreadPoolExecutor:
+    """Return the process-wide task pool, creating it on first use."""
+    global _task_executor
+    with _executor_lock:
+        if _task_executor is None:
+            _task_executor = ThreadPoolExecutor(max_workers=task_pool_size(), thread_name_prefix='lumina-task')
+        return _task_executor
+
+
+def _run_job(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # Pool threads outlive requests, so release their DB connections
+        close_old_connections()
+
+
+def submit(func, *args, **kwargs) -> Future:
+    """Queue a job on the render pool; only the scheduler submits here (see schedule)."""
+    return get_executor().submit(_run_job, func, args, kwargs)
+
+
+def submit_task(func, *args, **kwargs) -> Future:
+    """Queue a job that is not a scheduled render on the task pool from synchronous code."""
+    return get_task_executor().submit(_run_job, func, args, kwargs)
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """Run a job on the task pool and await its result."""
+    return await asyncio.wrap_future(submit_task(func, *args, **kwargs))
+
+
+class _ChunkWriter:
+    """File-like object handing written chunks to an asyncio queue."""
+    
+    def __init__(self, loop, queue, max_chunks):
+        self._loop = loop
+        self._queue = queue
+        self._slots = threading.Semaphore(max_chunks)
+        self.closed = False
+    
+    def write(self, data) -> int:
+        # Block the encoder while the client is max_chunks behind
+        while not self._slots.acquire(timeout=0.5):
+            if self.closed:
+                break
+        if self.closed:
+            raise BrokenPipeError('Stream consumer went away')
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def release(self):
+        self._slots.release()
+
+
+async def stream_from_executor(write, max_chunks: int = 8):
+    """
+    Run write(fp) on the task pool and yield what it writes to fp.
+    
+    Args:
+        write: Callable taking a writable file-like object
+        max_chunks: Chunks buffered before the writer is paused
+    Yields:
+        Byte strings, in the order they were written
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    writer = _ChunkWriter(loop, queue, max_chunks)
+    done = object()
+    
+    def job():
+        try:
+            write(writer)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+    
+    future = submit_task(job)
+    try:
+        while (chunk := await queue.get()) is not done:
+            writer.release()
+            yield chunk
+        await asyncio.wrap_future(future)
+    finally:
+        writer.closed = True
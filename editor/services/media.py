@@ -0,0 +1,183 @@
+"""
+Media helpers - streamed saves and reference counting for ArtPiece files.
+With content-addressed storage several ArtPieces (or several fields of
+one ArtPiece) can point at the same file, so a file is only deleted once
+nothing references it any more.
+"""
+import mimetypes
+import posixpath
+import tempfile
+import time
+from functools import reduce
+from operator import or_
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse
+from django.utils.http import content_disposition_header
+
+from ..models import ArtPiece
+
+
+MEDIA_FIELDS = (
+    'original_image',
+    'processed_image',
+    'export_story',
+    'export_post',
+    'export_animation',
+    'export_bundle',
+    'region_mask',
+)
+
+
+def save_stream(field_file, filename: str, write, save: bool = True) -> str:
+    """
+    Store the bytes write(fp) produces in an ArtPiece file field.
+
+    Args:
+        field_file: FieldFile to assign, e.g. art_piece.processed_image
+        filename: Requested file name (the extension is kept)
+        write: Callable taking a seekable binary file object
+        save: Save the model instance afterwards
+    Returns:
+        The stored name
+    """
+    storage = field_file.storage
+    name = field_file.field.generate_filename(field_file.instance, filename)
+
+    if hasattr(storage, 'save_stream'):
+        field_file.name = storage.save_stream(name, write)
+        setattr(field_file.instance, field_file.field.attname, field_file.name)
+        field_file._committed = True
+        if save:
+            field_file.instance.save()
+    else:
+        with tempfile.TemporaryFile() as tmp:
+            write(tmp)
+            tmp.seek(0)
+            field_file.save(filename, File(tmp), save=save)
+    return field_file.name
+
+
+def save_file(name: str, write, storage=None) -> str:
+    """
+    Store the bytes write(fp) produces under a name no field holds yet.
+
+    Returns:
+        The stored name
+    """
+    storage = storage or default_storage
+    if hasattr(storage, 'save_stream'):
+        return storage.save_stream(name, write)
+    with tempfile.TemporaryFile() as tmp:
+        write(tmp)
+        tmp.seek(0)
+        return storage.save(name, File(tmp))
+
+
+def save_image(field_file, filename: str, image, save: bool = True, **params) -> str:
+    """Encode a PIL image straight to storage (see save_stream)."""
+    return save_stream(field_file, filename, lambda fp: image.save(fp, **params), save=save)
+
+
+def file_response(name: str, storage=None, as_attachment: bool = False,
+                  filename: str = None, content_type: str = None):
+    """
+    Response delivering a stored file.
+
+    With LUMINA_MEDIA_OFFLOAD set to 'x-accel-redirect' (nginx) or
+    'x-sendfile' (Apache, lighttpd) only headers are sent and the front
+    proxy reads the file itself.
+    """
+    storage = storage or default_storage
+    offload = getattr(settings, 'LUMINA_MEDIA_OFFLOAD', None)
+    if not offload:
+        return FileResponse(
+            storage.open(name, 'rb'),
+            as_attachment=as_attachment,
+            filename=filename or posixpath.basename(name),
+            content_type=content_type
+        )
+
+    response = HttpResponse(
+        content_type=content_type or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    )
+    if offload == 'x-accel-redirect':
+        prefix = getattr(settings, 'LUMINA_MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+    else:
+        response['X-Sendfile'] = storage.path(name)
+    if as_attachment:
+        response['Content-Disposition'] = content_disposition_header(
+            True, filename or posixpath.basename(name)
+        )
+    return response
+
+
+def media_names(art_piece) -> set:
+    """Names of all files an ArtPiece currently references."""
+    names = (getattr(art_piece, field).name for field in MEDIA_FIELDS)
+    return {name for name in names if name}
+
+
+def referenced_names() -> set:
+    """Names of all files referenced by any ArtPiece, in one query per field."""
+    names = set()
+    for field in MEDIA_FIELDS:
+        names.update(
+            ArtPiece.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            .values_list(field, flat=True)
+        )
+    return names
+
+
+def referencing(name: str):
+    """ArtPieces referencing a file from any of their fields."""
+    return ArtPiece.objects.filter(reduce(or_, (Q(**{field: name}) for field in MEDIA_FIELDS)))
+
+
+def reference_count(name: str) -> int:
+    """Number of ArtPieces referencing a file from any of their fields."""
+    return referencing(name).count()
+
+
+def is_settled(name: str, storage=None) -> bool:
+    """
+    Whether a file has not been written or re-saved within the grace period.
+
+    A deduplicated save refreshes the file's mtime, so a file that was just
+    re-saved by a request whose row is not committed yet is left alone.
+    """
+    storage = storage or default_storage
+    grace = getattr(settings, 'LUMINA_MEDIA_GRACE_SECONDS', 3600)
+    return time.time() - storage.get_modified_time(name).timestamp() > grace
+
+
+def release_media(names, storage=None) -> int:
+    """
+    Delete the given files if nothing references them any more.
+
+    Files written within the grace period are kept: a deduplicated save
+    by another request may be about to reference them. gc_media removes
+    them once the grace period is over.
+
+    Returns:
+        Number of files deleted
+    """
+    from .rendering import discard_gradient
+    from .tiles import discard_pyramid
+    storage = storage or default_storage
+    deleted = 0
+    for name in names:
+        if not name or not storage.exists(name):
+            continue
+        if reference_count(name) or not is_settled(name, storage):
+            continue
+        storage.delete(name)
+        discard_pyramid(name)
+        discard_gradient(name)
+        deleted += 1
+    return deleted
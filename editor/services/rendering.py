@@ -0,0 +1,295 @@
+"""
+Render pipeline - decode an ArtPiece original, sort it and store the result.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+from ..engine import (
+    PixelSorter, sort_progressive, luminosity_profile, is_high_bit,
+    RenderPlan, PeakMeter, plan_render, estimate_peak
+)
+from ..engine.planner import run_plan
+from ..storage import content_hash, source_id
+from .media import save_file, save_stream
+
+
+logger = logging.getLogger(__name__)
+
+# Stored result of an (original, params) pair, so repeated renders are free
+RENDER_KEY = 'lumina:render:{}'
+
+# Estimated peak bytes of the renders running in this process
+_reserved = 0
+_reserved_lock = threading.Lock()
+
+
+def profile_image(source) -> dict:
+    """
+    Compute the luminosity profile of an image file for threshold previews.
+    
+    Args:
+        source: Path or binary file; files are rewound afterwards
+    Returns:
+        Dict from luminosity_profile()
+    """
+    with Image.open(source) as img:
+        profile = luminosity_profile(img)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return profile
+
+
+def source_bit_depth(source) -> int:
+    """Bits per channel an image file is sorted with: 16 for 16-bit PNG/TIFF, else 8."""
+    with Image.open(source) as img:
+        return 16 if is_high_bit(img) else 8
+
+
+def memory_headroom() -> int:
+    """
+    Bytes of LUMINA_RENDER_MEMORY_BUDGET not reserved by renders running
+    in this worker, None without a budget.
+    """
+    budget = getattr(settings, 'LUMINA_RENDER_MEMORY_BUDGET', None)
+    if budget is None:
+        return None
+    with _reserved_lock:
+        return max(budget - _reserved, 0)
+
+
+class _Reservation:
+    """A render's estimated peak, held against the budget while it runs."""
+    
+    def __init__(self, peak_bytes: int):
+        self.peak_bytes = peak_bytes
+        self.held = False
+    
+    def take(self) -> None:
+        global _reserved
+        with _reserved_lock:
+            if not self.held:
+                _reserved += self.peak_bytes
+                self.held = True
+    
+    def give_back(self) -> None:
+        global _reserved
+        with _reserved_lock:
+            if self.held:
+                _reserved -= self.peak_bytes
+                self.held = False
+    
+    @contextmanager
+    def released(self):
+        """Give the reservation back while a paused render waits."""
+        self.give_back()
+        try:
+            yield
+        finally:
+            self.take()
+
+
+@contextmanager
+def _reserve(peak_bytes: int):
+    """Hold a render's estimated peak against the budget while it runs."""
+    reservation = _Reservation(peak_bytes)
+    reservation.take()
+    try:
+        yield reservation
+    finally:
+        reservation.give_back()
+
+
+def gradient_root() -> str:
+    return str(getattr(settings, 'LUMINA_GRADIENT_ROOT', settings.BASE_DIR / 'cache' / 'gradients'))
+
+
+def gradient_path(name: str) -> str:
+    """File holding the edge gradient plane of a stored original."""
+    return os.path.join(gradient_root(), source_id(name) + '.npy')
+
+
+def _cached_planes(art_piece, params: dict) -> dict:
+    """Key planes of the original kept from earlier renders (the edge gradient, memory-mapped)."""
+    if params.get('interval_mode') != 'edges':
+        return {}
+    try:
+        return {'gradient': np.load(gradient_path(art_piece.original_image.name), mmap_mode='r')}
+    except (OSError, ValueError):
+        return {}
+
+
+def _store_gradient(art_piece, gradient: np.ndarray) -> None:
+    """Keep the gradient plane of an original as an uncompressed .npy file."""
+    path = gradient_path(art_piece.original_image.name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            np.save(fp, gradient)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def discard_gradient(name: str) -> None:
+    """Delete the kept gradient plane of a stored original, if it has one."""
+    try:
+        os.remove(gradient_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def render_key(art_piece, params: dict) -> str:
+    """Cache key of the render of an ArtPiece's original with the given params."""
+    name = art_piece.original_image.name
+    signature = json.dumps([content_hash(name) or name, params], sort_keys=True, default=str)
+    return RENDER_KEY.format(hashlib.sha256(signature.encode()).hexdigest())
+
+
+def cached_render(art_piece, params: dict) -> str:
+    """Stored name of an earlier render of the same original and params, or None."""
+    name = cache.get(render_key(art_piece, params))
+    if name and default_storage.exists(name):
+        return name
+    return None
+
+
+def _remember_render(art_piece, params: dict, name: str) -> None:
+    # Unreferenced renders only survive the media grace period (see gc_media)
+    cache.set(render_key(art_piece, params), name,
+              getattr(settings, 'LUMINA_RENDER_CACHE_TIMEOUT', 300))
+
+
+def adopt_cached_render(art_piece, params: dict) -> bool:
+    """
+    Point an ArtPiece at a cached render of its params instead of rendering.
+    
+    Returns:
+        True if a cached render was found and the ArtPiece saved
+    """
+    name = cached_render(art_piece, params)
+    if name is None:
+        return False
+    if art_piece.processed_image.name != name:
+        art_piece.processed_image = name
+        art_piece.clear_exports()
+    art_piece.save()
+    return True
+
+
+def render_to_cache(art_piece, params: dict, checkpoint=None, wait=None) -> str:
+    """
+    Render an ArtPiece's original into the render cache without assigning it.
+    
+    Args:
+        art_piece: ArtPiece whose original_image is rendered
+        params: process_image() keyword arguments
+        checkpoint: Optional callable run before each band; the image is
+                    then sorted band by band, so the checkpoint can
+                    abandon the render (see sort_progressive)
+        wait: Optional callable run before each checkpoint that blocks
+              while the render should pause; the render's memory
+              reservation is given back while it blocks
+    Returns:
+        The stored name of the render
+    """
+    with Image.open(art_piece.original_image.path) as img:
+        bit_depth = 16 if is_high_bit(img) else 8
+        if checkpoint is None:
+            plan = plan_render(img.size, params, memory_headroom(), bit_depth,
+                               getattr(settings, 'LUMINA_RENDER_STRIPS', 1))
+        else:
+            peak = estimate_peak('bands', img.size, params, bit_depth)
+            plan = RenderPlan('bands', peak, True, 1, {'bands': peak})
+        with _reserve(plan.peak_bytes) as reservation:
+            if checkpoint is not None and wait is not None:
+                def between_bands():
+                    with reservation.released():
+                        wait()
+                    checkpoint()
+            else:
+                between_bands = checkpoint
+            sorter, pixels = run_plan(img, plan, params, planes=_cached_planes(art_piece, params),
+                                      checkpoint=between_bands)
+            name = save_file(
+                art_piece.processed_image.field.generate_filename(art_piece, 'processed.png'),
+                lambda fp: sorter.save(pixels, fp, format='PNG')
+            )
+    _remember_render(art_piece, params, name)
+    return name
+
+
+def render_art_piece(art_piece, params: dict, on_band=None) -> None:
+    """
+    Process an ArtPiece's original image and save the result.
+    
+    The render strategy is planned against the worker's memory headroom
+    (see plan_render); the choice, its estimated peak and the measured
+    peak are logged.
+    
+    Args:
+        art_piece: ArtPiece whose original_image is rendered
+        params: process_image() keyword arguments
+        on_band: Optional callable; the image is then sorted band by band
+                 and each finished Band is passed to it (see sort_progressive)
+    """
+    with Image.open(art_piece.original_image.path) as img:
+        filename = f"processed_{uuid.uuid4().hex[:8]}.png"
+        previous = art_piece.processed_image.name
+        bit_depth = 16 if is_high_bit(img) else 8
+        headroom = memory_headroom()
+        if on_band is None:
+            plan = plan_render(img.size, params, headroom, bit_depth,
+                               getattr(settings, 'LUMINA_RENDER_STRIPS', 1))
+        else:
+            # Progressive renders go band by band anyway
+            peak = estimate_peak('bands', img.size, params, bit_depth)
+            plan = RenderPlan('bands', peak, headroom is None or peak <= headroom, 1, {'bands': peak})
+        if not plan.fits:
+            logger.warning('No render strategy fits the %s of memory left for art piece %s',
+                           filesizeformat(headroom), art_piece.pk)
+        
+        planes = _cached_planes(art_piece, params)
+        meter = PeakMeter(getattr(settings, 'LUMINA_RENDER_MEMORY_METER', 'rss'))
+        with _reserve(plan.peak_bytes), meter:
+            if on_band is None:
+                sorter, pixels = run_plan(img, plan, params, planes=planes)
+            else:
+                sorter = PixelSorter(img, compact=True)
+                sorter.planes.update(planes)
+                pixels = sort_progressive(sorter, params, on_band)
+            # 16-bit originals give 16-bit PNGs
+            save_stream(
+                art_piece.processed_image, filename,
+                lambda fp: sorter.save(pixels, fp, format='PNG'), save=False
+            )
+        logger.info(
+            'Rendered art piece %s (%dx%d) with the %s strategy: estimated peak %s, measured %s, '
+            'memory left %s', art_piece.pk, img.width, img.height, plan.strategy,
+            filesizeformat(plan.peak_bytes),
+            'unknown' if meter.peak_bytes is None else filesizeformat(meter.peak_bytes),
+            'unlimited' if headroom is None else filesizeformat(headroom)
+        )
+        if 'gradient' in sorter.planes and not planes:
+            # Edge renders with other thresholds reuse the gradient of the original
+            _store_gradient(art_piece, sorter.planes['gradient'])
+        # Identical renders keep their content-addressed name, and their exports
+        if art_piece.processed_image.name != previous:
+            art_piece.clear_exports()
+        art_piece.save()
+        _remember_render(art_piece, params, art_piece.processed_image.name)
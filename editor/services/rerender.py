@@ -0,0 +1,236 @@
+"""
+Bulk re-renders - refresh the stored renders of many art pieces.
+
+A RenderJob lists its art pieces as RenderJobItems. A coordinator thread
+keeps up to LUMINA_RERENDER_CONCURRENCY of them queued on the render
+scheduler, under one low-weight account shared by all jobs, each with
+its art piece's current effective parameters, and writes
+finished renders back in batches: one bulk_update of the art pieces,
+one of the items and one counter update of the job per batch. Only
+pending items are rendered, so resuming a job after an interruption
+picks up where its last batch left off.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import ArtPiece, RenderJob, RenderJobItem
+from .cache import invalidate_art
+from .executor import pool_size
+from .media import release_media
+from .scheduler import schedule
+
+
+logger = logging.getLogger(__name__)
+
+# Finished items written back per batch, and the longest a batch waits
+BATCH_SIZE = 50
+FLUSH_SECONDS = 2.0
+# Fields a re-render replaces; exports of the old render are dropped
+RENDER_FIELDS = ['processed_image', 'export_story', 'export_post', 'export_bundle']
+# A running job without progress updates for this long was interrupted
+STALLED_AFTER = timedelta(minutes=2)
+# Scheduler account of every re-render job; user accounts are keyed by id
+RERENDER_ACCOUNT = 'rerender'
+
+# Job id -> Event set to stop its coordinator
+_running = {}
+_running_lock = threading.Lock()
+
+
+def concurrency() -> int:
+    """Renders one job keeps in flight; by default half the pool, leaving the rest to users."""
+    return getattr(settings, 'LUMINA_RERENDER_CONCURRENCY', None) or max(pool_size() // 2, 1)
+
+
+def start_job(art_pieces, user=None, description: str = '') -> RenderJob:
+    """
+    Create a RenderJob for a queryset of art pieces and start it.
+
+    Args:
+        art_pieces: ArtPiece queryset
+        user: Admin user starting the job
+        description: What the job re-renders, e.g. the recipe name
+    Returns:
+        The RenderJob
+    """
+    ids = list(art_pieces.order_by('id').values_list('id', flat=True).distinct())
+    with transaction.atomic():
+        job = RenderJob.objects.create(description=description, created_by=user, total=len(ids))
+        RenderJobItem.objects.bulk_create(
+            [RenderJobItem(job=job, art_piece_id=art_id) for art_id in ids], batch_size=500
+        )
+    transaction.on_commit(lambda: resume_job(job))
+    return job
+
+
+def is_running(job) -> bool:
+    """Whether this process is working on the job."""
+    with _running_lock:
+        return job.pk in _running
+
+
+def is_stalled(job) -> bool:
+    """Whether a job marked running has stopped reporting progress (e.g. its server restarted)."""
+    return job.status == 'running' and not is_running(job) and (
+        job.updated_at is None or timezone.now() - job.updated_at > STALLED_AFTER
+    )
+
+
+def resume_job(job) -> bool:
+    """
+    Render the pending items of a job in a background coordinator thread.
+
+    Returns:
+        False if the job is finished or still running here or elsewhere
+    """
+    if job.status == 'done' or (job.status == 'running' and not is_stalled(job)):
+        return False
+    with _running_lock:
+        if job.pk in _running:
+            return False
+        stop = _running[job.pk] = threading.Event()
+    now = timezone.now()
+    RenderJob.objects.filter(pk=job.pk, started_at__isnull=True).update(started_at=now)
+    RenderJob.objects.filter(pk=job.pk).update(status='running', finished_at=None, updated_at=now)
+    threading.Thread(
+        target=_run_job, args=(job.pk, stop), daemon=True, name=f'lumina-rerender-{job.pk}'
+    ).start()
+    return True
+
+
+def cancel_job(job) -> None:
+    """Stop a job after the renders in flight; resuming it continues with the rest."""
+    with _running_lock:
+        stop = _running.get(job.pk)
+    if stop is not None:
+        stop.set()
+    RenderJob.objects.filter(pk=job.pk).exclude(status='done').update(
+        status='cancelled', updated_at=timezone.now()
+    )
+
+
+def _render_item(art_piece, params: dict) -> tuple:
+    """Render one art piece: (stored name, megapixels, seconds)."""
+    from .rendering import render_to_cache
+    started = time.perf_counter()
+    name = render_to_cache(art_piece, params)
+    megapixels = art_piece.original_image.width * art_piece.original_image.height / 1e6
+    return name, megapixels, time.perf_counter() - started
+
+
+def _schedule_item(art_piece) -> Future:
+    """Queue the render of one art piece on the scheduler, behind user renders."""
+    from .costs import predict
+    params = art_piece.get_effective_params()
+    try:
+        prediction = predict(art_piece, params)
+        return schedule(
+            RERENDER_ACCOUNT, prediction.seconds, _render_item, art_piece, params,
+            weight=getattr(settings, 'LUMINA_RERENDER_WEIGHT', 0.5), peak_bytes=prediction.peak_bytes
+        )
+    except Exception as e:
+        # Over the render limits, or the original is unreadable: only this item fails
+        future = Future()
+        future.set_exception(e)
+        return future
+
+
+def _run_job(job_id, stop: threading.Event) -> None:
+    try:
+        pending = iter(list(
+            RenderJobItem.objects.filter(job_id=job_id, status='pending').values_list('id', 'art_piece_id')
+        ))
+
+        in_flight = {}
+        finished = []
+        flushed_at = time.monotonic()
+        exhausted = False
+        while True:
+            while not exhausted and not stop.is_set() and len(in_flight) < concurrency():
+                entry = next(pending, None)
+                if entry is None:
+                    exhausted = True
+                    break
+                item_id, art_id = entry
+                art_piece = ArtPiece.objects.select_related('recipe_used').filter(pk=art_id).first()
+                if art_piece is None:
+                    # Deleted since the job was created; its item went with it
+                    continue
+                in_flight[_schedule_item(art_piece)] = (item_id, art_piece)
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, timeout=FLUSH_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                item_id, art_piece = in_flight.pop(future)
+                finished.append((item_id, art_piece, future))
+            if len(finished) >= BATCH_SIZE or time.monotonic() - flushed_at >= FLUSH_SECONDS:
+                _flush(job_id, finished)
+                finished = []
+                flushed_at = time.monotonic()
+
+        _flush(job_id, finished)
+        if not stop.is_set():
+            RenderJob.objects.filter(pk=job_id).update(
+                status='done', finished_at=timezone.now(), updated_at=timezone.now()
+            )
+    except Exception:
+        logger.exception('Render job %s stopped', job_id)
+    finally:
+        with _running_lock:
+            if _running.get(job_id) is stop:
+                del _running[job_id]
+        close_old_connections()
+
+
+def _flush(job_id, finished: list) -> None:
+    """Write a batch of finished renders back with bulk updates."""
+    if not finished:
+        RenderJob.objects.filter(pk=job_id).update(updated_at=timezone.now())
+        return
+
+    items, pieces, stale = [], [], set()
+    megapixels = seconds = 0.0
+    for item_id, art_piece, future in finished:
+        item = RenderJobItem(id=item_id)
+        error = future.exception()
+        if error is not None:
+            item.status, item.error = 'failed', str(error) or type(error).__name__
+            logger.warning('Re-render of art piece %s failed: %s', art_piece.pk, item.error)
+        else:
+            name, item.megapixels, item.seconds = future.result()
+            item.status = 'done'
+            megapixels += item.megapixels
+            seconds += item.seconds
+            if art_piece.processed_image.name != name:
+                stale.update(getattr(art_piece, field).name for field in RENDER_FIELDS)
+                art_piece.processed_image = name
+                art_piece.clear_exports()
+                pieces.append(art_piece)
+        items.append(item)
+
+    rendered = sum(item.status == 'done' for item in items)
+    with transaction.atomic():
+        ArtPiece.objects.bulk_update(pieces, RENDER_FIELDS)
+        RenderJobItem.objects.bulk_update(items, ['status', 'error', 'megapixels', 'seconds'])
+        RenderJob.objects.filter(pk=job_id).update(
+            rendered=F('rendered') + rendered,
+            failed=F('failed') + len(items) - rendered,
+            megapixels=F('megapixels') + megapixels,
+            render_seconds=F('render_seconds') + seconds,
+            updated_at=timezone.now(),
+        )
+        # bulk_update sends no signals, so do what the ArtPiece handlers would
+        if pieces:
+            stale.discard('')
+            stale.discard(None)
+            transaction.on_commit(lambda: release_media(stale))
+            transaction.on_commit(invalidate_art)
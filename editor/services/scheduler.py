@@ -0,0 +1,269 @@
+"""
+Fair render scheduler - per-user budgets in front of the render pool.
+Each render is admitted with its predicted cost in seconds (see
+services.costs.predict). Queued renders start in weighted fair order
+across users, never more at once than the pool has threads and never
+beyond a user's concurrency or render-seconds-per-minute budget.
+"""
+import asyncio
+import itertools
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import Future
+from functools import partial
+
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
+
+from .executor import pool_size, submit
+
+
+# Even tiny renders hold a pool thread for a while
+MIN_COST = 0.05
+BUDGET_WINDOW = 60.0
+
+
+class RenderRejected(Exception):
+    """Raised when a render is over the limits or the user has too many queued."""
+
+
+def user_weight(user) -> float:
+    """Fair-share weight of a user; staff get LUMINA_STAFF_RENDER_WEIGHT."""
+    if user.is_staff:
+        return getattr(settings, 'LUMINA_STAFF_RENDER_WEIGHT', 2.0)
+    return 1.0
+
+
+class _Job:
+    """A queued render with its fair-queuing tags."""
+    __slots__ = ('user', 'cost', 'func', 'args', 'kwargs', 'future',
+                 'start_tag', 'finish_tag', 'queued_at', 'seq')
+
+    def __init__(self, user, cost, func, args, kwargs):
+        self.user = user
+        self.cost = cost
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+
+class RenderScheduler:
+    """
+    Weighted fair queuing across users, with per-user budgets.
+
+    Jobs get start/finish tags as in start-time fair queuing: a user's
+    jobs are spaced cost/weight apart in virtual time, so a user with a
+    deep queue of large renders cannot delay another user's next render
+    by more than about one of their own.
+    """
+
+    def __init__(self, capacity: int = None, max_running: int = None,
+                 seconds_per_minute: float = None, max_queued: int = None,
+                 max_seconds: float = None, max_bytes: int = None):
+        self.capacity = capacity or pool_size()
+        self.max_running = max_running or getattr(settings, 'LUMINA_USER_MAX_RENDERS', 2)
+        self.seconds_per_minute = seconds_per_minute or getattr(
+            settings, 'LUMINA_USER_RENDER_SECONDS_PER_MINUTE', 120
+        )
+        self.max_queued = max_queued or getattr(settings, 'LUMINA_USER_MAX_QUEUED', 500)
+        # Admission limits for a single render; None means unlimited
+        self.max_seconds = max_seconds or getattr(settings, 'LUMINA_RENDER_MAX_SECONDS', None)
+        self.max_bytes = max_bytes or getattr(settings, 'LUMINA_RENDER_MAX_BYTES', None)
+
+        self._lock = threading.Lock()
+        self._queues = defaultdict(deque)
+        self._last_finish = {}
+        self._virtual_time = 0.0
+        self._running = Counter()
+        self._spent = defaultdict(deque)
+        self._waits = deque(maxlen=500)
+        self._seq = itertools.count()
+        self._timer = None
+
+    def schedule(self, user, cost: float, func, *args, weight: float = 1.0,
+                 peak_bytes: int = 0, **kwargs) -> Future:
+        """
+        Queue func(*args, **kwargs) for a user.
+
+        Args:
+            user: Key identifying the user (e.g. the user id)
+            cost: Predicted seconds, see services.costs.predict()
+            weight: Fair-share weight, see user_weight()
+            peak_bytes: Predicted peak memory of the render
+        Returns:
+            Future for the result; cancelling it drops a job still queued
+        Raises:
+            RenderRejected: The render is over max_seconds or max_bytes, or
+                the user has max_queued renders waiting
+        """
+        if self.max_seconds and cost > self.max_seconds:
+            raise RenderRejected(
+                f'This render would take about {cost:.0f} s; the limit is {self.max_seconds:.0f} s. '
+                'Try a narrower threshold window or a smaller region.'
+            )
+        if self.max_bytes and peak_bytes > self.max_bytes:
+            raise RenderRejected(
+                f'This render would need about {filesizeformat(peak_bytes)} of memory; '
+                f'the limit is {filesizeformat(self.max_bytes)}.'
+            )
+
+        job = _Job(user, max(cost, 0.0), func, args, kwargs)
+        with self._lock:
+            if len(self._queues[user]) >= self.max_queued:
+                raise RenderRejected(
+                    f'You already have {len(self._queues[user])} renders waiting; try again later.'
+                )
+            job.start_tag = max(self._virtual_time, self._last_finish.get(user, 0.0))
+            job.finish_tag = job.start_tag + max(job.cost, MIN_COST) / weight
+            job.seq = next(self._seq)
+            self._last_finish[user] = job.finish_tag
+            self._queues[user].append(job)
+        self._dispatch()
+        return job.future
+
+    def busy(self) -> bool:
+        """Whether any render is running or waiting."""
+        with self._lock:
+            return bool(self._running) or any(self._queues.values())
+
+    def stats(self) -> dict:
+        """Queue depth, recent wait times and per-user usage."""
+        now = time.monotonic()
+        with self._lock:
+            waits = sorted(self._waits)
+            users = {}
+            for user in set(self._queues) | set(self._running) | set(self._spent):
+                queued = self._queues.get(user, ())
+                users[user] = {
+                    'queued': len(queued),
+                    'running': self._running[user],
+                    'seconds_last_minute': round(self._spent_by(user, now), 2),
+                    'oldest_wait': round(now - queued[0].queued_at, 2) if queued else 0.0,
+                }
+            return {
+                'capacity': self.capacity,
+                'running': sum(self._running.values()),
+                'queued': sum(len(queue) for queue in self._queues.values()),
+                'wait_seconds': {
+                    'mean': round(sum(waits) / len(waits), 3) if waits else 0.0,
+                    'p95': round(waits[int(len(waits) * 0.95)], 3) if waits else 0.0,
+                    'max': round(waits[-1], 3) if waits else 0.0,
+                },
+                'users': users,
+            }
+
+    # ------------------------------------------------------------------
+    # Dispatching
+
+    def _spent_by(self, user, now: float) -> float:
+        """Predicted seconds a user started within the budget window (lock held)."""
+        spent = self._spent.get(user)
+        if spent is None:
+            return 0.0
+        while spent and spent[0][0] <= now - BUDGET_WINDOW:
+            spent.popleft()
+        if not spent:
+            del self._spent[user]
+            return 0.0
+        return sum(cost for _, cost in spent)
+
+    def _eligible(self, user, job, now: float) -> bool:
+        if self._running[user] >= self.max_running:
+            return False
+        spent = self._spent_by(user, now)
+        # An idle user may always start one render, however large
+        return spent == 0 or spent + job.cost <= self.seconds_per_minute
+
+    def _next_job(self, now: float):
+        """Pop the eligible queue head with the smallest finish tag (lock held)."""
+        best = None
+        for user, queue in list(self._queues.items()):
+            while queue and queue[0].future.cancelled():
+                queue.popleft()
+            if not queue:
+                del self._queues[user]
+                if self._last_finish.get(user, 0.0) <= self._virtual_time:
+                    self._last_finish.pop(user, None)
+                continue
+            job = queue[0]
+            if self._eligible(user, job, now) and (
+                best is None or (job.finish_tag, job.seq) < (best.finish_tag, best.seq)
+            ):
+                best = job
+        if best is not None:
+            self._queues[best.user].popleft()
+        return best
+
+    def _dispatch(self) -> None:
+        started = []
+        with self._lock:
+            now = time.monotonic()
+            while sum(self._running.values()) < self.capacity:
+                job = self._next_job(now)
+                if job is None:
+                    break
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                self._virtual_time = max(self._virtual_time, job.start_tag)
+                self._running[job.user] += 1
+                self._spent[job.user].append((now, job.cost))
+                self._waits.append(now - job.queued_at)
+                started.append(job)
+            self._arm_timer(now)
+
+        for job in started:
+            inner = submit(job.func, *job.args, **job.kwargs)
+            inner.add_done_callback(partial(self._finished, job))
+
+    def _arm_timer(self, now: float) -> None:
+        """Re-dispatch when the oldest budget charge expires (lock held)."""
+        if self._timer is not None or not self._queues or not self._spent:
+            return
+        expiry = min(spent[0][0] for spent in self._spent.values() if spent) + BUDGET_WINDOW
+        self._timer = threading.Timer(max(expiry - now, 0.05), self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+        self._dispatch()
+
+    def _finished(self, job, inner: Future) -> None:
+        with self._lock:
+            self._running[job.user] -= 1
+            if not self._running[job.user]:
+                del self._running[job.user]
+
+        error = inner.exception()
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(inner.result())
+        self._dispatch()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RenderScheduler:
+    """Return the process-wide scheduler, creating it on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RenderScheduler()
+        return _scheduler
+
+
+def schedule(user, cost: float, func, *args, **kwargs) -> Future:
+    """Queue a render on the process-wide scheduler (see RenderScheduler.schedule)."""
+    return get_scheduler().schedule(user, cost, func, *args, **kwargs)
+
+
+async def run_scheduled(user, cost: float, func, *args, **kwargs):
+    """Queue a render on the process-wide scheduler and await its result."""
+    return await asyncio.wrap_future(schedule(user, cost, func, *args, **kwargs))
@@ -0,0 +1,164 @@
+"""
+Speculative renders - pre-render the most used recipes of a fresh upload.
+
+Right after an upload, one low-priority background thread renders the
+top LUMINA_SPECULATIVE_RECIPES public recipes: first each on a small
+proxy of the image (a preview the process page can show), then, with
+LUMINA_SPECULATIVE_FULL_RESOLUTION, each at full size into the render
+cache, so picking one of those recipes completes without a render.
+
+The work yields to real renders: between bands it waits while the
+scheduler has anything running or queued, without holding its memory
+reservation. Each upload may spend
+LUMINA_SPECULATIVE_CPU_SECONDS of CPU time, and its speculation is
+cancelled as soon as the user renders or deletes the piece.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from PIL import Image
+
+from ..engine import PixelSorter, preview_size
+from .cache import public_recipes
+from .costs import predict
+from .rendering import cached_render, render_key, render_to_cache
+from .scheduler import get_scheduler
+
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_KEY = 'lumina:speculative-preview:{}'
+PREVIEW_SIZE = 480
+PREVIEW_QUALITY = 85
+# How often a paused speculation checks whether the pool went idle
+IDLE_POLL_SECONDS = 0.05
+
+_executor = None
+_executor_lock = threading.Lock()
+# Art piece id -> Event set to cancel its speculation
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+class SpeculationStopped(Exception):
+    """Raised inside a speculative render that was cancelled or ran out of budget."""
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='lumina-speculative', initializer=_lower_priority
+            )
+        return _executor
+
+
+def _lower_priority() -> None:
+    """Make the speculative thread the first to lose the CPU (Linux sets niceness per thread)."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+def preview_key(art_piece, params: dict) -> str:
+    """Cache key of the speculative preview of a render."""
+    return PREVIEW_KEY.format(render_key(art_piece, params))
+
+
+def speculate(art_piece):
+    """
+    Queue speculative renders of the most used public recipes for an ArtPiece.
+
+    Returns:
+        Future of the speculation, or None when it is turned off
+    """
+    count = getattr(settings, 'LUMINA_SPECULATIVE_RECIPES', 3)
+    recipes = public_recipes(count) if count else []
+    if not recipes:
+        return None
+
+    cancelled = threading.Event()
+    with _pending_lock:
+        previous = _pending.get(art_piece.pk)
+        if previous is not None:
+            previous.set()
+        _pending[art_piece.pk] = cancelled
+    return _get_executor().submit(
+        _speculate, art_piece, [recipe.get_params() for recipe in recipes], cancelled
+    )
+
+
+def cancel_speculation(art_id) -> None:
+    """Stop speculating for an art piece; a render in progress stops at its next band."""
+    with _pending_lock:
+        cancelled = _pending.pop(art_id, None)
+    if cancelled is not None:
+        cancelled.set()
+
+
+def _speculate(art_piece, recipe_params: list, cancelled: threading.Event) -> None:
+    budget = getattr(settings, 'LUMINA_SPECULATIVE_CPU_SECONDS', 30.0)
+    started = time.thread_time()
+
+    def wait_idle():
+        # Real renders go first; a paused speculation costs no CPU
+        while get_scheduler().busy():
+            if cancelled.wait(IDLE_POLL_SECONDS):
+                break
+
+    def check():
+        if cancelled.is_set():
+            raise SpeculationStopped('cancelled')
+        if time.thread_time() - started > budget:
+            raise SpeculationStopped('out of CPU budget')
+
+    def checkpoint():
+        wait_idle()
+        check()
+
+    try:
+        with Image.open(art_piece.original_image.path) as img:
+            proxy = img.convert('RGB')
+        proxy.thumbnail(preview_size(proxy.size, PREVIEW_SIZE), Image.Resampling.BILINEAR)
+        for params in recipe_params:
+            checkpoint()
+            _render_preview(art_piece, proxy, params)
+
+        if not getattr(settings, 'LUMINA_SPECULATIVE_FULL_RESOLUTION', True):
+            return
+        for params in recipe_params:
+            checkpoint()
+            if cached_render(art_piece, params):
+                continue
+            # Only start renders the remaining budget can pay for
+            if predict(art_piece, params).seconds > budget - (time.thread_time() - started):
+                continue
+            render_to_cache(art_piece, params, check, wait=wait_idle)
+    except SpeculationStopped as e:
+        logger.info('Speculative renders for art piece %s stopped: %s', art_piece.pk, e)
+    except Exception:
+        logger.exception('Speculative render failed for art piece %s', art_piece.pk)
+    finally:
+        with _pending_lock:
+            if _pending.get(art_piece.pk) is cancelled:
+                del _pending[art_piece.pk]
+        close_old_connections()
+
+
+def _render_preview(art_piece, proxy: Image.Image, params: dict) -> None:
+    key = preview_key(art_piece, params)
+    if cache.get(key) is not None:
+        return
+    sorter = PixelSorter(proxy)
+    buffer = BytesIO()
+    sorter.to_image(sorter.sort(**params)).save(buffer, format='JPEG', quality=PREVIEW_QUALITY)
+    cache.set(key, buffer.getvalue(), getattr(settings, 'LUMINA_RENDER_CACHE_TIMEOUT', 300))
@@ -0,0 +1,133 @@
+"""
+Deep-zoom tiles - a DZI pyramid of each render, built on first request.
+
+Pyramids live under LUMINA_TILE_ROOT, one directory per render source
+(the content hash of the processed image, so pieces sharing a render
+share its tiles). Each level is kept as a memory-mapped .npy raster,
+built by one 2x reduce of the level above (the top one is decoded from
+the render); tiles are cut from those rasters as they are requested and
+stored as WebP next to them. Nothing is built until a viewer asks.
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from ..engine import is_high_bit, read_high_bit
+from ..engine.highbit import to_8bit
+from ..engine.tiles import TILE_FORMAT, dzi_descriptor, level_size, reduce_half, tile_box, top_level
+from ..storage import source_id
+
+
+TILE_QUALITY = 85
+
+# Source id -> lock held while one of its levels or tiles is written
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def tile_root() -> str:
+    return str(getattr(settings, 'LUMINA_TILE_ROOT', settings.BASE_DIR / 'cache' / 'tiles'))
+
+
+def pyramid_dir(name: str) -> str:
+    """Directory holding the pyramid of a stored render."""
+    return os.path.join(tile_root(), source_id(name))
+
+
+def _lock(source: str) -> threading.Lock:
+    with _locks_lock:
+        return _locks.setdefault(source, threading.Lock())
+
+
+def _write_atomic(path: str, write) -> None:
+    """Write a file under a temp name and rename it into place."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def image_size(field_file) -> tuple:
+    """(width, height) of a stored render."""
+    return (field_file.width, field_file.height)
+
+
+def descriptor(field_file) -> str:
+    """The .dzi descriptor of a stored render."""
+    return dzi_descriptor(image_size(field_file))
+
+
+def _decode(path: str) -> np.ndarray:
+    with Image.open(path) as img:
+        if is_high_bit(img):
+            return np.asarray(to_8bit(read_high_bit(img)))
+        return np.asarray(img.convert('RGB'))
+
+
+def _level(field_file, level: int, directory: str) -> np.ndarray:
+    """Memory-mapped raster of a level, building it (and the levels above) if needed."""
+    path = os.path.join(directory, f'level_{level}.npy')
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r')
+
+    size = image_size(field_file)
+    if level == top_level(size):
+        pixels = _decode(field_file.path)
+
+        def write(tmp):
+            with open(tmp, 'wb') as fp:
+                np.save(fp, pixels)
+    else:
+        above = _level(field_file, level + 1, directory)
+        width, height = level_size(size, level)
+
+        def write(tmp):
+            out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8, shape=(height, width, 3))
+            reduce_half(above, out)
+            out.flush()
+    _write_atomic(path, write)
+    return np.load(path, mmap_mode='r')
+
+
+def tile_path(field_file, level: int, col: int, row: int) -> str:
+    """
+    Path of one WebP tile of a stored render, building it on first use.
+
+    Args:
+        field_file: The render, e.g. art_piece.processed_image
+        level, col, row: Tile address as in the DZI URL scheme
+    Returns:
+        Filesystem path of the tile
+    Raises:
+        ValueError: If the tile does not exist
+    """
+    box = tile_box(image_size(field_file), level, col, row)
+    directory = pyramid_dir(field_file.name)
+    path = os.path.join(directory, str(level), f'{col}_{row}.{TILE_FORMAT}')
+    if os.path.exists(path):
+        return path
+
+    with _lock(source_id(field_file.name)):
+        if os.path.exists(path):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        raster = _level(field_file, level, directory)
+        left, top, right, bottom = box
+        tile = Image.fromarray(np.ascontiguousarray(raster[top:bottom, left:right]), mode='RGB')
+        _write_atomic(path, lambda tmp: tile.save(tmp, format='WEBP', quality=TILE_QUALITY))
+    return path
+
+
+def discard_pyramid(name: str) -> None:
+    """Delete the pyramid of a stored render, if it has one."""
+    shutil.rmtree(pyramid_dir(name), ignore_errors=True)
@@ -0,0 +1,61 @@
+"""
+LUMINA_SORT Signal handlers
+"""
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import AestheticRecipe, ArtPiece
+from .services.cache import invalidate_art, invalidate_recipes
+from .services.media import MEDIA_FIELDS, media_names, release_media
+
+
+@receiver(pre_save, sender=ArtPiece)
+def remember_media(sender, instance, update_fields=None, **kwargs):
+    """Record the files an ArtPiece referenced before this save."""
+    instance._previous_media = set()
+    if not instance.pk:
+        return
+    if update_fields is not None and not set(update_fields) & set(MEDIA_FIELDS):
+        return
+    previous = ArtPiece.objects.filter(pk=instance.pk).values(*MEDIA_FIELDS).first()
+    if previous:
+        instance._previous_media = {name for name in previous.values() if name}
+
+
+@receiver(post_save, sender=ArtPiece)
+def release_replaced_media(sender, instance, **kwargs):
+    """Drop files replaced by this save (e.g. a re-render or re-export)."""
+    stale = getattr(instance, '_previous_media', set()) - media_names(instance)
+    if stale:
+        transaction.on_commit(lambda: release_media(stale))
+
+
+@receiver(post_delete, sender=ArtPiece)
+def release_deleted_media(sender, instance, **kwargs):
+    """Drop the files of a deleted ArtPiece unless others still use them."""
+    names = media_names(instance)
+    if names:
+        transaction.on_commit(lambda: release_media(names))
+
+
+@receiver(post_delete, sender=ArtPiece)
+def stop_speculation(sender, instance, **kwargs):
+    """Deleted art pieces need no speculative renders."""
+    # Imported here: speculation loads the engine, which web-only workers never need
+    from .services.speculative import cancel_speculation
+    cancel_speculation(instance.pk)
+
+
+@receiver(post_save, sender=AestheticRecipe)
+@receiver(post_delete, sender=AestheticRecipe)
+def invalidate_recipe_listings(sender, instance, **kwargs):
+    """Drop cached recipe lists and fragments after any recipe change."""
+    transaction.on_commit(invalidate_recipes)
+
+
+@receiver(post_save, sender=ArtPiece)
+@receiver(post_delete, sender=ArtPiece)
+def invalidate_art_listings(sender, instance, **kwargs):
+    """Drop cached art fragments after any art piece change."""
+    transaction.on_commit(invalidate_art)
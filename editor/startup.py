@@ -0,0 +1,106 @@
+"""
+Worker startup - optional warm-up of the render path, and startup timings.
+
+Web workers import the engine lazily: NumPy, Pillow and the JIT backend
+load with the first render, so workers that only serve pages never pay
+for them. Render hosts can instead set LUMINA_WARM_UP, and the WSGI/ASGI
+module then calls warm_up() while it is imported. Under a pre-forking
+server that loads the application once (gunicorn --preload) this runs in
+the master, and every forked worker starts with the engine imported, the
+backend compiled, Pillow's plugins registered and, optionally, the sort
+key lookup tables built and shared copy-on-write.
+"""
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from io import BytesIO
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Modules whose presence tells a warmed worker from a lazy one
+HEAVY_MODULES = ('numpy', 'PIL.Image', 'numba')
+WARM_UP_SIZE = (64, 48)
+# Encoders the render, preview, export and tile paths use
+WARM_UP_FORMATS = ('PNG', 'JPEG', 'WEBP')
+
+# (phase, seconds) of this process' warm-up, in order
+_timings = []
+
+
+@contextmanager
+def _timed(phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings.append((phase, time.perf_counter() - start))
+
+
+def warm_up(tables: str = None) -> list:
+    """
+    Import and exercise the render path once, so the first real render does not.
+
+    Args:
+        tables: Sort key codes whose lookup tables to build (defaults to
+                LUMINA_WARM_UP_TABLES)
+    Returns:
+        (phase, seconds) of each warm-up step
+    """
+    tables = getattr(settings, 'LUMINA_WARM_UP_TABLES', '') if tables is None else tables
+    _timings.clear()
+
+    with _timed('import engine'):
+        from PIL import Image
+
+        from . import engine
+        from .engine.backends import get_backend
+        from .services import bulk, costs, rendering, speculative, tiles  # noqa: F401
+    with _timed('load image plugins'):
+        Image.init()
+    with _timed('backend'):
+        backend = get_backend()
+    with _timed('render'):
+        tiny_render()
+    if tables:
+        with _timed('sort key tables'):
+            engine.warm_tables(tables)
+    with _timed('url patterns'):
+        from django.urls import get_resolver
+        get_resolver().url_patterns
+
+    logger.info('Warmed up the %s backend in %.2fs (%s)', backend.name, sum(s for _, s in _timings),
+                ', '.join(f'{phase} {seconds:.2f}s' for phase, seconds in _timings))
+    return list(_timings)
+
+
+def tiny_render() -> None:
+    """Decode, sort and encode a small image through the engine."""
+    import numpy as np
+    from PIL import Image
+
+    from .engine import PixelSorter, process_image
+
+    width, height = WARM_UP_SIZE
+    pixels = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels, mode='RGB').save(buffer, format='PNG')
+    buffer.seek(0)
+    with Image.open(buffer) as img:
+        image = process_image(img)
+        # Compact sorters take the lookup-table key path of the render services
+        PixelSorter(img, compact=True).sort(sort_by='H')
+    for format in WARM_UP_FORMATS:
+        image.save(BytesIO(), format=format)
+
+
+def startup_report() -> dict:
+    """How this process started: warm-up phases and the heavy modules it holds."""
+    return {
+        'warmed_up': bool(_timings),
+        'warm_up': dict(_timings),
+        'modules': [name for name in HEAVY_MODULES if name in sys.modules],
+    }
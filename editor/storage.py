@@ -0,0 +1,120 @@
+"""
+Content-addressed media storage.
+Files are named by the SHA-256 of their bytes, so identical uploads,
+renders and exports share a single file on disk.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+import uuid
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+CHUNK_SIZE = 64 * 1024
+INCOMING_DIR = '.incoming'
+
+CONTENT_NAME_RE = re.compile(r'(?:^|/)([0-9a-f]{2})/(\1[0-9a-f]{62})\.\w+$')
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        while chunk := fp.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_hash(name: str):
+    """The SHA-256 a content-addressed name was derived from, or None."""
+    match = CONTENT_NAME_RE.search(name or '')
+    return match.group(2) if match else None
+
+
+def source_id(name: str) -> str:
+    """Stable id of a stored file: its content hash, or a hash of its name."""
+    return content_hash(name) or uuid.uuid5(uuid.NAMESPACE_URL, name).hex
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that stores '<dir>/<name>.<ext>' as
+    '<dir>/<hh>/<sha256>.<ext>'.
+
+    Writes land in a temp file next to the media root and are renamed
+    into place, so content is never buffered in memory. Saving bytes
+    that already exist only refreshes the existing file's mtime.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save()
+        return name
+
+    def _incoming(self, suffix: str):
+        directory = self.path(INCOMING_DIR)
+        os.makedirs(directory, exist_ok=True)
+        return tempfile.mkstemp(dir=directory, suffix=suffix)
+
+    def _save(self, name, content):
+        suffix = os.path.splitext(name)[1].lower()
+        fd, tmp_path = self._incoming(suffix)
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                os.close(fd)
+                file_move_safe(content.temporary_file_path(), tmp_path, allow_overwrite=True)
+                digest = _hash_file(tmp_path)
+            else:
+                hasher = hashlib.sha256()
+                with os.fdopen(fd, 'wb') as fp:
+                    if hasattr(content, 'seek'):
+                        content.seek(0)
+                    for chunk in content.chunks(CHUNK_SIZE):
+                        hasher.update(chunk)
+                        fp.write(chunk)
+                digest = hasher.hexdigest()
+            return self._commit(tmp_path, name, digest)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def save_stream(self, name: str, write) -> str:
+        """
+        Store whatever write(fp) writes, without an in-memory buffer.
+
+        Args:
+            name: Requested name; only its directory and extension are kept
+            write: Callable taking a seekable binary file object
+        Returns:
+            The content-addressed name the file was stored under
+        """
+        fd, tmp_path = self._incoming(os.path.splitext(name)[1].lower())
+        try:
+            with os.fdopen(fd, 'w+b') as fp:
+                write(fp)
+            return self._commit(tmp_path, name, _hash_file(tmp_path))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _commit(self, tmp_path: str, name: str, digest: str) -> str:
+        directory = posixpath.dirname(name.replace('\\', '/'))
+        suffix = os.path.splitext(name)[1].lower()
+        final_name = posixpath.join(directory, digest[:2], digest + suffix)
+        final_path = self.path(final_name)
+
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+            os.utime(final_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+            if self.file_permissions_mode is not None:
+                os.chmod(final_path, self.file_permissions_mode)
+        return final_name
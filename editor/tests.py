@@ -0,0 +1,345 @@
+"""
+LUMINA_SORT Tests - engine backends, 16-bit images, media access and
+release, the render scheduler, tiles and re-render jobs.
+
+Run with `python manage.py test editor`.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from io import BytesIO
+from itertools import product
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from PIL import Image
+
+from .engine import PixelSorter, is_high_bit, read_high_bit, save_high_bit, save_processed
+from .engine.backends import available_backends, get_backend
+from .engine.color_utils import pack_keys
+from .models import ArtPiece, RenderJob, RenderJobItem
+from .services import rerender
+from .services.scheduler import RenderRejected, RenderScheduler
+from .storage import source_id
+
+
+class BackendParityTests(SimpleTestCase):
+    """Every available backend sorts exactly like the NumPy reference."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.pixels = rng.random((40, 48, 3))
+        # Quantized keys force plenty of ties, which is where sorts diverge
+        self.keys = np.round(self.pixels.mean(axis=-1) * 8) / 8
+        self.mask = (self.keys > 0.2) & (self.keys < 0.9)
+
+    def test_backends_match_reference(self):
+        wide = np.round(self.pixels * 65535).astype(np.uint16)
+        # Composite sorts hand the backends packed integer keys instead
+        packed = pack_keys([self.keys, np.round(self.pixels[..., 0] * 4) / 4])
+        sources = {'float': self.pixels, 'uint16': wide}
+        key_sets = {'plain': self.keys, 'packed': packed}
+
+        for (source, keys, reverse) in product(sources, key_sets, (False, True)):
+            expected = sources[source].copy()
+            get_backend('numpy').sort_lines(expected, self.mask, key_sets[keys], reverse)
+            for name in available_backends():
+                with self.subTest(backend=name, pixels=source, keys=keys, reverse=reverse):
+                    actual = sources[source].copy()
+                    get_backend(name).sort_lines(actual, self.mask, key_sets[keys], reverse)
+                    np.testing.assert_array_equal(actual, expected)
+                    self.assertEqual(actual.dtype, expected.dtype)
+
+    def test_sort_is_stable(self):
+        lines = np.arange(6, dtype=np.float64).reshape(1, 6, 1).repeat(3, axis=2)
+        keys = np.array([[1.0, 0.0, 1.0, 0.0, 1.0, 0.0]])
+        mask = np.ones((1, 6), dtype=bool)
+        for name in available_backends():
+            with self.subTest(backend=name):
+                actual = lines.copy()
+                get_backend(name).sort_lines(actual, mask, keys, False)
+                self.assertEqual(actual[0, :, 0].tolist(), [1, 3, 5, 0, 2, 4])
+
+
+def _encoded(pixels: np.ndarray, format: str = 'PNG') -> BytesIO:
+    """An in-memory image file of uint8 or uint16 pixels."""
+    buffer = BytesIO()
+    if pixels.dtype == np.uint16 and pixels.ndim == 3:
+        save_high_bit(pixels, buffer, format)
+    elif pixels.dtype == np.uint16:
+        Image.fromarray(pixels, mode='I;16').save(buffer, format=format)
+    else:
+        Image.fromarray(pixels).save(buffer, format=format)
+    buffer.seek(0)
+    return buffer
+
+
+class HighBitDepthTests(SimpleTestCase):
+    """16-bit sources keep their precision; 8-bit ones are unaffected."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.wide = rng.integers(0, 65536, (24, 40, 3), dtype=np.uint16)
+        self.narrow = rng.integers(0, 256, (24, 40, 3), dtype=np.uint8)
+
+    def test_round_trip(self):
+        for format in ('PNG', 'TIFF'):
+            with self.subTest(format=format), Image.open(_encoded(self.wide, format)) as image:
+                self.assertTrue(is_high_bit(image))
+                np.testing.assert_array_equal(read_high_bit(image), self.wide)
+
+    def test_sorting_keeps_16_bits(self):
+        gray = self.wide[..., 0]
+        sources = {'RGB': self.wide, 'I;16': gray}
+        for name, pixels in sources.items():
+            with self.subTest(source=name):
+                with Image.open(_encoded(pixels)) as image:
+                    self.assertTrue(is_high_bit(image))
+                    sorter = PixelSorter(image)
+                    self.assertEqual(sorter.bit_depth, 16)
+                    self.assertEqual(sorter.sort().dtype, np.uint16)
+
+                output = BytesIO()
+                with Image.open(_encoded(pixels)) as image:
+                    self.assertEqual(save_processed(image, output), 16)
+                output.seek(0)
+                with Image.open(output) as image:
+                    self.assertTrue(is_high_bit(image))
+                    self.assertEqual(read_high_bit(image).dtype, np.uint16)
+
+    def test_8_bit_sources_stay_8_bit(self):
+        with Image.open(_encoded(self.narrow)) as image:
+            self.assertFalse(is_high_bit(image))
+            sorter = PixelSorter(image, compact=True)
+            self.assertEqual(sorter.bit_depth, 8)
+            self.assertEqual(sorter.sort().dtype, np.uint8)
+
+        output = BytesIO()
+        with Image.open(_encoded(self.narrow)) as image:
+            self.assertEqual(save_processed(image, output), 8)
+        output.seek(0)
+        with Image.open(output) as image:
+            self.assertFalse(is_high_bit(image))
+            self.assertEqual(image.mode, 'RGB')
+
+    def test_widened_8_bit_image_sorts_the_same(self):
+        # v * 257 maps 0..255 onto 0..65535, so every key is unchanged
+        widened = self.narrow.astype(np.uint16) * 257
+        for sort_by, direction in product(('L', 'H', 'HL'), 'VH'):
+            params = {'sort_by': sort_by, 'sort_direction': direction}
+            with self.subTest(**params):
+                with Image.open(_encoded(self.narrow)) as image:
+                    narrow = PixelSorter(image, compact=True).sort(**params)
+                with Image.open(_encoded(widened)) as image:
+                    wide = PixelSorter(image).sort(**params)
+                np.testing.assert_array_equal(wide, narrow.astype(np.uint16) * 257)
+
+
+class MediaFilesMixin:
+    """Media, tiles and gradients in a temp directory, caches in memory."""
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        overrides = override_settings(
+            MEDIA_ROOT=root,
+            LUMINA_TILE_ROOT=os.path.join(root, 'tiles'),
+            LUMINA_GRADIENT_ROOT=os.path.join(root, 'gradients'),
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            LUMINA_SPECULATIVE_RECIPES=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.owner = User.objects.create_user('owner', password='pw')
+
+    def store(self, directory: str = 'originals', seed: int = 0) -> str:
+        pixels = np.random.default_rng(seed).integers(0, 256, (24, 32, 3), dtype=np.uint8)
+        return default_storage.save(f'{directory}/image.png', ContentFile(_encoded(pixels).getvalue()))
+
+    def art_piece(self, seed: int = 0, **fields) -> ArtPiece:
+        fields.setdefault('user', self.owner)
+        return ArtPiece.objects.create(title='t', original_image=self.store(seed=seed), **fields)
+
+
+class MediaAccessTests(MediaFilesMixin, TestCase):
+    """Media is only served to those who may see a piece using it, and revalidated by ETag."""
+
+    def test_owner_gets_immutable_file_and_304(self):
+        art_piece = self.art_piece()
+        self.client.force_login(self.owner)
+        url = art_piece.original_image.url
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+        b''.join(response.streaming_content)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_other_users_and_anonymous_get_404(self):
+        art_piece = self.art_piece()
+        url = art_piece.original_image.url
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(User.objects.create_user('other', password='pw'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_public_piece_is_shared_cacheable(self):
+        art_piece = self.art_piece(is_public=True)
+        response = self.client.get(art_piece.original_image.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        b''.join(response.streaming_content)
+
+
+@override_settings(LUMINA_MEDIA_GRACE_SECONDS=0)
+class MediaReleaseTests(MediaFilesMixin, TestCase):
+    """Content-addressed files are deleted with the last piece referencing them."""
+
+    def test_shared_file_outlives_first_piece(self):
+        first, second = self.art_piece(seed=1), self.art_piece(seed=1)
+        name = first.original_image.name
+        self.assertEqual(second.original_image.name, name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(name))
+
+    def test_replaced_render_is_released(self):
+        art_piece = self.art_piece(processed_image=self.store('processed', seed=2))
+        old = art_piece.processed_image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            art_piece.processed_image = self.store('processed', seed=3)
+            art_piece.save()
+        self.assertFalse(default_storage.exists(old))
+
+    @override_settings(LUMINA_MEDIA_GRACE_SECONDS=3600)
+    def test_fresh_files_wait_for_the_grace_period(self):
+        art_piece = self.art_piece()
+        name = art_piece.original_image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            art_piece.delete()
+        self.assertTrue(default_storage.exists(name))
+
+
+class SchedulerTests(SimpleTestCase):
+    """Renders start in weighted fair order and within each user's budgets."""
+
+    def setUp(self):
+        self.gate = threading.Event()
+        self.started = []
+        self.addCleanup(self.gate.set)
+
+    def job(self, name):
+        self.started.append(name)
+        self.gate.wait(5)
+        return name
+
+    def test_users_take_turns(self):
+        scheduler = RenderScheduler(capacity=1, max_running=1, seconds_per_minute=1000)
+        futures = [scheduler.schedule('a', 1.0, self.job, f'a{i}') for i in range(3)]
+        futures.append(scheduler.schedule('b', 1.0, self.job, 'b0'))
+        self.gate.set()
+        for future in futures:
+            future.result(5)
+        self.assertEqual(self.started, ['a0', 'b0', 'a1', 'a2'])
+
+    def test_heavier_weight_goes_first(self):
+        scheduler = RenderScheduler(capacity=1, max_running=1, seconds_per_minute=1000)
+        futures = [scheduler.schedule('first', 1.0, self.job, 'first')]
+        futures += [scheduler.schedule('light', 1.0, self.job, 'light', weight=0.5)]
+        futures += [scheduler.schedule('heavy', 1.0, self.job, 'heavy', weight=2.0)]
+        self.gate.set()
+        for future in futures:
+            future.result(5)
+        self.assertEqual(self.started, ['first', 'heavy', 'light'])
+
+    def test_render_seconds_budget_holds_back_a_user(self):
+        scheduler = RenderScheduler(capacity=2, max_running=2, seconds_per_minute=2)
+        first = scheduler.schedule('a', 1.5, self.job, 'a0')
+        second = scheduler.schedule('a', 1.5, self.job, 'a1')
+        other = scheduler.schedule('b', 1.5, self.job, 'b0')
+        self.gate.set()
+        self.assertEqual(first.result(5), 'a0')
+        self.assertEqual(other.result(5), 'b0')
+        self.assertEqual(scheduler.stats()['users']['a']['queued'], 1)
+        self.assertTrue(second.cancel())
+
+    def test_limits_reject(self):
+        scheduler = RenderScheduler(capacity=1, max_queued=1, max_seconds=10, max_bytes=100)
+        with self.assertRaises(RenderRejected):
+            scheduler.schedule('a', 20, self.job, 'slow')
+        with self.assertRaises(RenderRejected):
+            scheduler.schedule('a', 1, self.job, 'big', peak_bytes=200)
+        running = scheduler.schedule('a', 1, self.job, 'a0')
+        queued = scheduler.schedule('a', 1, self.job, 'a1')
+        with self.assertRaises(RenderRejected):
+            scheduler.schedule('a', 1, self.job, 'a2')
+        self.gate.set()
+        running.result(5)
+        queued.result(5)
+
+
+class TileAccessTests(MediaFilesMixin, TestCase):
+    """Tile visibility is checked before If-None-Match."""
+
+    def setUp(self):
+        super().setUp()
+        self.art_piece = self.art_piece(processed_image=self.store('processed', seed=4))
+        source = source_id(self.art_piece.processed_image.name)
+        self.urls = [
+            f'/tiles/{self.art_piece.pk}/{source}.dzi',
+            f'/tiles/{self.art_piece.pk}/{source}_files/0/0_0.webp',
+        ]
+
+    def test_owner_revalidates(self):
+        self.client.force_login(self.owner)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                response.close()
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_stale_etag_of_private_piece_is_not_revalidated(self):
+        self.client.force_login(self.owner)
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        self.client.logout()
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+
+class RerenderResumeTests(MediaFilesMixin, TransactionTestCase):
+    """Resuming a job renders only its pending items."""
+
+    def test_resume_renders_pending_items(self):
+        pieces = [self.art_piece(seed=seed, custom_sort_by='H') for seed in range(3)]
+        job = RenderJob.objects.create(total=3, rendered=1, status='running')
+        done = RenderJobItem.objects.create(job=job, art_piece=pieces[0], status='done')
+        pending = [RenderJobItem.objects.create(job=job, art_piece=piece) for piece in pieces[1:]]
+
+        # As if the server restarted while the job was running
+        rerender._run_job(job.pk, threading.Event())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rendered, job.failed), ('done', 3, 0))
+        done.refresh_from_db()
+        self.assertIsNone(done.seconds)
+        for item in pending:
+            item.refresh_from_db()
+            self.assertEqual(item.status, 'done')
+        pieces = [ArtPiece.objects.get(pk=piece.pk) for piece in pieces]
+        self.assertFalse(pieces[0].processed_image)
+        self.assertTrue(all(piece.processed_image for piece in pieces[1:]))
@@ -5,7 +5,9 @@ from django.urls import path
 from django.contrib.auth import views as auth_views
 from .views import (
     home, public_gallery, signup, gallery, delete_art, toggle_public,
-    upload, process, result, export_image, recipes_list, create_recipe, save_as_recipe
+    upload, bulk_upload, process, recipe_preview, render_stream, result, export_image, export_presets,
+    export_animation, render_queue, tile_descriptor, tile,
+    recipes_list, create_recipe, save_as_recipe, api_art, api_recipes
 )
 
 urlpatterns = [
@@ -19,9 +21,17 @@ urlpatterns = [
     
     # Image workflow
     path('upload/', upload, name='upload'),
+    path('upload/bulk/', bulk_upload, name='bulk_upload'),
     path('process/<int:art_id>/', process, name='process'),
+    path('process/<int:art_id>/stream/<str:token>/', render_stream, name='render_stream'),
+    path('process/<int:art_id>/preview/<int:recipe_id>/', recipe_preview, name='recipe_preview'),
     path('result/<int:art_id>/', result, name='result'),
+    path('tiles/<int:art_id>/<str:source>.dzi', tile_descriptor, name='tile_descriptor'),
+    path('tiles/<int:art_id>/<str:source>_files/<int:level>/<int:col>_<int:row>.webp', tile, name='tile'),
     path('export/<int:art_id>/<str:format_type>/', export_image, name='export'),
+    path('export/<int:art_id>/', export_presets, name='export_presets'),
+    path('animate/<int:art_id>/', export_animation, name='export_animation'),
+    path('queue/', render_queue, name='render_queue'),
     
     # Gallery
     path('gallery/', gallery, name='gallery'),
@@ -33,4 +43,8 @@ urlpatterns = [
     path('recipes/', recipes_list, name='recipes'),
     path('recipes/create/', create_recipe, name='create_recipe'),
     path('recipes/save/<int:art_id>/', save_as_recipe, name='save_recipe'),
+    
+    # JSON feeds
+    path('api/art/', api_art, name='api_art'),
+    path('api/recipes/', api_recipes, name='api_recipes'),
 ]
@@ -4,8 +4,13 @@ LUMINA_SORT Views - Component exports
 from .public import home, public_gallery
 from .auth import signup
 from .gallery import gallery, delete_art, toggle_public
-from .processing import upload, process, result, export_image
+from .processing import (
+    upload, bulk_upload, process, recipe_preview, render_stream, result, export_image, export_presets, export_animation,
+    render_queue
+)
 from .recipes import recipes_list, create_recipe, save_as_recipe
+from .media import serve_media, tile_descriptor, tile
+from .api import api_art, api_recipes
 
 __all__ = [
     'home',
@@ -15,10 +20,21 @@ __all__ = [
     'delete_art',
     'toggle_public',
     'upload',
+    'bulk_upload',
     'process',
+    'recipe_preview',
+    'render_stream',
     'result',
     'export_image',
+    'export_presets',
+    'export_animation',
+    'render_queue',
     'recipes_list',
     'create_recipe',
     'save_as_recipe',
+    'serve_media',
+    'tile_descriptor',
+    'tile',
+    'api_art',
+    'api_recipes',
 ]
@@ -0,0 +1,39 @@
+"""
+API views - Read-only JSON feeds of public art and recipes.
+"""
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from ..services.api import ApiError, feed_page, parse_query
+
+
+def _feed(request, feed):
+    """Serve one page of a feed, or 304 when the client's copy is current."""
+    try:
+        query = parse_query(feed, request.GET)
+    except ApiError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    page = feed_page(feed, query, request.build_absolute_uri)
+    response = get_conditional_response(request, etag=page.etag, last_modified=int(page.last_modified))
+    if response is None:
+        response = HttpResponse(page.body, content_type='application/json')
+    response['ETag'] = page.etag
+    response['Last-Modified'] = http_date(page.last_modified)
+    patch_cache_control(response, public=True, no_cache=True)
+    patch_vary_headers(response, ['Host'])
+    return response
+
+
+@require_safe
+def api_art(request):
+    """Public art pieces, newest first."""
+    return _feed(request, 'art')
+
+
+@require_safe
+def api_recipes(request):
+    """Public recipes, newest first."""
+    return _feed(request, 'recipes')
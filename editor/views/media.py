@@ -0,0 +1,107 @@
+"""
+Media views - Uploaded and rendered files with HTTP caching.
+"""
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from ..models import ArtPiece
+from ..services.media import file_response, referencing
+from ..storage import INCOMING_DIR, content_hash, source_id
+
+# Content-addressed names never change content, so caches may keep them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def _visible(request) -> Q:
+    """Art pieces the user may see: public ones and their own."""
+    visible = Q(is_public=True)
+    if request.user.is_authenticated:
+        visible |= Q(user=request.user)
+    return visible
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve a media file of an art piece the user may see.
+
+    Content-addressed files are cached as immutable; only files of a
+    public piece may be kept by shared caches.
+    """
+    name = posixpath.normpath(path).lstrip('/')
+    if name.startswith(INCOMING_DIR) or not default_storage.exists(name):
+        raise Http404('No such file.')
+    # Identical content is stored once, so several pieces may share the file
+    shared = list(referencing(name).filter(_visible(request)).values_list('is_public', flat=True))
+    if not shared:
+        raise Http404('No such file.')
+    audience = {'public': True} if any(shared) else {'private': True}
+    
+    digest = content_hash(name)
+    if digest:
+        etag, last_modified = f'"{digest}"', None
+    else:
+        etag, last_modified = None, default_storage.get_modified_time(name).timestamp()
+    
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = file_response(name)
+    
+    if digest:
+        response['ETag'] = etag
+        patch_cache_control(response, max_age=IMMUTABLE_MAX_AGE, immutable=True, **audience)
+    else:
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True, **audience)
+    return response
+
+
+def _tiled_render(request, art_id, source):
+    """The processed image of a piece the user may see, if source still names it."""
+    art_piece = get_object_or_404(ArtPiece.objects.filter(_visible(request)), id=art_id)
+    if not art_piece.processed_image or source_id(art_piece.processed_image.name) != source:
+        raise Http404('No such render.')
+    return art_piece.processed_image
+
+
+def _immutable(response, etag):
+    # The source id is in the URL, so a re-render gets new URLs
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
+
+
+@require_safe
+def tile_descriptor(request, art_id, source):
+    """Deep Zoom (.dzi) descriptor of a render."""
+    from ..services.tiles import descriptor
+    # Checked before the ETag, so a stale copy of a private piece is not revalidated
+    render = _tiled_render(request, art_id, source)
+    etag = f'"{source}-dzi"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(descriptor(render), content_type='application/xml')
+    return _immutable(response, etag)
+
+
+@require_safe
+def tile(request, art_id, source, level, col, row):
+    """One WebP tile of a render's pyramid, cut on first request."""
+    from ..services.tiles import tile_path
+    render = _tiled_render(request, art_id, source)
+    etag = f'"{source}-{level}-{col}-{row}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            path = tile_path(render, level, col, row)
+        except ValueError as e:
+            raise Http404(str(e))
+        response = FileResponse(open(path, 'rb'), content_type='image/webp')
+    return _immutable(response, etag)
@@ -1,19 +1,42 @@
 """
 Image processing views - Upload, process, result, export.
 """
+import asyncio
+import base64
+import json
+import tempfile
 import uuid
-from io import BytesIO
 
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse
-from django.core.files.base import ContentFile
-from PIL import Image
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.cache import cache
+from django.core.files.base import File
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
 
-from ..models import AestheticRecipe, ArtPiece
-from ..forms import ImageUploadForm, ProcessingForm
-from ..engine import process_image, crop_for_instagram
+# The engine and the render services load NumPy and Pillow, so they are
+# reached through their lazy packages and only imported by the first render
+from .. import engine, services
+from ..models import ArtPiece
+from ..forms import ImageUploadForm, BulkUploadForm, ProcessingForm, AnimationForm, ExportPresetsForm
+from ..services.cache import public_recipes
+from ..services.executor import run_in_executor, stream_from_executor
+from ..services.media import file_response, save_stream
+from ..services.scheduler import RenderRejected, user_weight, get_scheduler, run_scheduled
+from ..storage import source_id
+
+
+# Presets kept on their own ArtPiece field; the others only live in bundles
+STORED_EXPORTS = {'story': 'export_story', 'post': 'export_post'}
+
+# Progressive renders wait in the cache until the result page streams them
+PROGRESSIVE_KEY = 'lumina:progressive:{}'
+PROGRESSIVE_TIMEOUT = 300
+KEEPALIVE_SECONDS = 15
 
 
 @login_required
@@ -22,11 +45,14 @@ def upload(request):
     if request.method == 'POST':
         form = ImageUploadForm(request.POST, request.FILES)
         if form.is_valid():
+            image = form.cleaned_data['image']
             art_piece = ArtPiece.objects.create(
                 user=request.user,
                 title=form.cleaned_data.get('title') or 'Untitled',
-                original_image=form.cleaned_data['image']
+                original_image=image,
+                luminosity_profile=services.profile_image(image)
             )
+            services.speculate(art_piece)
             return redirect('process', art_id=art_piece.id)
     else:
         form = ImageUploadForm()
@@ -34,30 +60,110 @@ def upload(request):
 
 
 @login_required
-def process(request, art_id):
+async def bulk_upload(request):
+    """Upload many images (or a ZIP archive) in one request."""
+    user = await request.auser()
+    if request.method == 'POST':
+        form = BulkUploadForm(request.POST, request.FILES)
+        if await sync_to_async(form.is_valid)():
+            art_pieces, errors = await sync_to_async(services.ingest_uploads)(
+                user,
+                files=form.cleaned_data['images'],
+                archive=form.cleaned_data['archive'],
+                recipe=form.cleaned_data['recipe'],
+            )
+            for error in errors[:10]:
+                messages.warning(request, error)
+            if art_pieces:
+                rendering = ' and queued for rendering' if form.cleaned_data['recipe'] else ''
+                messages.success(request, f'Uploaded {len(art_pieces)} images{rendering}.')
+                return redirect('gallery')
+    else:
+        form = BulkUploadForm()
+    return await sync_to_async(render)(request, 'editor/bulk_upload.html', {
+        'form': form,
+        'recipes': await sync_to_async(public_recipes)(),
+    })
+
+
+@login_required
+async def process(request, art_id):
     """Image processing view with parameter controls."""
-    art_piece = get_object_or_404(ArtPiece, id=art_id, user=request.user)
+    user = await request.auser()
+    art_piece = await aget_object_or_404(ArtPiece, id=art_id, user=user)
     
     if request.method == 'POST':
-        form = ProcessingForm(request.POST)
-        if form.is_valid():
-            params = _extract_params(form, art_piece)
+        form = ProcessingForm(request.POST, request.FILES)
+        params = await sync_to_async(_validate_params)(form, art_piece)
+        if params is not None:
+            if await sync_to_async(services.adopt_cached_render)(art_piece, params):
+                # Speculation keeps going: the other top recipes may be tried next
+                messages.success(request, 'Image processed successfully!')
+                return redirect('result', art_id=art_piece.id)
+            services.cancel_speculation(art_piece.id)
+            if form.cleaned_data['progressive']:
+                token = await sync_to_async(_queue_progressive)(user, art_piece, params)
+                return redirect(f"{reverse('result', args=[art_piece.id])}?render={token}")
             try:
-                _process_and_save(art_piece, params)
+                prediction = await run_in_executor(services.predict, art_piece, params)
+                await run_scheduled(
+                    user.pk, prediction.seconds, services.render_art_piece, art_piece, params,
+                    weight=user_weight(user), peak_bytes=prediction.peak_bytes
+                )
                 messages.success(request, 'Image processed successfully!')
                 return redirect('result', art_id=art_piece.id)
+            except RenderRejected as e:
+                messages.error(request, str(e))
             except Exception as e:
                 messages.error(request, f'Processing error: {str(e)}')
     else:
         form = ProcessingForm()
     
-    return render(request, 'editor/process.html', {
+    # The first call reads the fitted models from disk
+    cost_model = await sync_to_async(services.get_cost_model)()
+    if art_piece.luminosity_profile is None:
+        # Pieces uploaded before profiles existed get one on first visit
+        art_piece.luminosity_profile = await run_in_executor(
+            services.profile_image, art_piece.original_image.path
+        )
+        await art_piece.asave(update_fields=['luminosity_profile'])
+    
+    return await sync_to_async(render)(request, 'editor/process.html', {
         'form': form,
         'art_piece': art_piece,
-        'recipes': AestheticRecipe.objects.filter(is_public=True)[:10]
+        'recipes': await sync_to_async(public_recipes)(10),
+        'speculative_recipes': getattr(settings, 'LUMINA_SPECULATIVE_RECIPES', 3),
+        'cost_model': {
+            'time': cost_model.time, 'memory': cost_model.memory,
+            'color_keys': engine.table_keys(False), 'channel_keys': engine.table_keys(True).replace('L', ''),
+        },
     })
 
 
+@login_required
+def recipe_preview(request, art_id, recipe_id):
+    """Speculative preview of a recipe on an art piece, once it has been rendered."""
+    art_piece = get_object_or_404(ArtPiece, id=art_id, user=request.user)
+    recipe = next((recipe for recipe in public_recipes() if recipe.pk == recipe_id), None)
+    preview = cache.get(services.preview_key(art_piece, recipe.get_params())) if recipe else None
+    if preview is None:
+        raise Http404('No preview of this recipe yet.')
+    response = HttpResponse(preview, content_type='image/jpeg')
+    patch_cache_control(response, private=True, max_age=getattr(settings, 'LUMINA_RENDER_CACHE_TIMEOUT', 300))
+    return response
+
+
+def _validate_params(form, art_piece):
+    """Validate the form and extract its parameters, None if invalid."""
+    if not form.is_valid():
+        return None
+    params = _extract_params(form, art_piece)
+    region = _extract_region(form, art_piece)
+    if region:
+        params['region'] = region
+    return params
+
+
 def _extract_params(form, art_piece):
     """Extract processing parameters from form or recipe."""
     recipe = form.cleaned_data.get('recipe')
@@ -65,79 +171,357 @@ def _extract_params(form, art_piece):
     if recipe:
         art_piece.recipe_used = recipe
         recipe.increment_usage()
-        return {
-            'threshold_low': recipe.threshold_low,
-            'threshold_high': recipe.threshold_high,
-            'sort_direction': recipe.sort_direction,
-            'sort_by': recipe.sort_by,
-            'reverse_sort': recipe.reverse_sort,
-        }
+        return recipe.get_params()
     
     art_piece.custom_threshold_low = form.cleaned_data['threshold_low']
     art_piece.custom_threshold_high = form.cleaned_data['threshold_high']
     art_piece.custom_sort_direction = form.cleaned_data['sort_direction']
-    art_piece.custom_sort_by = form.cleaned_data['sort_by']
+    art_piece.custom_sort_by = form.cleaned_data['sort_by'] + form.cleaned_data['then_by']
+    art_piece.custom_interval_mode = form.cleaned_data['interval_mode'] or 'threshold'
+    art_piece.custom_edge_threshold = form.cleaned_data['edge_threshold']
     
-    return {
+    params = {
         'threshold_low': form.cleaned_data['threshold_low'],
         'threshold_high': form.cleaned_data['threshold_high'],
         'sort_direction': form.cleaned_data['sort_direction'],
-        'sort_by': form.cleaned_data['sort_by'],
+        'sort_by': art_piece.custom_sort_by,
         'reverse_sort': form.cleaned_data['reverse_sort'],
     }
+    if art_piece.custom_interval_mode == 'edges':
+        params['interval_mode'] = 'edges'
+        params['edge_threshold'] = art_piece.custom_edge_threshold or 0.25
+    return params
 
 
-def _process_and_save(art_piece, params):
-    """Process image and save result."""
-    with Image.open(art_piece.original_image.path) as img:
-        processed = process_image(img, **params)
-        
-        buffer = BytesIO()
-        processed.save(buffer, format='PNG', quality=95)
-        buffer.seek(0)
-        
-        filename = f"processed_{uuid.uuid4().hex[:8]}.png"
-        art_piece.processed_image.save(filename, ContentFile(buffer.read()), save=False)
-        art_piece.save()
+def _extract_region(form, art_piece):
+    """Store the submitted region on the art piece and return its spec."""
+    art_piece.custom_region = {
+        key: form.cleaned_data[f'region_{key}']
+        for key in ('rect', 'polygon')
+        if form.cleaned_data[f'region_{key}']
+    } or None
+    
+    mask = form.cleaned_data['region_mask']
+    if mask:
+        art_piece.region_mask.save(mask.name, mask, save=False)
+    else:
+        art_piece.region_mask = None
+    return art_piece.get_region()
+
+
+def _queue_progressive(user, art_piece, params):
+    """Store the settings and park the render until the result page streams it."""
+    art_piece.save()
+    token = uuid.uuid4().hex
+    cache.set(PROGRESSIVE_KEY.format(token), {
+        'user': user.pk, 'art_id': art_piece.id, 'params': params
+    }, PROGRESSIVE_TIMEOUT)
+    return token
 
 
 @login_required
-def result(request, art_id):
+async def render_stream(request, art_id, token):
+    """Run a parked progressive render, streaming its bands as Server-Sent Events."""
+    user = await request.auser()
+    art_piece = await aget_object_or_404(ArtPiece, id=art_id, user=user)
+    
+    # Each render streams once; a reconnecting EventSource gets a 404
+    key = PROGRESSIVE_KEY.format(token)
+    job = await cache.aget(key)
+    if not job or job['user'] != user.pk or job['art_id'] != art_piece.id:
+        raise Http404('No render is waiting.')
+    await cache.adelete(key)
+    
+    response = StreamingHttpResponse(
+        _render_events(user, art_piece, job['params']), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+async def _render_events(user, art_piece, params):
+    """
+    Schedule the render and yield 'start', one 'band' per finished band,
+    then 'done' (with the stored image's URL) or 'failed'.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    
+    def on_band(band):
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(queue.put_nowait, band)
+    
+    profile = art_piece.luminosity_profile or {}
+    width, height = engine.preview_size((
+        profile.get('width') or art_piece.original_image.width,
+        profile.get('height') or art_piece.original_image.height,
+    ))
+    yield _event('start', {'width': width, 'height': height})
+    
+    try:
+        prediction = await run_in_executor(services.predict, art_piece, params)
+        # The render stores its result even if the client goes away
+        render = asyncio.ensure_future(run_scheduled(
+            user.pk, prediction.seconds, services.render_art_piece, art_piece, params, on_band=on_band,
+            weight=user_weight(user), peak_bytes=prediction.peak_bytes
+        ))
+        render.add_done_callback(lambda _: queue.put_nowait(None))
+        while True:
+            try:
+                band = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': waiting\n\n'
+                continue
+            if band is None:
+                break
+            yield _event('band', {
+                'index': band.index,
+                'count': band.count,
+                'box': band.preview_box,
+                'src': 'data:image/jpeg;base64,' + base64.b64encode(band.fragment).decode('ascii'),
+            })
+        await render
+    except RenderRejected as e:
+        yield _event('failed', {'message': str(e)})
+        return
+    except Exception as e:
+        yield _event('failed', {'message': f'Processing error: {str(e)}'})
+        return
+    yield _event('done', {'url': art_piece.processed_image.url})
+
+
+@login_required
+def render_queue(request):
+    """Render queue depth and wait times; staff also see every user's usage."""
+    stats = get_scheduler().stats()
+    users = stats.pop('users')
+    if request.user.is_staff:
+        stats['users'] = users
+    else:
+        stats['you'] = users.get(request.user.pk, {'queued': 0, 'running': 0, 'seconds_last_minute': 0.0})
+    return JsonResponse(stats)
+
+
+@login_required
+async def result(request, art_id):
     """Display the processed result."""
-    art_piece = get_object_or_404(ArtPiece, id=art_id, user=request.user)
-    return render(request, 'editor/result.html', {'art_piece': art_piece})
+    user = await request.auser()
+    art_piece = await aget_object_or_404(ArtPiece, id=art_id, user=user)
+    token = request.GET.get('render', '')
+    return await sync_to_async(render)(request, 'editor/result.html', {
+        'art_piece': art_piece,
+        'export_presets': ExportPresetsForm(initial={'presets': ['story', 'post']}),
+        'render_stream': reverse('render_stream', args=[art_piece.id, token]) if token.isalnum() else None,
+        'tile_source': reverse('tile_descriptor', args=[art_piece.id, source_id(art_piece.processed_image.name)])
+                       if art_piece.processed_image else None,
+    })
 
 
 @login_required
-def export_image(request, art_id, format_type):
-    """Export image for Instagram formats."""
-    art_piece = get_object_or_404(ArtPiece, id=art_id, user=request.user)
+async def export_image(request, art_id, format_type):
+    """Export image for Instagram formats, streamed while it is encoded."""
+    user = await request.auser()
+    art_piece = await aget_object_or_404(ArtPiece, id=art_id, user=user)
     
     if not art_piece.processed_image:
         messages.error(request, 'No processed image to export.')
         return redirect('result', art_id=art_id)
     
+    if format_type not in engine.EXPORT_PRESETS:
+        raise Http404('Unknown export preset.')
+    
+    source = _export_source(art_piece)
+    etag = f'"{source}-{format_type}"'
+    filename = f"export_{format_type}_{source[:8]}.png"
+    
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return _export_headers(response, etag)
+    
+    field = STORED_EXPORTS.get(format_type)
+    if field and getattr(art_piece, field):
+        return _export_headers(file_response(
+            getattr(art_piece, field).name, as_attachment=True, filename=filename, content_type='image/png'
+        ), etag)
+    
     try:
-        return _create_export(art_piece, format_type)
+        cropped = await run_in_executor(_crop_export, art_piece, format_type)
     except Exception as e:
         messages.error(request, f'Export error: {str(e)}')
         return redirect('result', art_id=art_id)
+    
+    response = StreamingHttpResponse(
+        _stream_export(art_piece, cropped, field, filename),
+        content_type='image/png'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return _export_headers(response, etag)
+
+
+def _export_source(art_piece):
+    """Exports only depend on the processed image, so its hash keys their ETags."""
+    return source_id(art_piece.processed_image.name)
+
+
+def _export_headers(response, etag):
+    """Exports live at a fixed URL, so browsers revalidate them by ETag."""
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
-def _create_export(art_piece, format_type):
-    """Create and return export file."""
+def _crop_export(art_piece, format_type):
+    """Decode the processed image and crop it for export."""
+    from PIL import Image
     with Image.open(art_piece.processed_image.path) as img:
-        cropped = crop_for_instagram(img, format_type)
-        field = 'export_story' if format_type == 'story' else 'export_post'
-        
-        buffer = BytesIO()
-        cropped.save(buffer, format='PNG', quality=95)
-        buffer.seek(0)
-        
-        filename = f"export_{format_type}_{uuid.uuid4().hex[:8]}.png"
-        getattr(art_piece, field).save(filename, ContentFile(buffer.read()), save=True)
+        return engine.render_preset(img, format_type)
+
+
+async def _stream_export(art_piece, image, field, filename):
+    """Yield PNG bytes as they are encoded, then store the export if it has a field."""
+    with tempfile.TemporaryFile() as tmp:
+        async for chunk in stream_from_executor(
+            lambda fp: image.save(fp, format='PNG', quality=95)
+        ):
+            tmp.write(chunk)
+            yield chunk
         
-        buffer.seek(0)
-        response = HttpResponse(buffer.getvalue(), content_type='image/png')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
+        if field:
+            tmp.seek(0)
+            await sync_to_async(getattr(art_piece, field).save)(filename, File(tmp), save=True)
+
+
+@login_required
+async def export_presets(request, art_id):
+    """Export several presets from one decode, as a ZIP bundle."""
+    user = await request.auser()
+    art_piece = await aget_object_or_404(ArtPiece, id=art_id, user=user)
+    
+    if not art_piece.processed_image:
+        messages.error(request, 'No processed image to export.')
+        return redirect('result', art_id=art_id)
+    
+    # A GET form, so the bundle can be revalidated by its ETag like single exports
+    form = ExportPresetsForm(request.GET)
+    if not form.is_valid():
+        messages.error(request, 'Choose at least one preset.')
+        return redirect('result', art_id=art_id)
+    
+    names = form.cleaned_data['presets']
+    source = _export_source(art_piece)
+    etag = '"{}-{}"'.format(source, '+'.join(sorted(names)))
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return _export_headers(response, etag)
+    
+    try:
+        cost = await sync_to_async(_presets_cost)(art_piece, names)
+        await run_scheduled(
+            user.pk, cost, _render_presets, art_piece, names,
+            weight=user_weight(user)
+        )
+    except RenderRejected as e:
+        messages.error(request, str(e))
+        return redirect('result', art_id=art_id)
+    except Exception as e:
+        messages.error(request, f'Export error: {str(e)}')
+        return redirect('result', art_id=art_id)
+    
+    return _export_headers(file_response(
+        art_piece.export_bundle.name,
+        as_attachment=True,
+        filename=f'exports_{source[:8]}.zip',
+        content_type='application/zip'
+    ), etag)
+
+
+def _presets_cost(art_piece, names):
+    """One decode plus every output, costed like the image work of a render."""
+    pixels = sum(engine.EXPORT_PRESETS[name].width * engine.EXPORT_PRESETS[name].height for name in names)
+    pixels += art_piece.processed_image.width * art_piece.processed_image.height
+    return services.get_cost_model().seconds({'megapixels': pixels / 1e6})
+
+
+def _render_presets(art_piece, names):
+    """Encode the presets in parallel and store them, and the bundle, in one save."""
+    from PIL import Image
+    with Image.open(art_piece.processed_image.path) as img:
+        encoded = engine.encode_presets(img.convert('RGB'), names)
+    
+    for name, data in encoded.items():
+        if name in STORED_EXPORTS:
+            save_stream(
+                getattr(art_piece, STORED_EXPORTS[name]), f'export_{name}.png',
+                lambda fp, data=data: fp.write(data), save=False
+            )
+    save_stream(art_piece.export_bundle, 'exports.zip', lambda fp: engine.write_bundle(encoded, fp), save=False)
+    art_piece.save()
+
+
+@login_required
+async def export_animation(request, art_id):
+    """Export a threshold sweep of the original as an animation."""
+    user = await request.auser()
+    art_piece = await aget_object_or_404(ArtPiece, id=art_id, user=user)
+    
+    if request.method != 'POST':
+        return redirect('result', art_id=art_id)
+    
+    form = AnimationForm(request.POST)
+    if not form.is_valid():
+        messages.error(request, 'Invalid animation settings.')
+        return redirect('result', art_id=art_id)
+    
+    try:
+        return await _create_animation(user, art_piece, form.cleaned_data)
+    except RenderRejected as e:
+        messages.error(request, str(e))
+        return redirect('result', art_id=art_id)
+    except Exception as e:
+        messages.error(request, f'Animation error: {str(e)}')
+        return redirect('result', art_id=art_id)
+
+
+async def _create_animation(user, art_piece, options):
+    """Render the sweep straight into storage, on the user's budget, and return it."""
+    format_type = options['format_type']
+    content_type, extension = engine.ANIMATION_FORMATS[format_type]
+    frame_params = engine.build_sweep(
+        await sync_to_async(art_piece.get_effective_params)(),
+        sweep=options['sweep'],
+        start=options['start'],
+        end=options['end'],
+        frames=options['frames'],
+        alternate_direction=options['alternate_direction'],
+    )
+    
+    filename = f"animation_{uuid.uuid4().hex[:8]}.{extension}"
+    workers = engine.frame_workers(getattr(settings, 'LUMINA_ANIMATION_WORKERS', 1))
+    prediction = await run_in_executor(services.predict_animation, art_piece, frame_params, workers)
+    await run_scheduled(
+        user.pk, prediction.seconds, _render_animation,
+        art_piece, filename, frame_params, options, workers,
+        weight=user_weight(user), peak_bytes=prediction.peak_bytes
+    )
+    
+    return file_response(
+        art_piece.export_animation.name,
+        as_attachment=True,
+        filename=filename,
+        content_type=content_type
+    )
+
+
+def _render_animation(art_piece, filename, frame_params, options, workers=1):
+    """Encode the animation into the art piece's export_animation field."""
+    from PIL import Image
+    with Image.open(art_piece.original_image.path) as img:
+        save_stream(art_piece.export_animation, filename, lambda fp: engine.render_animation(
+            img, frame_params, fp, options['format_type'], duration=options['duration'],
+            workers=workers
+        ))
@@ -2,20 +2,15 @@
 Public views - Home and public gallery.
 """
 from django.shortcuts import render
-from ..models import AestheticRecipe, ArtPiece
+from ..models import ArtPiece
+from ..services.cache import popular_recipes_fragment, recent_art_fragment
 
 
 def home(request):
     """Landing page with recent art and popular recipes."""
-    recent_art = ArtPiece.objects.filter(
-        is_public=True, 
-        processed_image__isnull=False
-    )[:6]
-    popular_recipes = AestheticRecipe.objects.filter(is_public=True)[:5]
-    
     return render(request, 'editor/home.html', {
-        'recent_art': recent_art,
-        'popular_recipes': popular_recipes,
+        'recent_art_html': recent_art_fragment(),
+        'popular_recipes_html': popular_recipes_fragment(),
     })
 
 
@@ -4,13 +4,14 @@ Recipe views - Create, list, and save recipes.
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from ..models import AestheticRecipe, ArtPiece
+from ..models import ArtPiece
 from ..forms import RecipeForm
+from ..services.cache import public_recipes
 
 
 def recipes_list(request):
     """Public recipes listing."""
-    recipes = AestheticRecipe.objects.filter(is_public=True)
+    recipes = public_recipes()
     return render(request, 'editor/recipes.html', {'recipes': recipes})
 
 
@@ -49,8 +50,11 @@ def save_as_recipe(request, art_id):
             'threshold_low': params['threshold_low'],
             'threshold_high': params['threshold_high'],
             'sort_direction': params['sort_direction'],
-            'sort_by': params['sort_by'],
+            'sort_by': params['sort_by'][0],
+            'then_by': params['sort_by'][1:],
             'reverse_sort': params['reverse_sort'],
+            'interval_mode': params.get('interval_mode', 'threshold'),
+            'edge_threshold': params.get('edge_threshold', 0.25),
         }
         form = RecipeForm(initial=initial_data)
     
@@ -9,3 +9,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lumina_sort.settings')
 
 application = get_asgi_application()
+
+# Render hosts warm the engine up here; under gunicorn --preload this runs
+# once in the master and the forked workers inherit the result
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, 'LUMINA_WARM_UP', False):
+    from editor.startup import warm_up
+    warm_up()
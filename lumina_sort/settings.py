@@ -96,6 +96,105 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Media is stored content-addressed: identical files are written once
+STORAGES = {
+    'default': {
+        'BACKEND': 'editor.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Unreferenced media younger than this is left for the next gc_media run
+LUMINA_MEDIA_GRACE_SECONDS = 300
+
+# Media delivery - None streams files from Django; 'x-accel-redirect' (nginx)
+# or 'x-sendfile' (Apache, lighttpd) lets the front proxy send them
+LUMINA_MEDIA_OFFLOAD = os.environ.get('LUMINA_MEDIA_OFFLOAD') or None
+LUMINA_MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Cache - file based, so signal invalidation reaches every worker on the host
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'django',
+    }
+}
+
+# Seconds cached listings may show stale usage counts
+LUMINA_LISTING_CACHE_TIMEOUT = 300
+
+# JSON feed page sizes (?limit=)
+LUMINA_API_PAGE_SIZE = 20
+LUMINA_API_MAX_PAGE_SIZE = 100
+
+# Render pool - threads that run the renders the scheduler admits
+LUMINA_RENDER_WORKERS = int(os.environ.get('LUMINA_RENDER_WORKERS', os.cpu_count() or 1))
+# Task pool - threads for the other off-loop work (predictions, export
+# encoding, bulk ingestion); None uses half the render pool
+LUMINA_TASK_WORKERS = int(os.environ.get('LUMINA_TASK_WORKERS', 0)) or None
+
+# Bulk upload limits
+LUMINA_BULK_MAX_FILES = 500
+LUMINA_BULK_MAX_ENTRY_BYTES = 100 * 1024 * 1024
+DATA_UPLOAD_MAX_NUMBER_FILES = LUMINA_BULK_MAX_FILES
+
+# Per-user render budgets (costs are predicted render seconds)
+LUMINA_USER_MAX_RENDERS = 2
+LUMINA_USER_RENDER_SECONDS_PER_MINUTE = 120
+LUMINA_USER_MAX_QUEUED = LUMINA_BULK_MAX_FILES
+LUMINA_STAFF_RENDER_WEIGHT = 2.0
+
+# Render cost model fitted by `manage.py calibrate_engine`, and the
+# predicted time and memory above which a single render is refused
+LUMINA_COST_MODEL = BASE_DIR / 'cost_model.json'
+LUMINA_RENDER_MAX_SECONDS = None
+LUMINA_RENDER_MAX_BYTES = None
+
+# Memory one worker process may use. Each render picks the fastest strategy
+# whose estimated peak fits what is left of it (None: no limit)
+LUMINA_RENDER_MEMORY_BUDGET = int(os.environ.get('LUMINA_RENDER_MEMORY_BUDGET', 0)) or None
+# Threads a render may sort parallel strips with (1 turns strips off)
+LUMINA_RENDER_STRIPS = int(os.environ.get('LUMINA_RENDER_STRIPS', 1))
+# Frames of an animated export sorted side by side; only used with an engine
+# backend that releases the GIL (numba), otherwise frames render one by one
+LUMINA_ANIMATION_WORKERS = int(os.environ.get('LUMINA_ANIMATION_WORKERS', 2))
+# How the logged peak of each render is measured: 'rss' or 'tracemalloc' (exact, slower)
+LUMINA_RENDER_MEMORY_METER = 'rss'
+
+# Renders an admin re-render job keeps in flight (None: half the render pool)
+LUMINA_RERENDER_CONCURRENCY = None
+# Fair-share weight of the scheduler account all re-render jobs share
+LUMINA_RERENDER_WEIGHT = 0.5
+
+# Seconds a finished render stays reusable for the same original and settings
+# (unreferenced renders are garbage after the media grace period anyway)
+LUMINA_RENDER_CACHE_TIMEOUT = LUMINA_MEDIA_GRACE_SECONDS
+
+# Speculative renders of the most used public recipes right after upload:
+# how many recipes (0 turns it off), whether to render them at full size
+# as well as on a small proxy, and the CPU seconds one upload may use
+LUMINA_SPECULATIVE_RECIPES = 3
+LUMINA_SPECULATIVE_FULL_RESOLUTION = True
+LUMINA_SPECULATIVE_CPU_SECONDS = 30.0
+
+# Edge-mode gradient planes of originals, kept as .npy files between renders
+LUMINA_GRADIENT_ROOT = BASE_DIR / 'cache' / 'gradients'
+
+# Deep-zoom tile pyramids of renders, built as the result viewer asks for them
+LUMINA_TILE_ROOT = BASE_DIR / 'cache' / 'tiles'
+
+# Modules imported at startup that add sort keys with engine.register_key()
+LUMINA_SORT_KEY_PLUGINS = []
+
+# Warm-up of the render path when the WSGI/ASGI application is loaded:
+# off, the engine is imported by the first render; on, it is imported and
+# run once up front (before forking, with gunicorn --preload), building the
+# lookup tables of LUMINA_WARM_UP_TABLES too (each full table is 32 MB)
+LUMINA_WARM_UP = os.environ.get('LUMINA_WARM_UP', '').lower() in ('1', 'true', 'yes')
+LUMINA_WARM_UP_TABLES = os.environ.get('LUMINA_WARM_UP_TABLES', '')
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
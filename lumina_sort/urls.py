@@ -6,12 +6,14 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from editor.views import serve_media
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path(f'{settings.MEDIA_URL.strip("/")}/<path:path>', serve_media, name='media'),
     path('', include('editor.urls')),
 ]
 
-# Serve media files during development
+# Serve static files during development
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATICFILES_DIRS[0])